@@ -2,11 +2,73 @@ from __future__ import annotations
 
 import json
 import os
+import shutil
 import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+from bergenomap.config import settings
 
 database_file_location = "../data/database.db"
 
 
+def open_connection(db_name: str) -> sqlite3.Connection:
+    """
+    Open a SQLite connection with the per-connection pragmas from `settings` applied.
+    """
+    connection = sqlite3.connect(db_name)
+    # SQLite requires this per-connection; without it, declared FK constraints are not enforced.
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.execute(f"PRAGMA busy_timeout = {int(settings.sqlite_busy_timeout_ms)}")
+    # journal_mode is persistent in the DB file, but setting it again is a cheap no-op.
+    connection.execute(f"PRAGMA journal_mode = {settings.sqlite_journal_mode}")
+    connection.execute(f"PRAGMA synchronous = {settings.sqlite_synchronous}")
+    # Negative cache_size is in KiB rather than pages.
+    connection.execute(f"PRAGMA cache_size = {-int(settings.sqlite_cache_size_kib)}")
+    connection.execute(f"PRAGMA mmap_size = {int(settings.sqlite_mmap_size_bytes)}")
+    return connection
+
+
+class ConnectionPool:
+    """
+    Reuses one SQLite connection per (process, thread, db file).
+
+    Connections are never shared across threads, and a forked worker never reuses
+    a connection opened by its parent.
+    """
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+
+    def acquire(self, db_name: str) -> sqlite3.Connection:
+        pid = os.getpid()
+        if getattr(self._local, "pid", None) != pid:
+            self._local.pid = pid
+            self._local.connections = {}
+
+        connection = self._local.connections.get(db_name)
+        if connection is None:
+            connection = open_connection(db_name)
+            self._local.connections[db_name] = connection
+        return connection
+
+    def release(self, connection: sqlite3.Connection) -> None:
+        # Never hand an open transaction to the next request.
+        if connection.in_transaction:
+            connection.rollback()
+
+    def close_all(self) -> None:
+        if getattr(self._local, "pid", None) != os.getpid():
+            return
+        for connection in self._local.connections.values():
+            connection.close()
+        self._local.connections = {}
+
+
+connection_pool = ConnectionPool()
+
+
 class Database:
     """
     Thin DB handle.
@@ -17,14 +79,65 @@ class Database:
 
     All application DAL behavior (CRUD/query logic) should live in
     `backend/bergenomap/repositories/`.
+
+    With `pooled=True` the connection comes from `connection_pool` and `close()` returns
+    it there instead of closing it. Scripts use the default, unpooled handle.
     """
 
-    def __init__(self, db_name: str = database_file_location):
+    def __init__(self, db_name: str = database_file_location, *, pooled: bool = False):
         self.db_name = db_name
-        self.connection = sqlite3.connect(db_name)
-        # SQLite requires this per-connection; without it, declared FK constraints are not enforced.
-        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.pooled = pooled
+        if pooled:
+            self.connection = connection_pool.acquire(db_name)
+        else:
+            self.connection = open_connection(db_name)
         self.cursor = self.connection.cursor()
+        self._transaction_depth = 0
+
+    def commit(self) -> None:
+        """
+        Commit, unless inside `transaction()`, which commits once when the outermost block ends.
+        Repositories call this rather than `connection.commit()`.
+        """
+        if self._transaction_depth == 0:
+            self.connection.commit()
+
+    @contextmanager
+    def transaction(self) -> Iterator["Database"]:
+        """
+        Unit of work: repository writes inside the block are committed together (one disk sync)
+        when it ends, or rolled back if it raises.
+
+        Blocks nest. An inner block is a savepoint, so an exception caught around it undoes
+        only the inner block's writes.
+        """
+        depth = self._transaction_depth
+        savepoint = f"unit_of_work_{depth}"
+        if depth == 0:
+            if not self.connection.in_transaction:
+                # IMMEDIATE takes the write lock up front, so a batch never fails half-way
+                # on a lock upgrade; busy_timeout covers waiting for it.
+                self.cursor.execute("BEGIN IMMEDIATE")
+        else:
+            self.cursor.execute(f"SAVEPOINT {savepoint}")
+
+        self._transaction_depth = depth + 1
+        try:
+            yield self
+        except BaseException:
+            self._transaction_depth = depth
+            if depth == 0:
+                self.connection.rollback()
+            else:
+                self.cursor.execute(f"ROLLBACK TO {savepoint}")
+                self.cursor.execute(f"RELEASE {savepoint}")
+            raise
+
+        self._transaction_depth = depth
+        if depth == 0:
+            self.connection.commit()
+        else:
+            self.cursor.execute(f"RELEASE {savepoint}")
 
     def create_table(self) -> None:
         # Important: create `users` before tables that reference it via FK.
@@ -54,6 +167,7 @@ class Database:
             map_club TEXT,
             map_course_planner TEXT,
             map_attribution TEXT,
+            registration_transform TEXT NULL,
             FOREIGN KEY (username) REFERENCES users(username) ON DELETE CASCADE
         )
         """
@@ -62,6 +176,8 @@ class Database:
             map_id INTEGER PRIMARY KEY,
             mapfile_original BLOB,
             mapfile_final BLOB,
+            original_sha256 TEXT NULL,
+            final_sha256 TEXT NULL,
             FOREIGN KEY (map_id) REFERENCES maps(map_id) ON DELETE CASCADE
         )
         """
@@ -72,6 +188,10 @@ class Database:
         self.create_stored_points_table()
         self.create_internal_kv_table()
         self.create_strava_tables()
+        self.create_spatial_index_tables()
+        self.create_jobs_table()
+        self.create_track_lods_table()
+        self.create_track_stats_table()
         self.connection.commit()
 
     def create_users_table(self) -> None:
@@ -94,10 +214,15 @@ class Database:
             min_lon REAL,
             max_lat REAL,
             max_lon REAL,
+            track_data BLOB NULL,
+            track_hash TEXT NULL,
             FOREIGN KEY (username) REFERENCES users(username) ON DELETE CASCADE
         )
         """
         self.cursor.execute(create_gps_tracks_sql)
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_gps_tracks_username_hash ON gps_tracks(username, track_hash)"
+        )
         self.create_sessions_table()
 
     def create_internal_kv_table(self) -> None:
@@ -138,6 +263,8 @@ class Database:
             connected_at DATETIME DEFAULT CURRENT_TIMESTAMP,
             updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
             revoked_at DATETIME,
+            sync_watermark INTEGER NULL,
+            last_reconciled_at DATETIME NULL,
             FOREIGN KEY (username) REFERENCES users(username) ON DELETE CASCADE
         )
         """
@@ -158,6 +285,8 @@ class Database:
             on_map_cached BOOLEAN,
             workout_type TEXT,
             description TEXT,
+            track_data BLOB NULL,
+            track_hash TEXT NULL,
             PRIMARY KEY (username, activity_id),
             FOREIGN KEY (username) REFERENCES users(username) ON DELETE CASCADE
         )
@@ -189,6 +318,86 @@ class Database:
             "ON strava_imports(username, last_imported_at)"
         )
 
+    def create_spatial_index_tables(self) -> None:
+        self.cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS maps_rtree USING rtree("
+            "map_id, min_lat, max_lat, min_lon, max_lon)"
+        )
+        self.cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS gps_tracks_rtree USING rtree("
+            "track_id, min_lat, max_lat, min_lon, max_lon)"
+        )
+        self.cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS strava_imports_rtree USING rtree("
+            "id, min_lat, max_lat, min_lon, max_lon, +username TEXT, +activity_id INTEGER)"
+        )
+
+    def create_jobs_table(self) -> None:
+        create_jobs_sql = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            username TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress REAL NOT NULL DEFAULT 0,
+            message TEXT NULL,
+            params TEXT NULL,
+            input_data BLOB NULL,
+            result TEXT NULL,
+            error TEXT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            started_at DATETIME NULL,
+            finished_at DATETIME NULL,
+            FOREIGN KEY (username) REFERENCES users(username) ON DELETE CASCADE
+        )
+        """
+        self.cursor.execute(create_jobs_sql)
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_username_created ON jobs(username, created_at)")
+
+    def create_track_lods_table(self) -> None:
+        create_track_lods_sql = """
+        CREATE TABLE IF NOT EXISTS track_lods (
+            username TEXT NOT NULL,
+            source TEXT NOT NULL,
+            track_id INTEGER NOT NULL,
+            level INTEGER NOT NULL,
+            tolerance_m REAL NOT NULL,
+            point_count INTEGER NOT NULL,
+            track_data BLOB NOT NULL,
+            PRIMARY KEY (username, source, track_id, level),
+            FOREIGN KEY (username) REFERENCES users(username) ON DELETE CASCADE
+        )
+        """
+        self.cursor.execute(create_track_lods_sql)
+
+    def create_track_stats_table(self) -> None:
+        create_track_stats_sql = """
+        CREATE TABLE IF NOT EXISTS track_stats (
+            username TEXT NOT NULL,
+            source TEXT NOT NULL,
+            track_id INTEGER NOT NULL,
+            point_count INTEGER NOT NULL,
+            distance_m REAL NOT NULL,
+            start_time TEXT NULL,
+            elapsed_time_s REAL NULL,
+            moving_time_s REAL NULL,
+            moving_pace_s_per_km REAL NULL,
+            elevation_gain_m REAL NULL,
+            elevation_loss_m REAL NULL,
+            min_elevation_m REAL NULL,
+            max_elevation_m REAL NULL,
+            avg_heart_rate REAL NULL,
+            max_heart_rate REAL NULL,
+            hr_zone_s TEXT NULL,
+            PRIMARY KEY (username, source, track_id),
+            FOREIGN KEY (username) REFERENCES users(username) ON DELETE CASCADE
+        )
+        """
+        self.cursor.execute(create_track_stats_sql)
+
     def create_sessions_table(self) -> None:
         create_sessions_sql = """
         CREATE TABLE IF NOT EXISTS sessions (
@@ -213,7 +422,7 @@ class Database:
         """
         Convenience wrapper used by admin tooling.
         """
-        from bergenomap.repositories import map_files_repo, maps_repo
+        from bergenomap.repositories import blob_store, map_files_repo, maps_repo
 
         # Ensure the output directories exist
         os.makedirs(js_output_dir, exist_ok=True)
@@ -248,21 +457,19 @@ class Database:
 
             map_id = int(map_entry["map_id"])
 
-            final_image_blob = map_files_repo.get_final_by_id(self, map_id)
+            final_image_digest = map_files_repo.get_final_digest(self, map_id)
             final_image_filename = os.path.join(final_maps_output_dir, map_entry["map_filename"])
-            if (final_image_blob is not None) and (overwrite or not os.path.exists(final_image_filename)):
-                with open(final_image_filename, "wb") as f:
-                    f.write(final_image_blob)
+            if (final_image_digest is not None) and (overwrite or not os.path.exists(final_image_filename)):
+                shutil.copyfile(blob_store.blob_path(final_image_digest), final_image_filename)
 
             if include_original:
-                original_image_blob = map_files_repo.get_original_by_id(self, map_id)
-                if original_image_blob:
+                original_image_digest = map_files_repo.get_original_digest(self, map_id)
+                if original_image_digest:
                     original_image_filename = os.path.join(
                         original_maps_output_dir, f"Original_{map_entry['map_filename']}"
                     )
                     if overwrite or not os.path.exists(original_image_filename):
-                        with open(original_image_filename, "wb") as f:
-                            f.write(original_image_blob)
+                        shutil.copyfile(blob_store.blob_path(original_image_digest), original_image_filename)
 
         map_definitions_js = "const mapDefinitions = " + json.dumps(
             map_definitions, indent=2, ensure_ascii=False
@@ -272,6 +479,10 @@ class Database:
             f.write(map_definitions_js)
 
     def close(self) -> None:
-        self.connection.close()
+        self.cursor.close()
+        if self.pooled:
+            connection_pool.release(self.connection)
+        else:
+            self.connection.close()
 
  
\ No newline at end of file
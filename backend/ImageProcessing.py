@@ -1,6 +1,7 @@
 import fitz  # PyMuPDF
 from PIL import Image
 import math
+import numpy as np
 
 floyen_a_pdf = "../maps/pdf/floyen-23-6-24/LoypeA.pdf"
 floyen_b_pdf = "../maps/pdf/floyen-23-6-24/LoypeB.pdf"
@@ -44,52 +45,115 @@ def convert_png_to_webp(png_file_path, output_file_path, quality=70):
 
 
 
-"""Input two images of identical dimensions and map content, output image containing
-   only the pixels that are identical in both or all input images."""
-def merge_orienteering_maps(output_path, image1_path, image2_path, image3_path=None):
-    # Open the images
-    image1 = Image.open(image1_path)
-    image2 = Image.open(image2_path)
+MERGE_RULE_IDENTICAL = "identical"
+MERGE_RULE_FURTHEST_FROM_MAGENTA = "furthest_from_magenta"
+MERGE_RULE_MAJORITY = "majority"
 
-    if image3_path is not None:
-        image3 = Image.open(image3_path)
+# Paper color used for pixels that disagree between inputs under the "identical" rule.
+merge_fill_color = (255, 255, 255)
 
+# Colors within this distance of control_symbol_magenta count as course overprint (incl. anti-aliasing)
+# and get no vote under the "majority" rule.
+overprint_max_distance = 80
+
+
+"""Input two or more images of identical dimensions and map content (typically course variants A/B/C/...
+   of the same event), output a clean base map with the course overprints removed.
+
+   Rules:
+   - "identical": keep only the pixels that are identical in all inputs; the rest become paper white.
+   - "furthest_from_magenta": per pixel, keep the input color furthest from the control symbol magenta.
+   - "majority": per pixel, keep the most common input color among those that are not course overprint
+     (see overprint_max_distance); ties, and pixels that are overprint in every input, go to the color
+     furthest from magenta. Unlike "furthest_from_magenta", a stray color in one input (scan noise,
+     a differently placed label) is outvoted by the others.
+
+   Defaults to "furthest_from_magenta", which removes course lines even where several variants share them."""
+def merge_orienteering_maps(output_path, *image_paths, rule=MERGE_RULE_FURTHEST_FROM_MAGENTA):
+    if len(image_paths) < 2:
+        raise ValueError("Need at least two images to merge")
+
+    images = []
+    for path in image_paths:
+        with Image.open(path) as image:
+            images.append(np.asarray(image.convert("RGBA")))
+
+    merged = merge_orienteering_map_arrays(images, rule=rule)
+
+    # Save the resulting image
+    Image.fromarray(merged, "RGB").save(output_path)
+
+
+"""Array version of merge_orienteering_maps. Takes a sequence of (height, width, 3) RGB or (height, width, 4)
+   RGBA uint8 arrays and returns the merged (height, width, 3) uint8 array.
+
+   Each pixel is packed into a single uint32 so all inputs are compared in one vectorized pass. Course
+   variants agree on almost every pixel, so the per-pixel rules only run on the pixels that differ."""
+def merge_orienteering_map_arrays(images, rule=MERGE_RULE_FURTHEST_FROM_MAGENTA):
+    if rule not in (MERGE_RULE_IDENTICAL, MERGE_RULE_FURTHEST_FROM_MAGENTA, MERGE_RULE_MAJORITY):
+        raise ValueError(f"Unknown merge rule: {rule}")
+
+    arrays = [np.asarray(image, dtype=np.uint8) for image in images]
+    if len(arrays) < 2:
+        raise ValueError("Need at least two images to merge")
     # Ensure the images are of the same size
-    if image1.size != image2.size:
+    if any(array.shape[:2] != arrays[0].shape[:2] for array in arrays):
         raise ValueError("Images must have the same dimensions")
 
-    if image3_path is not None and image1.size != image3.size:
-        raise ValueError("Images must have the same dimensions")
+    packed = np.stack([_pack_rgb(array) for array in arrays])  # (n, h, w) uint32
+    num_images, height, width = packed.shape
+
+    first = packed[0]
+    disagree = np.zeros((height, width), dtype=bool)
+    for other in packed[1:]:
+        disagree |= other != first
+
+    merged = first.copy()
+    disagree_idx = np.flatnonzero(disagree)
 
-    # Load the pixel data
-    pixels1 = image1.load()
-    pixels2 = image2.load()
-
-    if image3_path is not None:
-        pixels3 = image3.load()
-
-    # Create a new image for the output
-    output_image = Image.new("RGB", image1.size)
-    output_pixels = output_image.load()
-
-    # Process each pixel
-    if image3_path == None:
-        # Compare two images; take furthest color from magenta if pixel values disagree
-        for y in range(image1.size[1]):
-            for x in range(image1.size[0]):
-                if pixels1[x, y] == pixels2[x, y]:
-                    output_pixels[x, y] = pixels1[x, y]
-                else:
-                    output_pixels[x, y] = furthest_color_from_magenta(pixels1[x, y], pixels2[x,y])
+    if rule == MERGE_RULE_IDENTICAL:
+        merged.reshape(-1)[disagree_idx] = _pack_rgb(np.array([[merge_fill_color]], dtype=np.uint8))[0, 0]
+        return _unpack_rgb(merged)
+
+    candidates = packed.reshape(num_images, -1)[:, disagree_idx]  # (n, k)
+    distance_sq = _squared_distance_from_magenta(candidates)
+
+    if rule == MERGE_RULE_FURTHEST_FROM_MAGENTA:
+        choice = np.argmax(distance_sq, axis=0)
     else:
-        # TODO: This does not work; there are magenta lines that are common. Need different rule to select the non-magenta one.
-        for y in range(image1.size[1]):
-            for x in range(image1.size[0]):
-                # This takes 30 seconds, but gives a reasonable result.
-                output_pixels[x, y] = furthest_color_from_magenta(pixels1[x, y], pixels2[x, y], pixels3[x, y])
+        # Overprint colors neither vote nor get votes, so a course line shared by most inputs still goes.
+        paper = distance_sq > overprint_max_distance ** 2
+        votes = np.zeros(candidates.shape, dtype=np.int32)
+        for i in range(num_images):
+            votes[i] = np.count_nonzero((candidates == candidates[i]) & paper, axis=0) * paper[i]
+        # Squared distances fit in 18 bits, so votes dominate and distance only breaks ties.
+        choice = np.argmax((votes << 18) | distance_sq, axis=0)
 
-    # Save the resulting image
-    output_image.save(output_path)
+    merged.reshape(-1)[disagree_idx] = candidates[choice, np.arange(candidates.shape[1])]
+    return _unpack_rgb(merged)
+
+
+def _pack_rgb(array):
+    """(h, w, 3|4) uint8 -> (h, w) uint32, one RGBA pixel per element."""
+    if array.ndim != 3 or array.shape[-1] not in (3, 4):
+        raise ValueError("Images must be RGB or RGBA arrays of shape (height, width, channels)")
+    if array.shape[-1] == 4:
+        # Already one pixel per 4 bytes; reinterpret without copying.
+        return np.ascontiguousarray(array).view(np.uint32)[..., 0]
+    rgba = np.empty(array.shape[:2] + (4,), dtype=np.uint8)
+    rgba[..., :3] = array[..., :3]
+    rgba[..., 3] = 255
+    return rgba.view(np.uint32)[..., 0]
+
+
+def _unpack_rgb(packed):
+    return np.ascontiguousarray(packed.view(np.uint8).reshape(packed.shape + (4,))[..., :3])
+
+
+def _squared_distance_from_magenta(packed):
+    channels = np.ascontiguousarray(packed).view(np.uint8).reshape(packed.shape + (4,))
+    diff = channels[..., :3].astype(np.int32) - np.array(control_symbol_magenta, dtype=np.int32)
+    return np.einsum("...c,...c->...", diff, diff)
 
 
 
@@ -141,7 +205,7 @@ def most_common_color(color1, color2, color3):
 
 
 # Example usage
-#merge_orienteering_maps(output_folder + 'output_image.png', floyen_a_png, floyen_b_png, floyen_c_png)
+#merge_orienteering_maps(output_folder + 'output_image.png', floyen_a_png, floyen_b_png, floyen_c_png, rule=MERGE_RULE_MAJORITY)
 #merge_orienteering_maps(output_folder + 'output_image.png', munkebotn_a_png, munkebotn_b_png)
 
 
@@ -1,5 +1,6 @@
 import numpy as np
 import math
+import itertools
 from scipy.optimize import minimize_scalar
 
 """Given three sets of pixel coordinates on an orienteering map overlay
@@ -54,6 +55,121 @@ def getOverlayCoordinatesWithOptimalRotation(image_coords, real_coords, overlayW
 
     return result
 
+"""Like getOverlayCoordinatesWithOptimalRotation, but for any number (n >= 3) of control points,
+   some of which may be mis-clicked.
+
+   Runs an MSAC (RANSAC with truncated squared loss) consensus search over every 2-point similarity
+   hypothesis, evaluated as one batched NumPy computation, then refits on the consensus set and
+   registers the overlay from the inliers only.
+
+   Adds per-point diagnostics in meters to the result:
+   - inliers: whether each control point was used for the final fit
+   - residuals_m: distance between each point and its position predicted by the final fit
+   - loo_errors_m: leave-one-out error; the distance to the point's position predicted by a fit
+     on all other inliers (for outliers, the same as the residual)
+"""
+def getOverlayCoordinatesRobust(image_coords, real_coords, overlayWidth, overlayHeight,
+                                inlier_threshold_m=10.0, max_hypotheses=5000):
+    pixel_points = np.asarray(image_coords, dtype=float)
+    geo_points = np.asarray(real_coords, dtype=float)
+    num_points = pixel_points.shape[0]
+    if num_points < 3 or geo_points.shape[0] != num_points:
+        raise ValueError("Need at least 3 matching pixel and geo points")
+
+    s, r = _control_points_as_complex(overlayWidth, overlayHeight, pixel_points, geo_points)
+
+    # 1. Every pair of points defines a similarity transform; score all of them at once.
+    pairs = np.array(list(itertools.combinations(range(num_points), 2)))
+    if len(pairs) > max_hypotheses:
+        rng = np.random.default_rng(0)
+        pairs = pairs[rng.choice(len(pairs), size=max_hypotheses, replace=False)]
+    masks = np.zeros((len(pairs), num_points), dtype=bool)
+    masks[np.arange(len(pairs))[:, None], pairs] = True
+
+    residuals = _similarity_residuals_batch(s, r, masks)
+    threshold_sq = inlier_threshold_m ** 2
+    costs = np.minimum(residuals ** 2, threshold_sq).sum(axis=1)
+    best = int(np.argmin(costs))
+    inliers = residuals[best] < inlier_threshold_m
+
+    # 2. Refit on the consensus set, then re-select inliers against the refined fit.
+    for _ in range(2):
+        if inliers.sum() < 3:
+            raise ValueError("Fewer than 3 control points agree with each other; check for mis-placed points")
+        refit_residuals = _similarity_residuals_batch(s, r, inliers[np.newaxis, :])[0]
+        refined = refit_residuals < inlier_threshold_m
+        if refined.sum() < 3 or np.array_equal(refined, inliers):
+            break
+        inliers = refined
+
+    residuals_m = _similarity_residuals_batch(s, r, inliers[np.newaxis, :])[0]
+
+    # 3. Leave-one-out: one fit per inlier with that inlier masked out, in a single batch.
+    inlier_idx = np.flatnonzero(inliers)
+    loo_masks = np.repeat(inliers[np.newaxis, :], len(inlier_idx), axis=0)
+    loo_masks[np.arange(len(inlier_idx)), inlier_idx] = False
+    loo_residuals = _similarity_residuals_batch(s, r, loo_masks)
+    loo_errors_m = residuals_m.copy()
+    loo_errors_m[inlier_idx] = loo_residuals[np.arange(len(inlier_idx)), inlier_idx]
+
+    inlier_image_coords = [image_coords[i] for i in inlier_idx]
+    inlier_real_coords = [real_coords[i] for i in inlier_idx]
+    result = getOverlayCoordinatesWithOptimalRotation(
+        inlier_image_coords, inlier_real_coords, overlayWidth, overlayHeight
+    )
+
+    result["selected_pixel_coords"] = image_coords
+    result["selected_realworld_coords"] = real_coords
+    result["inliers"] = [bool(v) for v in inliers]
+    result["outlier_indices"] = [int(i) for i in np.flatnonzero(~inliers)]
+    result["residuals_m"] = [float(v) for v in residuals_m]
+    result["loo_errors_m"] = [float(v) for v in loo_errors_m]
+    result["rms_error_m"] = float(np.sqrt(np.mean(residuals_m[inliers] ** 2)))
+    result["loo_rms_error_m"] = float(np.sqrt(np.mean(loo_errors_m[inliers] ** 2)))
+    result["inlier_threshold_m"] = float(inlier_threshold_m)
+    return result
+
+
+"""Pixel points -> centered, y-up coordinates and lat/lon -> local equirectangular meters around the
+   mean, both as complex numbers (x + iy). Same frames as compute_procrustes_registration."""
+def _control_points_as_complex(width, height, pixel_points, geo_points):
+    W, H = float(width), float(height)
+    s = (pixel_points[:, 0] - W / 2.0) + 1j * (H / 2.0 - pixel_points[:, 1])
+
+    lats = geo_points[:, 0]
+    lons = geo_points[:, 1]
+    lat0 = float(np.mean(lats))
+    lon0 = float(np.mean(lons))
+    R_earth = 6371000.0
+    x = np.radians(lons - lon0) * math.cos(math.radians(lat0)) * R_earth
+    y = np.radians(lats - lat0) * R_earth
+    return s, x + 1j * y
+
+
+"""Least-squares similarity fit r ≈ a * s + t for many subsets of the control points at once.
+
+   In 2D, a similarity (rotation + uniform scale + translation, no reflection) is multiplication by one
+   complex number a plus an offset t, so the Procrustes solution has a closed form per subset.
+
+   masks: (m, n) boolean, row k selects the points used for fit k.
+   Returns (m, n) distances in meters from every point to its predicted position under each fit.
+   Degenerate subsets (all selected pixels coincide) get infinite residuals."""
+def _similarity_residuals_batch(s, r, masks):
+    weights = masks.astype(float)
+    counts = weights.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mu_s = (weights @ s) / counts
+        mu_r = (weights @ r) / counts
+        ds = s[np.newaxis, :] - mu_s[:, np.newaxis]
+        dr = r[np.newaxis, :] - mu_r[:, np.newaxis]
+        numerator = (weights * dr * np.conj(ds)).sum(axis=1)
+        denominator = (weights * np.abs(ds) ** 2).sum(axis=1)
+        a = numerator / denominator
+        t = mu_r - a * mu_s
+        residuals = np.abs(a[:, np.newaxis] * s[np.newaxis, :] + t[:, np.newaxis] - r[np.newaxis, :])
+    return np.where(np.isfinite(residuals), residuals, np.inf)
+
+
 """Given three sets of pixel coordinates on an orienteering map overlay
    [(x1, y1), (x2, y2), (x3, y3)]
 
@@ -72,13 +188,14 @@ def getOverlayCoordinatesWithOptimalRotation(image_coords, real_coords, overlayW
 """
 def rotateAndRegisterOverlay(image_coords, real_coords, angle_degrees, overlayWidth, overlayHeight):
     # 1. Rotate control points
-    pointsAfterRotating = rotate_points(image_coords, overlayWidth, overlayHeight, angle_degrees)
+    pointsAfterRotating = rotate_points_array(image_coords, overlayWidth, overlayHeight, angle_degrees)
 
     # Extract arrays for LS fit
-    xs = np.array([p[0] for p in pointsAfterRotating], dtype=float)
-    ys = np.array([p[1] for p in pointsAfterRotating], dtype=float)
-    lats = np.array([p[0] for p in real_coords], dtype=float)
-    lons = np.array([p[1] for p in real_coords], dtype=float)
+    xs = pointsAfterRotating[:, 0]
+    ys = pointsAfterRotating[:, 1]
+    real = np.asarray(real_coords, dtype=float).reshape(-1, 2)
+    lats = real[:, 0]
+    lons = real[:, 1]
 
     # Convert geo points to local tangent-plane meters to keep isotropic scale meaningful
     lat0 = float(lats.mean())
@@ -132,15 +249,12 @@ def rotateAndRegisterOverlay(image_coords, real_coords, angle_degrees, overlayWi
 
     # 5. Compute error: how well do we hit the three control points?
     #    (using squared Euclidean in lat/lon space)
-    errors_sq = []
-    for xi, yi, (lat_true, lon_true) in zip(xs, ys, real_coords):
-        lat_pred = lat_nw + yi * scale_lat
-        lon_pred = lon_nw + xi * scale_lon
-        err = euclidean_distance((lat_pred, lon_pred), (lat_true, lon_true))
-        errors_sq.append(err ** 2)
+    lats_pred = lat_nw + ys * scale_lat
+    lons_pred = lon_nw + xs * scale_lon
+    errors_sq = (lats_pred - lats) ** 2 + (lons_pred - lons) ** 2
 
     # Mean squared error
-    error = sum(errors_sq) / len(errors_sq)
+    error = float(errors_sq.mean())
 
     result = {"nw_coords": nw, "se_coords": se, "error": error}
     return result
@@ -150,15 +264,15 @@ def rotateAndRegisterOverlay(image_coords, real_coords, angle_degrees, overlayWi
 Rotate points about the center of the image.
 
 Parameters:
-- points: list of tuples, each containing the (x, y) coordinates of a point.
+- points: list of tuples (or an (n, 2) array), each containing the (x, y) coordinates of a point.
 - width: int, width of the image.
 - height: int, height of the image.
 - angle_degrees: float, angle in degrees to rotate the points.
 
 Returns:
-- rotated_points: list of tuples, each containing the rotated (x, y) coordinates of a point.
+- rotated_points: (n, 2) array of the rotated (x, y) coordinates.
 """
-def rotate_points(points, width, height, angle_degrees):
+def rotate_points_array(points, width, height, angle_degrees):
 
     angle_degrees *= -1 # Rotate counter-clockwise
 
@@ -166,8 +280,7 @@ def rotate_points(points, width, height, angle_degrees):
     angle_radians = np.radians(angle_degrees)
     
     # Calculate the center of the image
-    cx = width / 2
-    cy = height / 2
+    center = np.array([width / 2, height / 2], dtype=float)
     
     # Create rotation matrix
     rotation_matrix = np.array([
@@ -175,22 +288,20 @@ def rotate_points(points, width, height, angle_degrees):
         [np.sin(angle_radians),  np.cos(angle_radians)]
     ])
     
-    rotated_points = []
-    for (x, y) in points:
-        # Translate point to origin (center of image)
-        translated_x = x - cx
-        translated_y = y - cy
-        
-        # Rotate point
-        rotated_x, rotated_y = rotation_matrix.dot([translated_x, translated_y])
-        
-        # Translate point back to its original position
-        new_x = rotated_x + cx
-        new_y = rotated_y + cy
-        
-        rotated_points.append((new_x, new_y))
-    
-    return rotated_points
+    # Translate points to origin (center of image), rotate them all at once (row vectors,
+    # hence the transpose) and translate back
+    translated = np.asarray(points, dtype=float).reshape(-1, 2) - center
+    return translated @ rotation_matrix.T + center
+
+
+"""
+Rotate points about the center of the image.
+
+Same as rotate_points_array, returning a list of (x, y) tuples.
+"""
+def rotate_points(points, width, height, angle_degrees):
+    rotated = rotate_points_array(points, width, height, angle_degrees)
+    return [(float(x), float(y)) for x, y in rotated]
 
 
 """Given two sets of pixel coordinates on an orienteering map overlay
@@ -305,6 +416,10 @@ def compute_procrustes_registration(width, height, pixel_points, geo_points):
       se: (lat_deg, lon_deg) of south-east corner of rotated image
       scale: meters per pixel-unit in centered coordinates
       rms_deg_error: RMS error between fitted and input control lat/lon
+      origin: (lat0, lon0) of the local equirectangular meter frame used for the fit
+      rotation_matrix, translation_m: the fit r = scale * rotation_matrix @ s + translation_m,
+        with s in centered y-up pixels and r in local (east, north) meters
+      rms_error_m: RMS error between fitted and input control points, in meters
     """
     W, H = float(width), float(height)
     pixel_points = np.asarray(pixel_points, dtype=float)
@@ -388,6 +503,7 @@ def compute_procrustes_registration(width, height, pixel_points, geo_points):
     )
     residuals = np.sqrt((lat_est - lats) ** 2 + (lon_est - lons) ** 2)
     rms_deg_error = float(np.sqrt(np.mean(residuals ** 2)))
+    rms_error_m = float(np.sqrt(np.mean(np.sum((r_est - r_pts) ** 2, axis=1))))
 
     return {
         "optimal_rotation_angle": theta_deg,
@@ -395,6 +511,10 @@ def compute_procrustes_registration(width, height, pixel_points, geo_points):
         "se_coords": (lat_SE, lon_SE),
         "scale": scale,
         "rms_deg_error": rms_deg_error,
+        "origin": (lat0, lon0),
+        "rotation_matrix": R_mat.tolist(),
+        "translation_m": t_vec.tolist(),
+        "rms_error_m": rms_error_m,
     }
 
 
@@ -420,13 +540,14 @@ def compute_procrustes_registration(width, height, pixel_points, geo_points):
 """
 def rotateAndRegisterOverlay_old(image_coords, real_coords, angle_degrees, overlayWidth, overlayHeight):
     # 1. Rotate control points
-    pointsAfterRotating = rotate_points(image_coords, overlayWidth, overlayHeight, angle_degrees)
+    pointsAfterRotating = rotate_points_array(image_coords, overlayWidth, overlayHeight, angle_degrees)
 
     # Extract arrays for LS fit
-    xs = np.array([p[0] for p in pointsAfterRotating], dtype=float)
-    ys = np.array([p[1] for p in pointsAfterRotating], dtype=float)
-    lats = np.array([p[0] for p in real_coords], dtype=float)
-    lons = np.array([p[1] for p in real_coords], dtype=float)
+    xs = pointsAfterRotating[:, 0]
+    ys = pointsAfterRotating[:, 1]
+    real = np.asarray(real_coords, dtype=float).reshape(-1, 2)
+    lats = real[:, 0]
+    lons = real[:, 1]
 
     # 2. Fit lat = a + b * y  (a = lat_nw, b = scale_lat)
     y_mean = ys.mean()
@@ -457,15 +578,12 @@ def rotateAndRegisterOverlay_old(image_coords, real_coords, angle_degrees, overl
 
     # 5. Compute error: how well do we hit the three control points?
     #    (using squared Euclidean in lat/lon space)
-    errors_sq = []
-    for xi, yi, (lat_true, lon_true) in zip(xs, ys, real_coords):
-        lat_pred = lat_nw + yi * scale_lat
-        lon_pred = lon_nw + xi * scale_lon
-        err = euclidean_distance((lat_pred, lon_pred), (lat_true, lon_true))
-        errors_sq.append(err ** 2)
+    lats_pred = lat_nw + ys * scale_lat
+    lons_pred = lon_nw + xs * scale_lon
+    errors_sq = (lats_pred - lats) ** 2 + (lons_pred - lons) ** 2
 
     # Mean squared error
-    error = sum(errors_sq) / len(errors_sq)
+    error = float(errors_sq.mean())
 
     result = {"nw_coords": nw, "se_coords": se, "error": error}
     return result
\ No newline at end of file
@@ -6,8 +6,12 @@ from flask import Blueprint, abort, g, jsonify, render_template_string, request
 
 from bergenomap.api.common import is_local_request
 from bergenomap.config import settings
+from bergenomap.integrations.strava_client import strava_http_stats
+from bergenomap.integrations.strava_rate_limit import strava_rate_limiter
 from bergenomap.repositories.db import get_db
 from bergenomap.repositories import maps_repo
+from bergenomap.services.session_service import session_cache
+from bergenomap.services.track_service import track_payload_cache
 
 
 bp = Blueprint("admin", __name__)
@@ -52,6 +56,30 @@ def export_database():
         return jsonify({"error": str(e)}), 500
 
 
+@bp.route("/api/dal/session_cache_stats", methods=["GET"])
+def session_cache_stats():
+    if not is_local_request():
+        abort(404)
+
+    return jsonify(session_cache.stats()), 200
+
+
+@bp.route("/api/dal/track_cache_stats", methods=["GET"])
+def track_cache_stats():
+    if not is_local_request():
+        abort(404)
+
+    return jsonify(track_payload_cache.stats()), 200
+
+
+@bp.route("/api/dal/strava_client_stats", methods=["GET"])
+def strava_client_stats():
+    if not is_local_request():
+        abort(404)
+
+    return jsonify({"endpoints": strava_http_stats.snapshot(), "rate_limit": strava_rate_limiter.snapshot()}), 200
+
+
 # Database visualization
 # To view, query http://127.0.0.1:5000/viewDatabase
 @bp.route("/api/viewDatabase")
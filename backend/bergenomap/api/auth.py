@@ -6,7 +6,8 @@ from datetime import datetime, timedelta
 from flask import Blueprint, g, jsonify, request
 
 from bergenomap.repositories.db import get_db
-from bergenomap.repositories import sessions_repo, users_repo
+from bergenomap.repositories import users_repo
+from bergenomap.services import session_service
 from bergenomap.utils.password import hash_password, verify_password
 
 
@@ -35,8 +36,10 @@ def check_authentication():
     if not session_key:
         return jsonify({"error": "Unauthorized"}), 401
 
+    session_service.ensure_sweeper_started()
+
     db = get_db()
-    session = sessions_repo.validate_session(db, session_key)
+    session = session_service.get_valid_session(db, session_key)
     if not session:
         return jsonify({"error": "Unauthorized"}), 401
     g.username = session.get("username")
@@ -72,7 +75,7 @@ def login():
     session_key = str(uuid.uuid4())
     expires_at = datetime.now() + timedelta(days=365)
 
-    sessions_repo.create_session(db, username, session_key, expires_at)
+    session_service.create_session(db, username, session_key, expires_at)
 
     response = jsonify({"message": "Login successful", "username": username})
     response.set_cookie(
@@ -111,7 +114,7 @@ def register():
 
     session_key = str(uuid.uuid4())
     expires_at = datetime.now() + timedelta(days=365)
-    sessions_repo.create_session(db, username, session_key, expires_at)
+    session_service.create_session(db, username, session_key, expires_at)
 
     response = jsonify({"message": "Registered", "username": username})
     response.set_cookie(
@@ -132,7 +135,7 @@ def logout():
     session_key = request.cookies.get("session_key")
     if session_key:
         db = get_db()
-        sessions_repo.deactivate_session(db, session_key)
+        session_service.deactivate_session(db, session_key)
 
     response = jsonify({"message": "Logged out"})
     # Clear cookie for browser clients.
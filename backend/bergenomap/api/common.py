@@ -1,6 +1,18 @@
 from __future__ import annotations
 
-from flask import request
+import hashlib
+import json
+import math
+
+from flask import Response, request, send_file
+from werkzeug.wsgi import FileWrapper
+
+from Database import Database
+from bergenomap.config import settings
+from bergenomap.repositories import sqlite_blob, strava_repo
+from bergenomap.services import track_service
+from bergenomap.services.track_service import TrackPayload
+from bergenomap.utils.track_codec import WIRE_FORMAT_POINTS, WIRE_FORMATS
 
 
 def is_local_request() -> bool:
@@ -8,3 +20,156 @@ def is_local_request() -> bool:
     return request.remote_addr in ["127.0.0.1", "localhost"]
 
 
+
+
+BBOX_ARGS = ("min_lat", "min_lon", "max_lat", "max_lon")
+
+
+def parse_bbox_args() -> dict | None:
+    """
+    Optional bounding box from query args min_lat/min_lon/max_lat/max_lon.
+    Returns None when none are given; raises ValueError when incomplete or invalid.
+    """
+    present = [name for name in BBOX_ARGS if request.args.get(name) is not None]
+    if not present:
+        return None
+    if len(present) != len(BBOX_ARGS):
+        raise ValueError("Bounding box requires min_lat, min_lon, max_lat and max_lon")
+    try:
+        bbox = {name: float(request.args[name]) for name in BBOX_ARGS}
+    except ValueError:
+        raise ValueError("Bounding box values must be numbers")
+    if bbox["min_lat"] > bbox["max_lat"] or bbox["min_lon"] > bbox["max_lon"]:
+        raise ValueError("Bounding box minimum exceeds maximum")
+    return bbox
+
+
+def parse_lod_args() -> dict | None:
+    """
+    Optional level-of-detail request: ?zoom= (Web Mercator zoom) or ?tolerance_m= (meters).
+    Returns {"zoom": z} or {"tolerance_m": t}, None when neither is given; raises ValueError.
+    """
+    zoom = request.args.get("zoom")
+    tolerance_m = request.args.get("tolerance_m")
+    if zoom is None and tolerance_m is None:
+        return None
+    if zoom is not None and tolerance_m is not None:
+        raise ValueError("Give either zoom or tolerance_m, not both")
+    name, raw = ("zoom", zoom) if zoom is not None else ("tolerance_m", tolerance_m)
+    try:
+        value = float(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+    if not math.isfinite(value) or value < 0:
+        raise ValueError(f"{name} must be a non-negative number")
+    return {name: value}
+
+
+# Accept header alternative to ?format=, e.g. "Accept: application/vnd.bergenomap.track.polyline+json".
+TRACK_FORMAT_MEDIA_TYPES = {fmt: f"application/vnd.bergenomap.track.{fmt}+json" for fmt in WIRE_FORMATS}
+
+
+def parse_track_format() -> str:
+    """
+    Track payload format from ?format= (points, columnar or polyline) or the Accept header.
+    Defaults to points (one JSON object per point); raises ValueError for an unknown ?format=.
+    """
+    requested = request.args.get("format")
+    if requested is not None:
+        if requested not in WIRE_FORMATS:
+            raise ValueError(f"format must be one of: {', '.join(WIRE_FORMATS)}")
+        return requested
+    best = request.accept_mimetypes.best_match(list(TRACK_FORMAT_MEDIA_TYPES.values()))
+    for fmt, media_type in TRACK_FORMAT_MEDIA_TYPES.items():
+        if best == media_type:
+            return fmt
+    return WIRE_FORMAT_POINTS
+
+
+def track_json_response(response: dict, payload: TrackPayload) -> Response:
+    """
+    `response` as JSON with the payload's pre-serialized track spliced in as "gpx".
+    """
+    head = json.dumps(response, separators=(",", ":")).encode("utf-8")
+    body = head[:-1] + b',"gpx":' + payload.gpx_json + b"}"
+    flask_response = Response(body, mimetype="application/json")
+    # The format can be chosen by Accept header, so caches must key on it.
+    flask_response.vary.add("Accept")
+    return flask_response
+
+
+def etag_for(*parts: object) -> str:
+    """
+    ETag value derived from whatever determines a response (ids, versions, content hashes,
+    query args), so it can be checked before the response is built.
+    """
+    encoded = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:32]
+
+
+def not_modified(etag: str, *, max_age: int = 0) -> Response | None:
+    """
+    A 304 response when the request's If-None-Match matches etag, else None.
+    """
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    return set_cache_validators(Response(status=304), etag, max_age=max_age)
+
+
+def set_cache_validators(response: Response, etag: str, *, max_age: int = 0) -> Response:
+    """
+    ETag plus Cache-Control for a per-user response. With max_age the response is fresh, and
+    never changes, for that long (only for URLs that change with the content); without it
+    browsers keep it but revalidate every time, which not_modified answers cheaply.
+    """
+    response.set_etag(etag)
+    response.cache_control.private = True
+    if max_age:
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = max_age
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def stored_gpx_response(db: Database, table: str, blob: dict, *, download_name: str) -> Response:
+    """
+    The GPX file in table.gpx_data of row blob["row_id"] (from a repo's get_*_gpx_blob),
+    streamed from the database in chunks, never read whole into memory. Range requests are
+    honoured, so an interrupted download can resume.
+    """
+    etag = etag_for("gpx", table, blob["row_id"], blob["size"])
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+
+    reader = sqlite_blob.open_blob_reader(db, table, "gpx_data", blob["row_id"])
+    response = Response(
+        FileWrapper(reader, settings.gpx_download_chunk_bytes),
+        mimetype="application/gpx+xml",
+        direct_passthrough=True,
+    )
+    response.content_length = blob["size"]
+    response.headers.set("Content-Disposition", "attachment", filename=download_name)
+    set_cache_validators(response, etag)
+    return response.make_conditional(request, accept_ranges=True, complete_length=blob["size"])
+
+
+def strava_gpx_response(db: Database, username: str, activity_id: int) -> Response | None:
+    """
+    Download of an activity's GPX: the original file when one is stored, else its track
+    exported as GPX. None if the activity does not exist or has no track.
+    """
+    download_name = f"strava_{activity_id}.gpx"
+    blob = strava_repo.get_activity_gpx_blob(db, username, activity_id)
+    if blob is None:
+        return None
+    if blob["size"]:
+        return stored_gpx_response(db, "strava_activities", blob, download_name=download_name)
+
+    # Served from the cached export file: Content-Length, ETag and Range requests (resumable downloads).
+    path = track_service.export_strava_track_gpx_file(db, username, activity_id)
+    if path is None:
+        return None
+    return send_file(path, mimetype="application/gpx+xml", as_attachment=True, download_name=download_name)
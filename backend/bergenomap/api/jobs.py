@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+from flask import Blueprint, g, jsonify
+
+from bergenomap.repositories.db import get_db
+from bergenomap.repositories import jobs_repo
+from bergenomap.services import job_service
+
+
+bp = Blueprint("jobs", __name__)
+
+
+def _public_job(job: dict) -> dict:
+    return {
+        key: job[key]
+        for key in (
+            "job_id",
+            "kind",
+            "status",
+            "progress",
+            "message",
+            "result",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+        )
+    }
+
+
+@bp.route("/api/jobs", methods=["GET"])
+def list_jobs():
+    job_service.ensure_started()
+    db = get_db()
+    return jsonify([_public_job(job) for job in jobs_repo.list_jobs(db, g.username)])
+
+
+@bp.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job(job_id: str):
+    # Clients poll here while waiting, so a restarted worker picks up their queued jobs.
+    job_service.ensure_started()
+    db = get_db()
+    job = jobs_repo.get_job(db, job_id, username=g.username)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(_public_job(job))
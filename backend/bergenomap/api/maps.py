@@ -4,18 +4,26 @@ import io
 import json
 import math
 import traceback
-from io import BytesIO
+import xml.etree.ElementTree as ET
 
 from flask import Blueprint, abort, g, jsonify, make_response, request, send_file
 from PIL import Image
 
+from bergenomap.api.common import etag_for, not_modified, parse_bbox_args, set_cache_validators
 from bergenomap.config import settings
 from bergenomap.repositories.db import get_db
 from bergenomap.repositories import map_files_repo, maps_repo
-from bergenomap.services.image_service import add_transparent_border_and_rotate_image
+from bergenomap.services import job_service, projection_service, spatial_service, track_service
+from bergenomap.services.image_service import (
+    IMAGE_EXTENSIONS,
+    add_transparent_border_and_rotate_image,
+    encode_image,
+    image_mimetype,
+)
 from bergenomap.utils.geo import haversine, meters_per_pixel_xy, rectangular_area_from_bounds
 from bergenomap.utils.pdf import pdf_bytes_to_png
-from OptimizeRotation import getOverlayCoordinatesWithOptimalRotation
+from bergenomap.utils.projection import FRAME_OVERLAY, FRAMES
+from OptimizeRotation import getOverlayCoordinatesRobust, getOverlayCoordinatesWithOptimalRotation
 
 
 bp = Blueprint("maps", __name__)
@@ -80,12 +88,8 @@ def process_dropped_image():
         f"({processed_image.width}, {processed_image.height}), border size {border_size}"
     )
 
-    # Save the processed image to a BytesIO object
-    img_io = io.BytesIO()
-    processed_image.save(img_io, "PNG")
-    img_io.seek(0)
-
-    return send_file(img_io, mimetype="image/png")
+    encoded = encode_image(processed_image, settings.dropped_image_encoding)
+    return send_file(io.BytesIO(encoded.data), mimetype=encoded.mimetype)
 
 
 @bp.route("/api/convertPdfToImage", methods=["POST"])
@@ -112,8 +116,10 @@ def convert_pdf_to_image():
 
 
 """This endpoint accepts an un-treated image overlay and data about how it should be placed on a real-world map.
-It then transforms the overlay by adding transparent borders and rotating it to match this data, then
-stores both the original and transformed overlay, along with the supplied registration data, to the database."""
+It queues a job that transforms the overlay by adding transparent borders and rotating it to match this data, then
+stores both the original and transformed overlay, along with the supplied registration data, to the database.
+The original is re-encoded (settings.map_original_encoding) unless the form has keep_original_format=true.
+Returns 202 with the job id; poll /api/jobs/<job_id> for progress and the resulting map_id."""
 @bp.route("/api/transformAndStoreMapData", methods=["POST"])
 def transform_and_store_map():
     # Check if the request contains a file and a data JSON object
@@ -124,70 +130,32 @@ def transform_and_store_map():
     imageRegistrationData = request.form["imageRegistrationData"]
 
     try:
-        imageRegistrationData_json = json.loads(imageRegistrationData)
-        rotation_angle = float(imageRegistrationData_json.get("optimal_rotation_angle"))
+        map_registration_data = json.loads(imageRegistrationData)
+        float(map_registration_data.get("optimal_rotation_angle"))
     except (ValueError, KeyError, TypeError):
         return "Invalid image registration data format or missing optimal_rotation_angle", 402
 
     if file.filename == "":
         return "Did not receive file", 403
 
-    image = Image.open(file.stream)
-
-    originalWidth, originalHeight = image.width, image.height
-
-    border_size = int(max(image.width, image.height) * settings.default_border_percentage)
-
-    processed_image = add_transparent_border_and_rotate_image(image, border_size, rotation_angle)
-
-    print(
-        f"Transformed image of dimensions ({originalWidth}, {originalHeight}) to image of dimensions "
-        f"({processed_image.width}, {processed_image.height}), border size {border_size}"
-    )
-
-    transformed_map_io = io.BytesIO()
-    processed_image.save(transformed_map_io, "PNG")
-    transformed_map_io.seek(0)
-
-    original_map_io = io.BytesIO()
-    image.save(original_map_io, "PNG")
-    original_map_io.seek(0)
-
+    # Decoding, rotating and encoding a large map is left to the job worker.
     db = get_db()
-
-    map_registration_data = json.loads(imageRegistrationData)
-
     try:
-        map_id = maps_repo.insert_map(db, g.username, map_registration_data)
+        maps_repo.check_map_writable(db, g.username, map_registration_data)
     except PermissionError as exc:
         return jsonify({"error": str(exc)}), 409
-    map_files_repo.insert_original(db, map_id, original_map_io.getvalue())
-    map_files_repo.insert_final(db, map_id, transformed_map_io.getvalue())
-
-    print(f"Registered map \"{map_registration_data['map_name']}\" added to database with id {map_id}.")
-
-    # OCR + AI metadata extraction (DISABLED by default)
-    #
-    # This is intentionally commented out while we tune OCR parameters + prompts.
-    # The intended workflow is to run `scripts/run_map_ocr_ai_backfill.py` against
-    # selected maps, inspect the debug outputs, and only then enable this block.
-    #
-    # IMPORTANT: Do not expose OpenAI calls via public API endpoints.
-    #
-    # try:
-    #     from bergenomap.services.map_metadata_ocr_pipeline import run_map_metadata_pipeline
-    #
-    #     result = run_map_metadata_pipeline(processed_image)
-    #     maps_repo.update_map_metadata_if_default(
-    #         db,
-    #         username=g.username,
-    #         map_id=map_id,
-    #         metadata=result.metadata,
-    #     )
-    # except Exception:
-    #     traceback.print_exc()
+    job_id = job_service.submit_job(
+        db,
+        g.username,
+        job_service.JOB_KIND_STORE_MAP,
+        params={
+            "registration_data": map_registration_data,
+            "keep_original_format": request.form.get("keep_original_format", "").lower() in ("1", "true"),
+        },
+        input_data=file.read(),
+    )
 
-    return send_file(transformed_map_io, mimetype="image/png")
+    return jsonify({"job_id": job_id, "status_url": f"/api/jobs/{job_id}"}), 202
 
 
 """This endpoint will add margins and rotate the original image, and return the result. No DB storage."""
@@ -240,16 +208,39 @@ def get_overlay_coordinates():
         real_coords = data.get("real_coords")
         overlay_width = data.get("overlayWidth")
         overlay_height = data.get("overlayHeight")
+        # "exact": exactly 3 points, all used. "robust": 3 or more points, mis-clicked points rejected.
+        mode = data.get("mode", "exact")
 
         print(f"Received request to calculate registration with parameters: {data}")
 
-        # Ensure inputs are correctly formatted
-        if len(image_coords) != 3 or len(real_coords) != 3:
-            return jsonify({"error": "Invalid input: Must provide exactly 3 image and 3 real coordinates"}), 400
-
-        rotationAndBounds = getOverlayCoordinatesWithOptimalRotation(
-            image_coords, real_coords, overlay_width, overlay_height
-        )
+        if mode == "robust":
+            if len(image_coords) < 3 or len(image_coords) != len(real_coords):
+                return jsonify(
+                    {"error": "Invalid input: Must provide at least 3 image coordinates and as many real coordinates"}
+                ), 400
+
+            try:
+                rotationAndBounds = getOverlayCoordinatesRobust(
+                    image_coords,
+                    real_coords,
+                    overlay_width,
+                    overlay_height,
+                    inlier_threshold_m=settings.registration_inlier_threshold_m,
+                    max_hypotheses=settings.registration_max_hypotheses,
+                )
+            except ValueError as exc:
+                # Too few mutually consistent control points: the client has to fix its input.
+                return jsonify({"error": str(exc)}), 400
+        elif mode == "exact":
+            # Ensure inputs are correctly formatted
+            if len(image_coords) != 3 or len(real_coords) != 3:
+                return jsonify({"error": "Invalid input: Must provide exactly 3 image and 3 real coordinates"}), 400
+
+            rotationAndBounds = getOverlayCoordinatesWithOptimalRotation(
+                image_coords, real_coords, overlay_width, overlay_height
+            )
+        else:
+            return jsonify({"error": f"Invalid input: Unknown registration mode '{mode}'"}), 400
 
         print(f"Calculated required map rotation, result is: {rotationAndBounds}")
 
@@ -282,6 +273,17 @@ def get_overlay_coordinates():
             "overlay_width": overlay_width,
             "overlay_height": overlay_height,
         }
+        if mode == "robust":
+            for key in (
+                "inliers",
+                "outlier_indices",
+                "residuals_m",
+                "loo_errors_m",
+                "rms_error_m",
+                "loo_rms_error_m",
+                "inlier_threshold_m",
+            ):
+                result[key] = rotationAndBounds[key]
         print(f"Result is: {result}")
 
         # Return the result as a JSON response (legacy behavior)
@@ -294,31 +296,156 @@ def get_overlay_coordinates():
 
 @bp.route("/api/dal/list_maps", methods=["GET"])
 def list_maps():
+    """
+    All maps of the user, or only those intersecting ?min_lat=&min_lon=&max_lat=&max_lon= when given.
+
+    Each map has "original_sha256" and "final_sha256", the versions of its stored images: map file
+    URLs with ?v=<digest> are cacheable for good. The listing's ETag is the maps collection
+    version, so revalidating an unchanged listing gets a 304 without querying the maps.
+    """
+    try:
+        bbox = parse_bbox_args()
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    db = get_db()
+    etag = etag_for("list_maps", g.username, maps_repo.get_maps_version(db), bbox)
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+
+    if bbox is None:
+        maps = maps_repo.list_maps(db, g.username)
+    else:
+        maps = maps_repo.list_maps_in_bbox(db, g.username, **bbox)
+    digests = map_files_repo.list_digests(db, g.username)
+    for map_entry in maps:
+        map_entry.update(digests.get(map_entry["map_id"], {"original_sha256": None, "final_sha256": None}))
+    return set_cache_validators(jsonify(maps), etag)
+
+
+@bp.route("/api/dal/maps_at_point", methods=["GET"])
+def maps_at_point():
+    """
+    Maps whose (rotated) content covers ?lat=&lon=.
+    """
+    try:
+        lat = float(request.args["lat"])
+        lon = float(request.args["lon"])
+    except (KeyError, ValueError):
+        return jsonify({"error": "lat and lon are required numbers"}), 400
+
+    db = get_db()
+    return jsonify(spatial_service.maps_covering_point(db, g.username, lat, lon))
+
+
+@bp.route("/api/maps/<int:map_id>/transform", methods=["GET"])
+def get_map_transform(map_id: int):
     db = get_db()
-    maps = maps_repo.list_maps(db, g.username)
-    return jsonify(maps)
+    map_entry = maps_repo.get_map_by_id(db, map_id, username=g.username)
+    if map_entry is None:
+        return jsonify({"error": "Map not found"}), 404
+    try:
+        transform = projection_service.get_map_transform(db, map_entry)
+    except (KeyError, TypeError, ValueError) as exc:
+        return jsonify({"error": f"Map has no usable registration: {exc}"}), 422
+    return jsonify(transform.to_dict())
+
+
+@bp.route("/api/maps/<int:map_id>/project", methods=["POST"])
+def project_on_map(map_id: int):
+    """
+    Batch projection between map pixels and lat/lon.
+
+    Body: {"points": [[a, b], ...], "direction": "pixel_to_latlon" | "latlon_to_pixel", "frame": "overlay" | "final"}
+    or {"track_id": n, "frame": ...} to get every point of a track in map pixels.
+    "overlay" pixels are on the unrotated image the control points were picked on, "final"
+    pixels on the stored (rotated) map image.
+    """
+    data = request.get_json(silent=True) or {}
+    frame = data.get("frame", FRAME_OVERLAY)
+    if frame not in FRAMES:
+        return jsonify({"error": f"Invalid frame: {frame}"}), 400
+
+    db = get_db()
+    map_entry = maps_repo.get_map_by_id(db, map_id, username=g.username)
+    if map_entry is None:
+        return jsonify({"error": "Map not found"}), 404
+    try:
+        transform = projection_service.get_map_transform(db, map_entry)
+    except (KeyError, TypeError, ValueError) as exc:
+        return jsonify({"error": f"Map has no usable registration: {exc}"}), 422
+
+    if "track_id" in data:
+        try:
+            track_id = int(data["track_id"])
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid track_id"}), 400
+        try:
+            track = track_service.load_track_arrays(db, g.username, track_id)
+        except ET.ParseError as exc:
+            return jsonify({"error": f"Unable to parse GPX payload: {exc}"}), 500
+        if track is None:
+            return jsonify({"error": "Track not found"}), 404
+        pixels = projection_service.project_track(transform, track, frame=frame)
+        return jsonify({
+            "track_id": track_id,
+            "frame": frame,
+            "segment_starts": track.segment_starts.tolist(),
+            "points": pixels.tolist(),
+        })
+
+    points = data.get("points")
+    direction = data.get("direction")
+    if not isinstance(points, list):
+        return jsonify({"error": "points must be a list of [a, b] pairs"}), 400
+    if len(points) > settings.projection_max_points:
+        return jsonify({"error": f"At most {settings.projection_max_points} points per request"}), 413
+    try:
+        projected = projection_service.project_points(transform, points, direction=direction, frame=frame)
+    except (TypeError, ValueError) as exc:
+        return jsonify({"error": str(exc)}), 400
+    return jsonify({"direction": direction, "frame": frame, "points": projected.tolist()})
 
 
 @bp.route("/api/dal/mapfile/original/<map_name>", methods=["GET"])
 def get_mapfile_original(map_name: str):
     db = get_db()
-    image_data = map_files_repo.get_original_by_name(db, g.username, map_name)
-    if image_data is not None:
-        return send_file(BytesIO(image_data), mimetype="image/*")
-    abort(404, description="Map not found")
+    digest = map_files_repo.get_original_digest_by_name(db, g.username, map_name)
+    if digest is None:
+        abort(404, description="Map not found")
+    return _send_map_image(digest, download_stem=map_name)
 
 
 @bp.route("/api/dal/mapfile/final/<map_name>", methods=["GET"])
 def get_mapfile_final(map_name: str):
     db = get_db()
-    image_data = map_files_repo.get_final_by_name(db, g.username, map_name)
-    if image_data is not None:
-        return send_file(
-            BytesIO(image_data),
-            mimetype="image/*",
-            as_attachment=False,
-            download_name=f"{map_name}.webp",
-        )
-    abort(404, description="Map not found")
-
-
+    digest = map_files_repo.get_final_digest_by_name(db, g.username, map_name)
+    if digest is None:
+        abort(404, description="Map not found")
+    return _send_map_image(digest, download_stem=map_name)
+
+
+def _send_map_image(digest: str, *, download_stem: str):
+    """
+    A stored map image, with its content digest as ETag. Requested as ?v=<digest> (see
+    list_maps), the URL is content-addressed and the response cacheable for
+    settings.mapfile_cache_max_age_s; otherwise browsers revalidate it on every use. The file
+    is streamed by send_file, which also answers Range requests with 206 partial content.
+    """
+    max_age = settings.mapfile_cache_max_age_s if request.args.get("v") == digest else 0
+    # Answered from the digest alone; the file is not opened.
+    cached = not_modified(digest, max_age=max_age)
+    if cached is not None:
+        return cached
+
+    # Served from the blob store file, so the image is never read into Python memory.
+    image_path = map_files_repo.existing_blob_path(digest)
+    if image_path is None:
+        abort(404, description="Map not found")
+    # Stored images differ in format (settings.map_*_encoding, kept originals, older maps).
+    with open(image_path, "rb") as f:
+        mimetype = image_mimetype(f.read(16)) or "application/octet-stream"
+    download_name = download_stem + IMAGE_EXTENSIONS.get(mimetype, "")
+    response = send_file(image_path, mimetype=mimetype, download_name=download_name, etag=digest)
+    return set_cache_validators(response, digest, max_age=max_age)
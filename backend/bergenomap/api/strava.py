@@ -2,15 +2,18 @@ from __future__ import annotations
 
 import base64
 import json
+import xml.etree.ElementTree as ET
 from datetime import datetime, timezone
 from urllib.parse import urlparse
 
-from flask import Blueprint, current_app, g, jsonify, redirect, request
+from flask import Blueprint, g, jsonify, redirect, request
 
+from bergenomap.api.common import parse_track_format, strava_gpx_response, track_json_response
 from bergenomap.integrations.strava_client import StravaApiError, StravaClient
 from bergenomap.repositories import strava_repo
 from bergenomap.repositories.db import get_db
-from bergenomap.services import strava_sync_service
+from bergenomap.services import strava_sync_service, track_service
+from bergenomap.utils.track_codec import WIRE_FORMAT_POINTS
 
 
 bp = Blueprint("strava", __name__)
@@ -57,6 +60,7 @@ def status():
     db = get_db()
     conn = strava_repo.get_connection(db, username)
     connected = bool(conn and not conn.get("revoked_at") and conn.get("refresh_token"))
+    sync_state = strava_repo.get_sync_state(db, username)
     return jsonify(
         {
             "connected": connected,
@@ -67,6 +71,8 @@ def status():
             "connected_at": conn.get("connected_at") if conn else None,
             "updated_at": conn.get("updated_at") if conn else None,
             "revoked_at": conn.get("revoked_at") if conn else None,
+            "sync_watermark": sync_state["sync_watermark"],
+            "last_reconciled_at": sync_state["last_reconciled_at"],
         }
     )
 
@@ -156,15 +162,19 @@ def sync_activities():
     payload = request.get_json(silent=True) or {}
     after = payload.get("after")
     before = payload.get("before")
+    # "incremental" (default), "full" or "reconcile"; see strava_sync_service.sync_activity_summaries.
+    mode = payload.get("mode", strava_sync_service.SYNC_MODE_INCREMENTAL)
     try:
         after_i = int(after) if after is not None else None
         before_i = int(before) if before is not None else None
     except (TypeError, ValueError):
         return jsonify({"error": "after/before must be unix timestamps (ints)"}), 400
+    if mode not in strava_sync_service.SYNC_MODES:
+        return jsonify({"error": f"mode must be one of {', '.join(strava_sync_service.SYNC_MODES)}"}), 400
 
     try:
         result = strava_sync_service.sync_activity_summaries(
-            db, username, client=client, after=after_i, before=before_i
+            db, username, client=client, after=after_i, before=before_i, mode=mode
         )
     except (ValueError, StravaApiError) as exc:
         return jsonify({"error": str(exc)}), 400
@@ -176,6 +186,9 @@ def sync_activities_page():
     """
     Fetch exactly one page of Strava activities and upsert into our cache.
     Intended for UI progress updates.
+
+    With "incremental": true and no after/before, the first page starts from the stored sync
+    watermark; the response's "after" must be passed explicitly for the following pages.
     """
     username = _current_username()
     db = get_db()
@@ -200,6 +213,9 @@ def sync_activities_page():
     if per_page_i < 1 or per_page_i > 200:
         return jsonify({"error": "per_page must be between 1 and 200"}), 400
 
+    if payload.get("incremental"):
+        after_i = strava_sync_service.resolve_sync_after(db, username, after=after_i, before=before_i)
+
     try:
         result = strava_sync_service.sync_activity_summaries_page(
             db,
@@ -287,15 +303,37 @@ def delete_import(activity_id: int):
 @bp.route("/api/strava/gpx/<int:activity_id>", methods=["GET"])
 def download_gpx(activity_id: int):
     """
-    Convenience endpoint for UI: returns stored GPX as bytes.
+    Convenience endpoint for UI: returns the activity's GPX file, or its imported track
+    exported as GPX when no file is stored.
+    With ?format= or a track Accept type (see parse_track_format) it returns the track as
+    JSON in that format instead, like /api/gps-tracks/<username>/-<activity_id>.
     """
     username = _current_username()
     db = get_db()
-    gpx = strava_repo.get_activity_gpx(db, username, activity_id)
-    if not gpx:
+    try:
+        wire_format = parse_track_format()
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    if request.args.get("format") is not None or wire_format != WIRE_FORMAT_POINTS:
+        activity = strava_repo.get_activity(db, username, activity_id)
+        payload = None
+        if activity:
+            try:
+                payload = track_service.load_track_payload(
+                    db, username, -activity_id, activity["content_hash"], wire_format=wire_format
+                )
+            except ET.ParseError as exc:
+                return jsonify({"error": f"Unable to parse GPX payload: {exc}"}), 422
+        if payload is None:
+            return jsonify({"error": "No GPX stored for this activity"}), 404
+        return track_json_response({"activity_id": activity_id}, payload)
+
+    try:
+        response = strava_gpx_response(db, username, activity_id)
+    except ET.ParseError as exc:
+        return jsonify({"error": f"Unable to parse GPX payload: {exc}"}), 422
+    if response is None:
         return jsonify({"error": "No GPX stored for this activity"}), 404
-    response = current_app.response_class(gpx, mimetype="application/gpx+xml")
-    response.headers["Content-Disposition"] = f"attachment; filename=strava_{activity_id}.gpx"
     return response
 
 
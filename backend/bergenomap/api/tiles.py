@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+from flask import Blueprint, abort, g, jsonify, request, send_file
+
+from bergenomap.api.common import etag_for, not_modified, set_cache_validators
+from bergenomap.config import settings
+from bergenomap.repositories.db import get_db
+from bergenomap.repositories import map_files_repo, maps_repo
+from bergenomap.services import tile_service
+
+
+bp = Blueprint("tiles", __name__)
+
+
+@bp.route("/api/tiles/<int:map_id>", methods=["GET"])
+def get_tile_metadata(map_id: int):
+    """
+    Bounds and zoom range for building a Leaflet tile layer for one map.
+    """
+    db = get_db()
+    map_entry = maps_repo.get_map_by_id(db, map_id, username=g.username)
+    if not map_entry:
+        return jsonify({"error": "Map not found"}), 404
+    digest = map_files_repo.get_final_digest(db, map_id)
+    if not digest:
+        return jsonify({"error": "Map has no image"}), 404
+    return jsonify(tile_service.tile_metadata(map_entry, digest))
+
+
+@bp.route("/api/tiles/<int:map_id>/<int:z>/<int:x>/<int:y>.webp", methods=["GET"])
+def get_tile(map_id: int, z: int, x: int, y: int):
+    """
+    One tile of the map's current final image. Requested as ?v=<digest> (see
+    get_tile_metadata), the URL is versioned and the tile cacheable for
+    settings.tile_cache_max_age_s; otherwise browsers revalidate it on every use.
+    """
+    db = get_db()
+    map_entry = maps_repo.get_map_by_id(db, map_id, username=g.username)
+    if not map_entry:
+        abort(404, description="Map not found")
+    digest = map_files_repo.get_final_digest(db, map_id)
+    if not digest:
+        abort(404, description="Map not found")
+
+    max_age = settings.tile_cache_max_age_s if request.args.get("v") == digest else 0
+    etag = etag_for("tile", digest, z, x, y)
+    cached = not_modified(etag, max_age=max_age)
+    if cached is not None:
+        return cached
+
+    path = tile_service.get_or_create_tile(map_entry, digest, z, x, y)
+    if path is None:
+        abort(404, description="Tile not found")
+
+    response = send_file(path, mimetype="image/webp", etag=etag)
+    return set_cache_validators(response, etag, max_age=max_age)
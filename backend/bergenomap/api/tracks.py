@@ -1,14 +1,28 @@
 from __future__ import annotations
 
+import hashlib
 import xml.etree.ElementTree as ET
 import re
 
 from flask import Blueprint, g, jsonify, request
 
+from bergenomap.api.common import (
+    etag_for,
+    not_modified,
+    parse_bbox_args,
+    parse_lod_args,
+    parse_track_format,
+    set_cache_validators,
+    stored_gpx_response,
+    strava_gpx_response,
+    track_json_response,
+)
+from bergenomap.config import settings
 from bergenomap.repositories.db import get_db
-from bergenomap.repositories import strava_repo, tracks_repo, users_repo
-from bergenomap.services.track_service import compute_gpx_bounds
-from gpx_parser import parse_strava_gpx
+from bergenomap.repositories import strava_repo, track_stats_repo, tracks_repo, users_repo
+from bergenomap.services import job_service, track_service
+from bergenomap.utils.track_codec import encode_track
+from gpx_parser import parse_gpx_stream
 
 
 bp = Blueprint("tracks", __name__)
@@ -30,21 +44,43 @@ def _format_strava_track_description(*, start_date: str | None, name: str, worko
 
 @bp.route("/api/gps-tracks/<username>", methods=["GET"])
 def list_gps_tracks(username: str):
+    """
+    All tracks of the user, or only those intersecting ?min_lat=&min_lon=&max_lat=&max_lon= when given.
+    With ?zoom= or ?tolerance_m=, each track has "lod": its simplified geometry for overview
+    rendering (see track_service.lod_overview), at least at the finest stored level; null for
+    tracks whose levels have not been built yet (scripts/backfill_track_data.py).
+
+    Each track has "stats" (bergenomap/utils/track_stats.py, null if unknown). Tracks can be
+    filtered with ?min_<stat>=&max_<stat>= and sorted with ?sort=<stat> or ?sort=-<stat>
+    (descending), e.g. ?min_distance_m=5000&sort=-elevation_gain_m; unknown values sort last.
+    """
     if username != g.username:
         return jsonify({"error": "Forbidden"}), 403
+    try:
+        bbox = parse_bbox_args()
+        lod_args = parse_lod_args()
+        stat_filters, sort_stat, sort_descending = _parse_stats_args()
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
     db = get_db()
     user = users_repo.get_user_by_username(db, username)
     if not user:
         return jsonify({"error": f"User '{username}' not found"}), 404
 
-    tracks = tracks_repo.list_gps_tracks(db, username)
+    if bbox is None:
+        tracks = tracks_repo.list_gps_tracks(db, username)
+    else:
+        tracks = tracks_repo.list_gps_tracks_in_bbox(db, username, **bbox)
     for t in tracks:
         if isinstance(t, dict):
             t["source"] = "local"
 
     # Add Strava imports as "virtual tracks" with negative track_id values.
     # This keeps the GPX browser's numeric trackId assumptions intact.
-    strava_imports = strava_repo.list_imports(db, username)
+    if bbox is None:
+        strava_imports = strava_repo.list_imports(db, username)
+    else:
+        strava_imports = strava_repo.list_imports_in_bbox(db, username, **bbox)
     strava_activities = strava_repo.list_activities(db, username)
     strava_activity_by_id = {
         a.get("activity_id"): a for a in strava_activities if isinstance(a, dict) and a.get("activity_id") is not None
@@ -89,7 +125,79 @@ def list_gps_tracks(username: str):
         )
 
     merged = tracks + strava_tracks
-    return jsonify(merged)
+    for t, stats in zip(merged, track_service.list_track_stats(db, username, [t["track_id"] for t in merged])):
+        t["stats"] = stats
+    merged = [t for t in merged if _matches_stat_filters(t["stats"], stat_filters)]
+    if sort_stat is not None:
+        known = [t for t in merged if t["stats"] and t["stats"].get(sort_stat) is not None]
+        unknown = [t for t in merged if not (t["stats"] and t["stats"].get(sort_stat) is not None)]
+        known.sort(key=lambda t: t["stats"][sort_stat], reverse=sort_descending)
+        merged = known + unknown
+
+    if lod_args is not None:
+        levels = [
+            track_service.lod_level_for_args(lod_args, _center_lat(t)) or 0
+            for t in merged
+        ]
+        overviews = track_service.lod_overviews(db, username, [t["track_id"] for t in merged], levels)
+        for t, overview in zip(merged, overviews):
+            t["lod"] = overview
+    # The listing draws on Strava imports, stats and LODs, so its ETag is a hash of the body:
+    # an unchanged listing is still built, but not resent.
+    response = jsonify(merged)
+    set_cache_validators(response, hashlib.sha256(response.get_data()).hexdigest()[:32])
+    return response.make_conditional(request)
+
+
+# Stats usable in ?sort= and ?min_/max_ filters of the track list.
+_SORTABLE_STATS = tuple(c for c in track_stats_repo.STAT_COLUMNS if c != "hr_zone_s")
+
+
+def _parse_stats_args() -> tuple[list[tuple[str, str, object]], str | None, bool]:
+    """
+    ([(stat, "min" | "max", bound), ...], sort stat or None, descending).
+    """
+    filters = []
+    for stat in _SORTABLE_STATS:
+        for bound_kind in ("min", "max"):
+            raw = request.args.get(f"{bound_kind}_{stat}")
+            if raw is None:
+                continue
+            if stat == "start_time":
+                bound: object = raw
+            else:
+                try:
+                    bound = float(raw)
+                except ValueError:
+                    raise ValueError(f"{bound_kind}_{stat} must be a number")
+            filters.append((stat, bound_kind, bound))
+
+    sort = request.args.get("sort")
+    if sort is None:
+        return filters, None, False
+    descending = sort.startswith("-")
+    sort_stat = sort.lstrip("-")
+    if sort_stat not in _SORTABLE_STATS:
+        raise ValueError(f"sort must be one of: {', '.join(_SORTABLE_STATS)} (prefix - for descending)")
+    return filters, sort_stat, descending
+
+
+def _matches_stat_filters(stats: dict | None, filters: list[tuple[str, str, object]]) -> bool:
+    for stat, bound_kind, bound in filters:
+        value = stats.get(stat) if stats else None
+        if value is None:
+            return False
+        if bound_kind == "min" and value < bound:
+            return False
+        if bound_kind == "max" and value > bound:
+            return False
+    return True
+
+
+def _center_lat(track: dict) -> float | None:
+    if track.get("min_lat") is None or track.get("max_lat") is None:
+        return None
+    return (track["min_lat"] + track["max_lat"]) / 2
 
 
 @bp.route("/api/gps-tracks/<username>/<track_id>", methods=["GET"])
@@ -101,40 +209,43 @@ def get_gps_track(username: str, track_id: str):
         track_id_int = int(track_id)
     except (TypeError, ValueError):
         return jsonify({"error": "Invalid track_id"}), 400
+    try:
+        wire_format = parse_track_format()
+        lod_args = parse_lod_args()
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
 
     if track_id_int < 0: # Negative-numbered tracks are virtual, from Strava integration
         activity_id = -track_id_int
-        gpx_bytes = strava_repo.get_activity_gpx(db, username, activity_id)
-        if not gpx_bytes:
+        activity = strava_repo.get_activity(db, username, activity_id)
+        if not activity:
             return jsonify({"error": "Track not found"}), 404
-
+        lod_level = None
+        if lod_args is not None:
+            lod_level = track_service.lod_level_for_args(lod_args, activity.get("start_lat"))
+        etag = _track_etag(activity, activity["content_hash"], wire_format, lod_level)
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
         try:
-            parsed_gpx = parse_strava_gpx(gpx_bytes)
+            payload = track_service.load_track_payload(
+                db, username, track_id_int, activity["content_hash"], wire_format=wire_format, lod_level=lod_level
+            )
         except ET.ParseError as exc:
-            return jsonify({"error": f"Unable to parse GPX payload: {exc}"}), 500
-
-        bounds = compute_gpx_bounds(parsed_gpx) or (None, None, None, None)
-        min_lat, min_lon, max_lat, max_lon = bounds
-        # Best-effort description from cached Strava activities table.
-        activity: dict = {}
-        for a in strava_repo.list_activities(db, username):
-            if isinstance(a, dict) and a.get("activity_id") == activity_id:
-                activity = a
-                break
+            return jsonify({"error": f"Unable to parse GPX payload: {exc}"}), 422
+        if payload is None:
+            return jsonify({"error": "Track not found"}), 404
 
-        name = activity.get("name") if isinstance(activity, dict) else None
-        if not name:
-            name = str(activity_id)
-        start_date = activity.get("start_date") if isinstance(activity, dict) else None
-        workout_type = activity.get("workout_type") if isinstance(activity, dict) else None
+        min_lat, min_lon, max_lat, max_lon = payload.bounds or (None, None, None, None)
+        name = activity.get("name") or str(activity_id)
 
         response = {
             "track_id": track_id_int,
             "username": username,
             "description": _format_strava_track_description(
-                start_date=start_date,
+                start_date=activity.get("start_date"),
                 name=str(name),
-                workout_type=workout_type,
+                workout_type=activity.get("workout_type"),
             ),
             "min_lat": min_lat,
             "min_lon": min_lon,
@@ -142,19 +253,29 @@ def get_gps_track(username: str, track_id: str):
             "max_lon": max_lon,
             "source": "strava",
             "strava_activity_id": activity_id,
-            "gpx": parsed_gpx,
+            "lod": _lod_info(lod_level),
         }
-        return jsonify(response)
+        return set_cache_validators(track_json_response(response, payload), etag)
 
     # Positive-numbered tracks are from GPX tracks uploaded by the user
-    track = tracks_repo.get_gps_track_by_id(db, username, track_id_int)
+    track = tracks_repo.get_gps_track_meta(db, username, track_id_int)
     if not track:
         return jsonify({"error": "Track not found"}), 404
-
+    lod_level = None
+    if lod_args is not None:
+        lod_level = track_service.lod_level_for_args(lod_args, _center_lat(track))
+    etag = _track_etag(track, track["content_hash"], wire_format, lod_level)
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
     try:
-        parsed_gpx = parse_strava_gpx(track["gpx_data"])
+        payload = track_service.load_track_payload(
+            db, username, track_id_int, track["content_hash"], wire_format=wire_format, lod_level=lod_level
+        )
     except ET.ParseError as exc:
-        return jsonify({"error": f"Unable to parse GPX payload: {exc}"}), 500
+        return jsonify({"error": f"Unable to parse GPX payload: {exc}"}), 422
+    if payload is None:
+        return jsonify({"error": "Track not found"}), 404
 
     response = {
         "track_id": track["track_id"],
@@ -165,9 +286,60 @@ def get_gps_track(username: str, track_id: str):
         "max_lat": track.get("max_lat"),
         "max_lon": track.get("max_lon"),
         "source": "local",
-        "gpx": parsed_gpx,
+        "lod": _lod_info(lod_level),
     }
-    return jsonify(response)
+    return set_cache_validators(track_json_response(response, payload), etag)
+
+
+@bp.route("/api/gps-tracks/<username>/<track_id>/gpx", methods=["GET"])
+def download_gps_track_gpx(username: str, track_id: str):
+    """
+    The GPX file an uploaded track was imported from, or for a Strava activity (negative id)
+    its GPX as /api/strava/gpx/<activity_id> serves it. Stored files are streamed from the
+    database in chunks (see stored_gpx_response); Range requests are honoured, so an
+    interrupted download can resume.
+    """
+    if username != g.username:
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        track_id_int = int(track_id)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid track_id"}), 400
+
+    db = get_db()
+    if track_id_int < 0:
+        try:
+            response = strava_gpx_response(db, username, -track_id_int)
+        except ET.ParseError as exc:
+            return jsonify({"error": f"Unable to parse GPX payload: {exc}"}), 422
+        if response is None:
+            return jsonify({"error": "Track not found"}), 404
+        return response
+
+    blob = tracks_repo.get_gps_track_gpx_blob(db, username, track_id_int)
+    if blob is None:
+        return jsonify({"error": "Track not found"}), 404
+    if not blob["size"]:
+        return jsonify({"error": "No GPX file stored for this track"}), 404
+    return stored_gpx_response(db, "gps_tracks", blob, download_name=f"track-{track_id_int}.gpx")
+
+
+def _track_etag(meta: dict, content_hash: str | None, wire_format: str, lod_level: int | None) -> str:
+    """
+    ETag of a track response, from the row's metadata and the hash of its track data, so a
+    revalidation is answered without loading or parsing the track. The wire format is part of
+    it because it can come from the Accept header.
+    """
+    return etag_for("track", meta, content_hash, wire_format, lod_level)
+
+
+def _lod_info(lod_level: int | None) -> dict | None:
+    """
+    Which level of detail a track response holds; None for the full track.
+    """
+    if lod_level is None:
+        return None
+    return {"level": lod_level, "tolerance_m": settings.track_lod_tolerances_m[lod_level]}
 
 
 @bp.route("/api/gps-tracks", methods=["POST"])
@@ -187,33 +359,38 @@ def insert_gps_track():
         return jsonify({"error": "Uploaded GPX file is empty"}), 400
 
     try:
-        parsed_preview = parse_strava_gpx(gpx_bytes)
+        parsed_preview = parse_gpx_stream(gpx_bytes, columnar=True)
     except ET.ParseError as exc:
         return jsonify({"error": f"Invalid GPX file: {exc}"}), 400
 
-    bounds = compute_gpx_bounds(parsed_preview)
-    if bounds is None:
+    summary = parsed_preview["summary"]
+    if summary["bounds"] is None:
         return jsonify({"error": "No valid coordinates found in GPX file"}), 400
-    min_lat, min_lon, max_lat, max_lon = bounds
+    bounds = summary["bounds"]
+    min_lat, min_lon, max_lat, max_lon = bounds["min_lat"], bounds["min_lon"], bounds["max_lat"], bounds["max_lon"]
+
+    lods = track_service.build_track_lods(parsed_preview["track"])
+    stats = track_service.build_track_stats(parsed_preview["track"])
 
     db = get_db()
     try:
-        track_id = tracks_repo.insert_gps_track(
-            db,
-            username,
-            gpx_bytes,
-            description,
-            min_lat=min_lat,
-            min_lon=min_lon,
-            max_lat=max_lat,
-            max_lon=max_lon,
-        )
+        with db.transaction():
+            track_id = tracks_repo.insert_gps_track(
+                db,
+                username,
+                gpx_bytes,
+                description,
+                min_lat=min_lat,
+                min_lon=min_lon,
+                max_lat=max_lat,
+                max_lon=max_lon,
+                track_data=encode_track(parsed_preview["track"]),
+            )
+            track_service.store_track_lods(db, username, track_id, lods)
+            track_service.store_track_stats(db, username, track_id, stats)
     except ValueError as exc:
         return jsonify({"error": str(exc)}), 400
 
-    preview_point_count = sum(len(track["points"]) for track in parsed_preview.get("tracks", []))
-    preview_track_count = len(parsed_preview.get("tracks", []))
-
     return (
         jsonify(
             {
@@ -228,8 +405,11 @@ def insert_gps_track():
                 "source": "local",
                 "preview": {
                     "metadata": parsed_preview.get("metadata", {}),
-                    "track_count": preview_track_count,
-                    "point_count": preview_point_count,
+                    "track_count": summary["track_count"],
+                    "point_count": summary["point_count"],
+                    "start_time": summary["start_time"],
+                    "end_time": summary["end_time"],
+                    "distance_m": summary["distance_m"],
                 },
             }
         ),
@@ -237,3 +417,26 @@ def insert_gps_track():
     )
 
 
+@bp.route("/api/gps-tracks/archive", methods=["POST"])
+def insert_gps_track_archive():
+    """
+    Bulk upload: a zip or tar archive of GPX files as "file". Parsing and storing is left to a
+    job (see track_ingest_service); returns 202 with the job id. The job result reports each
+    file as stored, duplicate (already stored) or failed.
+    """
+    uploaded_file = request.files.get("file")
+    if not uploaded_file or uploaded_file.filename == "":
+        return jsonify({"error": "A zip or tar archive of GPX files is required"}), 400
+
+    archive_bytes = uploaded_file.read()
+    if not archive_bytes:
+        return jsonify({"error": "Uploaded archive is empty"}), 400
+
+    db = get_db()
+    job_id = job_service.submit_job(
+        db,
+        g.username,
+        job_service.JOB_KIND_INGEST_GPX_ARCHIVE,
+        input_data=archive_bytes,
+    )
+    return jsonify({"job_id": job_id, "status_url": f"/api/jobs/{job_id}"}), 202
@@ -5,9 +5,11 @@ from flask_cors import CORS
 
 from bergenomap.api.admin import bp as admin_bp
 from bergenomap.api.auth import bp as auth_bp
+from bergenomap.api.jobs import bp as jobs_bp
 from bergenomap.api.maps import bp as maps_bp
 from bergenomap.api.stored_points import bp as stored_points_bp
 from bergenomap.api.strava import bp as strava_bp
+from bergenomap.api.tiles import bp as tiles_bp
 from bergenomap.api.tracks import bp as tracks_bp
 from bergenomap.repositories.db import close_db
 
@@ -24,9 +26,11 @@ def create_app() -> Flask:
     # Register API surface (paths must stay stable).
     app.register_blueprint(auth_bp)
     app.register_blueprint(maps_bp)
+    app.register_blueprint(tiles_bp)
     app.register_blueprint(tracks_bp)
     app.register_blueprint(stored_points_bp)
     app.register_blueprint(strava_bp)
+    app.register_blueprint(jobs_bp)
     app.register_blueprint(admin_bp)
 
     # DB lifecycle
@@ -11,11 +11,120 @@ class Settings:
     # Default overlay path for /api/transform when no path is provided.
     default_overlay_path: str = "../maps/floyen-2-cropped.png"
 
+    # Border + rotation of uploaded maps (bergenomap/services/image_service.py): resampling filter
+    # ("nearest", "bilinear" or "bicubic"), threads, and the size of the square tiles rendered
+    # at a time, row by row.
+    image_transform_resample: str = "nearest"
+    image_transform_threads: int = 2
+    image_transform_tile_size: int = 512
+
+    # Encoding of stored map images and of the /api/processDroppedImage preview, one of
+    # image_service.ENCODING_PROFILES: "png", "webp_lossless", "webp" (lossy, at image_webp_quality)
+    # or "avif" (at image_avif_quality). The uploaded file itself is stored as the original only
+    # when the upload asks for it (keep_original_format).
+    map_final_encoding: str = "webp"
+    map_original_encoding: str = "webp_lossless"
+    dropped_image_encoding: str = "webp"
+    image_webp_quality: int = 90
+    # libwebp effort, 0 (fastest) to 6 (smallest).
+    image_webp_method: int = 4
+    image_avif_quality: int = 60
+
     # Export locations (used by /api/dal/export_database)
     database_export_js_output_dir: str = "../aws-package/js"
     database_export_final_maps_output_dir: str = "../aws-package/map-files"
     database_export_original_maps_output_dir: str = "../maps/registered_maps_originals"
 
+    # SQLite connection settings, applied to every connection (see `open_connection` in Database.py).
+    # WAL lets readers continue while a large map blob is being written.
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_cache_size_kib: int = 64 * 1024
+    sqlite_mmap_size_bytes: int = 256 * 1024 * 1024
+
+    # In-process session cache used by check_authentication. Entries are re-validated against
+    # the DB after session_cache_ttl_s, which bounds how long a logout in another worker goes unseen.
+    session_cache_max_entries: int = 10000
+    session_cache_ttl_s: float = 60.0
+    session_sweep_interval_s: float = 60 * 60
+
+    # Robust (mode="robust") map registration in /api/getOverlayCoordinates.
+    # Control points further than this from the consensus fit are treated as mis-clicks.
+    registration_inlier_threshold_m: float = 10.0
+    registration_max_hypotheses: int = 5000
+
+    # Upper bound on explicit points per /api/maps/<id>/project request.
+    projection_max_points: int = 500_000
+
+    # Parsed-track cache for /api/gps-tracks/<username>/<track_id> (per worker process),
+    # bounded by the size of the cached JSON.
+    track_cache_max_bytes: int = 64 * 1024 * 1024
+    # Read size when streaming a stored GPX file (/api/gps-tracks/<username>/<track_id>/gpx).
+    gpx_download_chunk_bytes: int = 64 * 1024
+    # Strava tracks without a stored GPX file, exported as GPX for download: one file per
+    # activity and version of its track data, removed when the import is deleted or replaced.
+    gpx_export_cache_dir: str = "../data/gpx_exports"
+
+    # Levels of detail stored per track (bergenomap/utils/simplify.py), finest first; level n is
+    # the track simplified with Douglas-Peucker at track_lod_tolerances_m[n] meters. Changing
+    # the tolerances affects newly stored tracks only. A request for zoom z gets the coarsest
+    # level within track_lod_pixel_tolerance pixels at that zoom.
+    track_lod_tolerances_m: tuple = (2.0, 8.0, 32.0, 128.0, 512.0)
+    track_lod_pixel_tolerance: float = 1.0
+
+    # Bulk GPX archive upload (bergenomap/services/track_ingest_service.py). Files are parsed in
+    # a pool of track_ingest_workers processes (0 parses inline) and stored in one transaction per
+    # track_ingest_batch_size tracks. Larger files are reported as failed; more files reject the archive.
+    track_ingest_workers: int = 4
+    track_ingest_batch_size: int = 100
+    track_ingest_max_files: int = 20000
+    track_ingest_max_file_bytes: int = 64 * 1024 * 1024
+
+    # Background jobs (bergenomap/services/job_service.py), e.g. storing a newly registered map.
+    # Each web worker owns a process pool of job_workers; 0 runs jobs inline in the request.
+    job_workers: int = 2
+    job_start_method: str = "spawn"
+    # A running job without a progress update for this long is assumed to have lost its worker.
+    job_stale_after_s: float = 15 * 60
+    # How often each web worker requeues stale jobs and dispatches queued ones.
+    job_sweep_interval_s: float = 60
+    job_max_attempts: int = 2
+    job_retention_s: float = 7 * 24 * 60 * 60
+
+    # Activities fetched from Strava in parallel by /api/strava/import. Strava's quotas are
+    # enforced client-side (bergenomap/integrations/strava_rate_limit.py), not by this number.
+    strava_import_workers: int = 4
+    # Imported activities are written in one transaction per this many (one disk sync per batch).
+    strava_import_commit_batch: int = 25
+    # Keep-alive connection pool shared by all Strava API calls in a worker process
+    # (should be at least strava_import_workers). Connect retries cover failures before
+    # a request reaches Strava; 429/5xx are retried by StravaClient itself.
+    strava_http_pool_size: int = 8
+    strava_http_connect_retries: int = 3
+    strava_http_gzip: bool = True
+
+    # Content-addressed file store for map images (bergenomap/repositories/blob_store.py).
+    blob_store_dir: str = "../data/blobs"
+    # Unreferenced blobs younger than this are kept by the blob GC: a map being stored right
+    # now has written its blobs but not yet committed the rows that refer to them.
+    blob_gc_min_age_s: float = 60 * 60
+    # Browser cache lifetime of map images requested by content digest (/api/dal/mapfile/...?v=).
+    mapfile_cache_max_age_s: int = 365 * 24 * 60 * 60
+
+    # XYZ tile pyramid for registered maps (/api/tiles/...). Tiles are rendered lazily
+    # from the stored final map image and cached on disk under tile_cache_dir/<map_id>/<digest>/.
+    # tile_cache_max_age_s is the browser cache lifetime of tiles requested with ?v=<digest>.
+    tile_cache_dir: str = "../data/tiles"
+    tile_size: int = 256
+    tile_min_zoom: int = 8
+    tile_max_zoom: int = 22
+    tile_webp_quality: int = 80
+    tile_cache_max_age_s: int = 24 * 60 * 60
+
+    # Number of decoded final map images kept in memory for tile rendering.
+    tile_source_cache_size: int = 2
+
 
 settings = Settings()
 
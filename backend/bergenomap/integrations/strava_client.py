@@ -8,11 +8,27 @@ Rules:
 - keep orchestration in a service (see `bergenomap/services/strava_sync_service.py`)
 """
 
+import os
+import random
+import re
+import threading
+import time
 from dataclasses import dataclass
 from typing import Any, Dict, Optional
-from urllib.parse import urlencode
+from urllib.parse import urlencode, urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from bergenomap.config import settings
+
+from bergenomap.integrations.strava_rate_limit import (
+    StravaRateLimiter,
+    StravaRateLimitExceeded,
+    parse_rate_limit_headers,
+    strava_rate_limiter,
+)
 
 
 class StravaApiError(RuntimeError):
@@ -31,13 +47,130 @@ class StravaTokens:
     athlete_id: int | None = None
 
 
+class StravaHttpStats:
+    """
+    Per-endpoint call counters (count, errors, retries, time, bytes). Thread-safe.
+    Endpoints are URL paths with numeric ids replaced, e.g. "/api/v3/activities/{id}/streams".
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, Dict[str, float]] = {}
+
+    def record(
+        self,
+        url: str,
+        *,
+        elapsed_s: float,
+        status_code: int | None,
+        body_bytes: int,
+        wire_bytes: int,
+        retry: bool,
+    ) -> None:
+        endpoint = _endpoint_label(url)
+        with self._lock:
+            entry = self._endpoints.setdefault(
+                endpoint,
+                {"calls": 0, "errors": 0, "retries": 0, "time_s": 0.0, "max_time_s": 0.0, "body_bytes": 0, "wire_bytes": 0},
+            )
+            entry["calls"] += 1
+            if status_code is None or status_code >= 400:
+                entry["errors"] += 1
+            if retry:
+                entry["retries"] += 1
+            entry["time_s"] += elapsed_s
+            entry["max_time_s"] = max(entry["max_time_s"], elapsed_s)
+            entry["body_bytes"] += body_bytes
+            entry["wire_bytes"] += wire_bytes
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            endpoints = {name: dict(entry) for name, entry in self._endpoints.items()}
+        for entry in endpoints.values():
+            entry["mean_time_s"] = entry["time_s"] / entry["calls"] if entry["calls"] else None
+        return endpoints
+
+    def reset(self) -> None:
+        with self._lock:
+            self._endpoints.clear()
+
+
+strava_http_stats = StravaHttpStats()
+
+_session_lock = threading.Lock()
+_session: requests.Session | None = None
+_session_pid: int | None = None
+
+
+def get_shared_session() -> requests.Session:
+    """
+    Keep-alive session shared by all StravaClient instances in this process, so consecutive
+    calls to www.strava.com reuse pooled connections instead of a new TCP+TLS handshake each.
+    Created per process: a forked gunicorn worker must not reuse its parent's sockets.
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is not None and _session_pid == pid:
+        return _session
+    with _session_lock:
+        if _session is None or _session_pid != pid:
+            _session = _build_session()
+            _session_pid = pid
+    return _session
+
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    # Only failures before the request reached Strava are retried here. Status retries
+    # (429/5xx) are done by StravaClient so that they go through the rate limiter.
+    retry = Retry(
+        total=settings.strava_http_connect_retries,
+        connect=settings.strava_http_connect_retries,
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=0.5,
+        allowed_methods=None,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings.strava_http_pool_size,
+        max_retries=retry,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Accept-Encoding"] = "gzip, deflate" if settings.strava_http_gzip else "identity"
+    return session
+
+
 class StravaClient:
     AUTHORIZE_URL = "https://www.strava.com/oauth/authorize"
     TOKEN_URL = "https://www.strava.com/oauth/token"
     API_BASE = "https://www.strava.com/api/v3"
 
-    def __init__(self, *, timeout_s: float = 20.0) -> None:
+    def __init__(
+        self,
+        *,
+        timeout_s: float = 20.0,
+        rate_limiter: StravaRateLimiter | None = None,
+        rate_limit_max_wait_s: float = 60.0,
+        max_retries: int = 3,
+        retry_backoff_s: float = 1.0,
+        session: requests.Session | None = None,
+        stats: StravaHttpStats | None = None,
+    ) -> None:
+        """
+        API requests wait for the shared rate limiter (at most rate_limit_max_wait_s) and are
+        retried up to max_retries times on 429, 5xx and network errors, with exponential backoff.
+        By default all clients share one pooled session and one set of counters.
+        """
         self._timeout_s = timeout_s
+        self._session = session or get_shared_session()
+        self._stats = stats or strava_http_stats
+        self._rate_limiter = rate_limiter or strava_rate_limiter
+        self._rate_limit_max_wait_s = rate_limit_max_wait_s
+        self._max_retries = max_retries
+        self._retry_backoff_s = retry_backoff_s
 
     def build_authorize_url(
         self,
@@ -132,19 +265,88 @@ class StravaClient:
 
     def _get_json(self, url: str, *, access_token: str, params: Optional[dict] = None) -> Any:
         headers = {"Authorization": f"Bearer {access_token}"}
-        try:
-            response = requests.get(url, headers=headers, params=params, timeout=self._timeout_s)
-        except requests.RequestException as exc:
-            raise StravaApiError(f"Strava request failed: {exc}") from exc
-        return _handle_json_response(response)
+        attempt = 0
+        while True:
+            try:
+                self._rate_limiter.acquire(max_wait_s=self._rate_limit_max_wait_s)
+            except StravaRateLimitExceeded as exc:
+                raise StravaApiError(str(exc), status_code=429) from exc
+
+            status = None
+            try:
+                response = self._request("GET", url, retry=attempt > 0, headers=headers, params=params)
+                status = parse_rate_limit_headers(response.headers)
+            except requests.RequestException as exc:
+                error = StravaApiError(f"Strava request failed: {exc}")
+                response = None
+            finally:
+                self._rate_limiter.complete(status)
+
+            if response is not None:
+                if response.status_code < 400 or not _is_retryable(response.status_code):
+                    return _handle_json_response(response)
+                if response.status_code == 429 and status is None:
+                    # Over quota without usage headers: the next acquire waits for the window to reset.
+                    # With headers, complete() has already set the remaining quota.
+                    self._rate_limiter.exhaust_short_window()
+                try:
+                    _handle_json_response(response)
+                except StravaApiError as exc:
+                    error = exc
+
+            if attempt >= self._max_retries:
+                raise error
+            time.sleep(self._retry_backoff_s * (2 ** attempt) * (0.5 + random.random()))
+            attempt += 1
 
     def _post_json(self, url: str, payload: dict) -> Any:
         try:
-            response = requests.post(url, data=payload, timeout=self._timeout_s)
+            response = self._request("POST", url, data=payload)
         except requests.RequestException as exc:
             raise StravaApiError(f"Strava request failed: {exc}") from exc
         return _handle_json_response(response)
 
+    def _request(self, method: str, url: str, *, retry: bool = False, **kwargs: Any) -> requests.Response:
+        started = time.perf_counter()
+        response = None
+        # Set before the try: reading the body can raise too (e.g. a read timeout), and the
+        # finally block must not mask that error.
+        body_bytes = None
+        try:
+            response = self._session.request(method, url, timeout=self._timeout_s, **kwargs)
+            # Read the body inside the timing so the counters include the transfer.
+            body_bytes = len(response.content)
+            return response
+        finally:
+            elapsed_s = time.perf_counter() - started
+            if response is None or body_bytes is None:
+                # Counted as a failed call, like a connection error.
+                self._stats.record(url, elapsed_s=elapsed_s, status_code=None, body_bytes=0, wire_bytes=0, retry=retry)
+            else:
+                self._stats.record(
+                    url,
+                    elapsed_s=elapsed_s,
+                    status_code=response.status_code,
+                    body_bytes=body_bytes,
+                    wire_bytes=_int_header(response.headers.get("Content-Length"), default=body_bytes),
+                    retry=retry,
+                )
+
+
+def _endpoint_label(url: str) -> str:
+    return re.sub(r"/\d+(?=/|$)", "/{id}", urlsplit(url).path)
+
+
+def _int_header(value: str | None, *, default: int) -> int:
+    try:
+        return int(value) if value is not None else default
+    except ValueError:
+        return default
+
+
+def _is_retryable(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
 
 def _handle_json_response(response: requests.Response) -> Any:
     try:
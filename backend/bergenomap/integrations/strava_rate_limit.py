@@ -0,0 +1,188 @@
+"""
+Client-side limiter for Strava's API quotas.
+
+Strava enforces two fixed windows per application: a 15-minute window starting on the
+quarter hour and a daily window starting at midnight UTC, each for all requests and
+(tighter) for read requests. Every response reports limits and usage in headers:
+
+    X-RateLimit-Limit: 200,2000         X-ReadRateLimit-Limit: 100,1000
+    X-RateLimit-Usage: 31,870           X-ReadRateLimit-Usage: 25,410
+
+The limiter is a token bucket per window that refills when the window rolls over. Headers
+from each response replace the local estimate, so several processes sharing one Strava
+application stay roughly in step.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Mapping, Optional
+
+SHORT_WINDOW_S = 15 * 60
+DAILY_WINDOW_S = 24 * 60 * 60
+
+# Strava's default read quotas, used until the first response tells us the real ones.
+DEFAULT_SHORT_LIMIT = 100
+DEFAULT_DAILY_LIMIT = 1000
+
+
+class StravaRateLimitExceeded(RuntimeError):
+    def __init__(self, message: str, *, retry_at: float):
+        super().__init__(message)
+        self.retry_at = retry_at
+
+
+@dataclass(frozen=True)
+class RateLimitStatus:
+    short_limit: int
+    short_usage: int
+    daily_limit: int
+    daily_usage: int
+
+
+def parse_rate_limit_headers(headers: Mapping[str, str]) -> Optional[RateLimitStatus]:
+    """
+    The binding quota from a Strava response: per window, whichever of the overall and the
+    read quota has fewer requests left. None if the response carries no rate limit headers.
+    """
+    statuses = []
+    for prefix in ("X-RateLimit", "X-ReadRateLimit"):
+        limits = _parse_pair(headers.get(f"{prefix}-Limit"))
+        usage = _parse_pair(headers.get(f"{prefix}-Usage"))
+        if limits and usage:
+            statuses.append((limits, usage))
+    if not statuses:
+        return None
+
+    short_limit, short_usage = min(((l[0], u[0]) for l, u in statuses), key=lambda p: p[0] - p[1])
+    daily_limit, daily_usage = min(((l[1], u[1]) for l, u in statuses), key=lambda p: p[0] - p[1])
+    return RateLimitStatus(
+        short_limit=short_limit,
+        short_usage=short_usage,
+        daily_limit=daily_limit,
+        daily_usage=daily_usage,
+    )
+
+
+class _QuotaWindow:
+    def __init__(self, limit: int, period_s: int, now: float) -> None:
+        self.limit = limit
+        self.period_s = period_s
+        self.tokens = limit
+        self.resets_at = _next_boundary(now, period_s)
+
+    def roll(self, now: float) -> None:
+        if now >= self.resets_at:
+            self.tokens = self.limit
+            self.resets_at = _next_boundary(now, self.period_s)
+
+
+class StravaRateLimiter:
+    """
+    Thread-safe. `acquire` before each API request, `complete` after it (with the parsed
+    headers, or None if the request failed without a response).
+    """
+
+    def __init__(
+        self,
+        *,
+        short_limit: int = DEFAULT_SHORT_LIMIT,
+        daily_limit: int = DEFAULT_DAILY_LIMIT,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self._clock = clock
+        now = clock()
+        self._short = _QuotaWindow(short_limit, SHORT_WINDOW_S, now)
+        self._daily = _QuotaWindow(daily_limit, DAILY_WINDOW_S, now)
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self.waits = 0
+        self.wait_time_s = 0.0
+
+    def acquire(self, *, max_wait_s: float) -> None:
+        """
+        Take one request from both windows, waiting for a window to reset if needed.
+        Raises StravaRateLimitExceeded if that would take longer than max_wait_s.
+        """
+        with self._condition:
+            while True:
+                now = self._clock()
+                self._short.roll(now)
+                self._daily.roll(now)
+                if self._short.tokens > 0 and self._daily.tokens > 0:
+                    self._short.tokens -= 1
+                    self._daily.tokens -= 1
+                    self._in_flight += 1
+                    return
+
+                retry_at = max(
+                    self._short.resets_at if self._short.tokens <= 0 else now,
+                    self._daily.resets_at if self._daily.tokens <= 0 else now,
+                )
+                wait_s = retry_at - now
+                if wait_s > max_wait_s:
+                    raise StravaRateLimitExceeded(
+                        f"Strava rate limit reached; requests are allowed again in {math.ceil(wait_s / 60)} min",
+                        retry_at=retry_at,
+                    )
+                self.waits += 1
+                self.wait_time_s += wait_s
+                self._condition.wait(timeout=wait_s)
+
+    def complete(self, status: Optional[RateLimitStatus]) -> None:
+        with self._condition:
+            self._in_flight = max(self._in_flight - 1, 0)
+            if status is not None:
+                self._short.limit = status.short_limit
+                self._daily.limit = status.daily_limit
+                # Usage reported by Strava is authoritative; requests still in flight are not in it yet.
+                self._short.tokens = status.short_limit - status.short_usage - self._in_flight
+                self._daily.tokens = status.daily_limit - status.daily_usage - self._in_flight
+            self._condition.notify_all()
+
+    def exhaust_short_window(self) -> None:
+        """
+        After a 429: make further requests wait for the next 15-minute window.
+        """
+        with self._condition:
+            self._short.tokens = min(self._short.tokens, 0)
+
+    def snapshot(self) -> dict:
+        with self._condition:
+            now = self._clock()
+            self._short.roll(now)
+            self._daily.roll(now)
+            return {
+                "short_limit": self._short.limit,
+                "short_remaining": self._short.tokens,
+                "short_resets_in_s": self._short.resets_at - now,
+                "daily_limit": self._daily.limit,
+                "daily_remaining": self._daily.tokens,
+                "daily_resets_in_s": self._daily.resets_at - now,
+                "in_flight": self._in_flight,
+                "waits": self.waits,
+                "wait_time_s": self.wait_time_s,
+            }
+
+
+def _next_boundary(now: float, period_s: int) -> float:
+    return (math.floor(now / period_s) + 1) * period_s
+
+
+def _parse_pair(value: Optional[str]) -> Optional[tuple[int, int]]:
+    if not value:
+        return None
+    parts = value.split(",")
+    if len(parts) != 2:
+        return None
+    try:
+        return int(parts[0].strip()), int(parts[1].strip())
+    except ValueError:
+        return None
+
+
+# Quotas belong to the Strava application, so every client in the process shares one limiter.
+strava_rate_limiter = StravaRateLimiter()
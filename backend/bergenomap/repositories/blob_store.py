@@ -0,0 +1,111 @@
+"""
+Content-addressed file store for large binary data (map images).
+
+A blob is stored once, as settings.blob_store_dir/<aa>/<bb>/<sha256>, where aa and bb are the
+first two byte pairs of its hex SHA-256; storing the same bytes again is a no-op. Rows in the
+database keep only the digest. Files are written to a temp file and renamed, so readers never
+see a partial blob, and are never modified afterwards.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Set
+
+from bergenomap.config import settings
+
+
+def blob_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+# A relative settings.blob_store_dir is relative to backend/ (the server's working directory),
+# so that scripts run from elsewhere find the same files.
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _root() -> str:
+    # Absolute, since Flask's send_file resolves relative paths against the app root, not the CWD.
+    return os.path.normpath(os.path.join(_BACKEND_DIR, settings.blob_store_dir))
+
+
+def blob_path(digest: str) -> str:
+    """
+    Absolute path of a blob (whether or not it exists).
+    """
+    return os.path.join(_root(), digest[:2], digest[2:4], digest)
+
+
+def put_blob(data: bytes) -> str:
+    """
+    Store data and return its digest.
+    """
+    digest = blob_digest(data)
+    path = blob_path(digest)
+    if os.path.exists(path):
+        # Touch it, so delete_unreferenced_blobs does not take it for an old orphan before the
+        # row that now refers to it is committed.
+        os.utime(path)
+        return digest
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return digest
+
+
+def has_blob(digest: str) -> bool:
+    return os.path.exists(blob_path(digest))
+
+
+def read_blob(digest: str) -> bytes:
+    """
+    The blob's bytes; raises FileNotFoundError if it is missing.
+    """
+    with open(blob_path(digest), "rb") as f:
+        return f.read()
+
+
+@contextmanager
+def open_blob_mmap(digest: str) -> Iterator[mmap.mmap]:
+    """
+    The blob memory-mapped read-only. The mapping is file-like (read/seek/tell), so e.g.
+    PIL can decode from it without copying the file into Python memory first.
+    """
+    with open(blob_path(digest), "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield mapped
+    finally:
+        mapped.close()
+
+
+def delete_unreferenced_blobs(referenced: Set[str], *, min_age_s: float) -> int:
+    """
+    Delete blobs whose digest is not in `referenced`, and temp files left by interrupted writes.
+    Files modified in the last min_age_s are kept: a blob is stored before the row that refers
+    to it is committed. Returns the number of files deleted.
+    """
+    cutoff = time.time() - min_age_s
+    deleted = 0
+    for dirpath, _, filenames in os.walk(_root()):
+        for name in filenames:
+            if name in referenced:
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                if os.path.getmtime(path) > cutoff:
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            deleted += 1
+    return deleted
@@ -7,7 +7,8 @@ from Database import Database
 
 def get_db() -> Database:
     if "db" not in g:
-        g.db = Database()
+        # Pooled: reuse this worker's connection instead of reconnecting per request.
+        g.db = Database(pooled=True)
     return g.db
 
 
@@ -24,6 +24,6 @@ def kv_set(db: Database, key: str, value: str) -> None:
     ON CONFLICT(key) DO UPDATE SET value = excluded.value
     """
     db.cursor.execute(insert_sql, (key, value))
-    db.connection.commit()
+    db.commit()
 
 
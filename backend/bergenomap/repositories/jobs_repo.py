@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List
+
+from Database import Database
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+
+_JOB_SELECT_COLUMNS = """
+    job_id, username, kind, status, progress, message, params, result, error, attempts,
+    created_at, updated_at, started_at, finished_at
+"""
+
+
+def create_job(
+    db: Database,
+    *,
+    job_id: str,
+    username: str,
+    kind: str,
+    params: Dict[str, Any] | None = None,
+    input_data: bytes | None = None,
+) -> None:
+    insert_sql = """
+    INSERT INTO jobs (job_id, username, kind, status, params, input_data)
+    VALUES (?, ?, ?, ?, ?, ?)
+    """
+    db.cursor.execute(
+        insert_sql,
+        (job_id, username, kind, STATUS_QUEUED, json.dumps(params) if params is not None else None, input_data),
+    )
+    db.commit()
+
+
+def _job_row_to_dict(row: tuple) -> Dict[str, Any]:
+    (
+        job_id,
+        username,
+        kind,
+        status,
+        progress,
+        message,
+        params,
+        result,
+        error,
+        attempts,
+        created_at,
+        updated_at,
+        started_at,
+        finished_at,
+    ) = row
+    return {
+        "job_id": job_id,
+        "username": username,
+        "kind": kind,
+        "status": status,
+        "progress": progress,
+        "message": message,
+        "params": json.loads(params) if params else None,
+        "result": json.loads(result) if result else None,
+        "error": error,
+        "attempts": attempts,
+        "created_at": created_at,
+        "updated_at": updated_at,
+        "started_at": started_at,
+        "finished_at": finished_at,
+    }
+
+
+def get_job(db: Database, job_id: str, *, username: str | None = None) -> Dict[str, Any] | None:
+    if username is None:
+        db.cursor.execute(f"SELECT {_JOB_SELECT_COLUMNS} FROM jobs WHERE job_id = ? LIMIT 1", (job_id,))
+    else:
+        db.cursor.execute(
+            f"SELECT {_JOB_SELECT_COLUMNS} FROM jobs WHERE job_id = ? AND username = ? LIMIT 1",
+            (job_id, username),
+        )
+    row = db.cursor.fetchone()
+    return _job_row_to_dict(row) if row else None
+
+
+def list_jobs(db: Database, username: str, *, limit: int = 50) -> List[Dict[str, Any]]:
+    db.cursor.execute(
+        f"SELECT {_JOB_SELECT_COLUMNS} FROM jobs WHERE username = ? ORDER BY created_at DESC, rowid DESC LIMIT ?",
+        (username, int(limit)),
+    )
+    return [_job_row_to_dict(row) for row in db.cursor.fetchall()]
+
+
+def list_queued_job_ids(db: Database) -> List[str]:
+    select_sql = """
+    SELECT job_id
+    FROM jobs
+    WHERE status = ?
+    ORDER BY created_at, rowid
+    """
+    db.cursor.execute(select_sql, (STATUS_QUEUED,))
+    return [row[0] for row in db.cursor.fetchall()]
+
+
+def claim_job(db: Database, job_id: str) -> bool:
+    """
+    Atomically move a queued job to running. False if another worker got it first.
+    """
+    update_sql = """
+    UPDATE jobs
+    SET status = ?, attempts = attempts + 1, started_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+    WHERE job_id = ? AND status = ?
+    """
+    db.cursor.execute(update_sql, (STATUS_RUNNING, job_id, STATUS_QUEUED))
+    db.commit()
+    return db.cursor.rowcount == 1
+
+
+def get_job_input(db: Database, job_id: str) -> bytes | None:
+    db.cursor.execute("SELECT input_data FROM jobs WHERE job_id = ? LIMIT 1", (job_id,))
+    row = db.cursor.fetchone()
+    return row[0] if row else None
+
+
+def update_job_progress(db: Database, job_id: str, progress: float, message: str | None = None) -> None:
+    update_sql = """
+    UPDATE jobs
+    SET progress = ?, message = ?, updated_at = CURRENT_TIMESTAMP
+    WHERE job_id = ? AND status = ?
+    """
+    db.cursor.execute(update_sql, (float(progress), message, job_id, STATUS_RUNNING))
+    db.commit()
+
+
+def mark_job_succeeded(db: Database, job_id: str, result: Dict[str, Any]) -> None:
+    update_sql = """
+    UPDATE jobs
+    SET status = ?, progress = 1, message = NULL, result = ?, error = NULL, input_data = NULL,
+        updated_at = CURRENT_TIMESTAMP, finished_at = CURRENT_TIMESTAMP
+    WHERE job_id = ?
+    """
+    db.cursor.execute(update_sql, (STATUS_SUCCEEDED, json.dumps(result), job_id))
+    db.commit()
+
+
+def mark_job_failed(db: Database, job_id: str, error: str) -> None:
+    update_sql = """
+    UPDATE jobs
+    SET status = ?, error = ?, input_data = NULL,
+        updated_at = CURRENT_TIMESTAMP, finished_at = CURRENT_TIMESTAMP
+    WHERE job_id = ?
+    """
+    db.cursor.execute(update_sql, (STATUS_FAILED, error, job_id))
+    db.commit()
+
+
+def requeue_stale_jobs(db: Database, *, stale_after_s: float, max_attempts: int) -> int:
+    """
+    Running jobs without a progress update for stale_after_s belonged to a worker that died.
+    Requeue them, or fail them once they have used up max_attempts. Returns requeued count.
+    """
+    cutoff = f"-{int(stale_after_s)} seconds"
+    fail_sql = """
+    UPDATE jobs
+    SET status = ?, error = 'Worker stopped while running the job', input_data = NULL,
+        updated_at = CURRENT_TIMESTAMP, finished_at = CURRENT_TIMESTAMP
+    WHERE status = ? AND updated_at < datetime('now', ?) AND attempts >= ?
+    """
+    db.cursor.execute(fail_sql, (STATUS_FAILED, STATUS_RUNNING, cutoff, int(max_attempts)))
+    requeue_sql = """
+    UPDATE jobs
+    SET status = ?, progress = 0, message = NULL, updated_at = CURRENT_TIMESTAMP
+    WHERE status = ? AND updated_at < datetime('now', ?)
+    """
+    db.cursor.execute(requeue_sql, (STATUS_QUEUED, STATUS_RUNNING, cutoff))
+    requeued = db.cursor.rowcount
+    db.commit()
+    return requeued
+
+
+def release_job(db: Database, job_id: str, *, error: str, max_attempts: int) -> str | None:
+    """
+    Take back a running job whose worker is gone: requeue it, or fail it with `error` once it
+    has used up max_attempts. Returns the job's status afterwards (None if it does not exist).
+    """
+    fail_sql = """
+    UPDATE jobs
+    SET status = ?, error = ?, input_data = NULL,
+        updated_at = CURRENT_TIMESTAMP, finished_at = CURRENT_TIMESTAMP
+    WHERE job_id = ? AND status = ? AND attempts >= ?
+    """
+    db.cursor.execute(fail_sql, (STATUS_FAILED, error, job_id, STATUS_RUNNING, int(max_attempts)))
+    requeue_sql = """
+    UPDATE jobs
+    SET status = ?, progress = 0, message = NULL, updated_at = CURRENT_TIMESTAMP
+    WHERE job_id = ? AND status = ?
+    """
+    db.cursor.execute(requeue_sql, (STATUS_QUEUED, job_id, STATUS_RUNNING))
+    db.commit()
+    db.cursor.execute("SELECT status FROM jobs WHERE job_id = ? LIMIT 1", (job_id,))
+    row = db.cursor.fetchone()
+    return row[0] if row else None
+
+
+def delete_finished_jobs(db: Database, *, older_than_s: float) -> int:
+    delete_sql = """
+    DELETE FROM jobs
+    WHERE status IN (?, ?) AND finished_at < datetime('now', ?)
+    """
+    db.cursor.execute(delete_sql, (STATUS_SUCCEEDED, STATUS_FAILED, f"-{int(older_than_s)} seconds"))
+    db.commit()
+    return db.cursor.rowcount
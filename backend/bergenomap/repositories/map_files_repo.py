@@ -2,27 +2,34 @@ from __future__ import annotations
 
 from Database import Database
 
-from bergenomap.repositories import maps_repo
+from bergenomap.repositories import blob_store, maps_repo
+
+# Map images live in the blob store; map_files holds their digests (see migration 023).
+# (legacy BLOB column, digest column) per image kind.
+_ORIGINAL = ("mapfile_original", "original_sha256")
+_FINAL = ("mapfile_final", "final_sha256")
 
 
 def insert_original(db: Database, map_id: int, mapfile_original: bytes) -> None:
-    insert_sql = """
-    INSERT INTO map_files (map_id, mapfile_original)
-    VALUES (?, ?)
-    ON CONFLICT(map_id) DO UPDATE SET mapfile_original = excluded.mapfile_original
-    """
-    db.cursor.execute(insert_sql, (map_id, mapfile_original))
-    db.connection.commit()
+    _insert(db, map_id, _ORIGINAL, mapfile_original)
 
 
 def insert_final(db: Database, map_id: int, mapfile_final: bytes) -> None:
-    insert_sql = """
-    INSERT INTO map_files (map_id, mapfile_final)
+    _insert(db, map_id, _FINAL, mapfile_final)
+
+
+def _insert(db: Database, map_id: int, columns: tuple[str, str], data: bytes) -> None:
+    blob_column, digest_column = columns
+    digest = blob_store.put_blob(data)
+    insert_sql = f"""
+    INSERT INTO map_files (map_id, {digest_column})
     VALUES (?, ?)
-    ON CONFLICT(map_id) DO UPDATE SET mapfile_final = excluded.mapfile_final
+    ON CONFLICT(map_id) DO UPDATE SET {digest_column} = excluded.{digest_column}, {blob_column} = NULL
     """
-    db.cursor.execute(insert_sql, (map_id, mapfile_final))
-    db.connection.commit()
+    db.cursor.execute(insert_sql, (map_id, digest))
+    # Map listings carry the digests.
+    maps_repo.bump_maps_version(db)
+    db.commit()
 
 
 def get_original_by_name(db: Database, username: str, map_name: str) -> bytes | None:
@@ -40,24 +47,144 @@ def get_final_by_name(db: Database, username: str, map_name: str) -> bytes | Non
 
 
 def get_original_by_id(db: Database, map_id: int) -> bytes | None:
+    digest = get_original_digest(db, map_id)
+    return blob_store.read_blob(digest) if digest else None
+
+
+def get_final_by_id(db: Database, map_id: int) -> bytes | None:
+    digest = get_final_digest(db, map_id)
+    return blob_store.read_blob(digest) if digest else None
+
+
+def get_original_digest_by_name(db: Database, username: str, map_name: str) -> str | None:
+    map_id = maps_repo.get_map_id_by_name(db, map_name, username=username)
+    if map_id is None:
+        return None
+    return get_original_digest(db, map_id)
+
+
+def get_final_digest_by_name(db: Database, username: str, map_name: str) -> str | None:
+    map_id = maps_repo.get_map_id_by_name(db, map_name, username=username)
+    if map_id is None:
+        return None
+    return get_final_digest(db, map_id)
+
+
+def existing_blob_path(digest: str) -> str | None:
+    """
+    Path of a stored image, for serving it without reading it into memory; None if the blob is missing.
+    """
+    path = blob_store.blob_path(digest)
+    if not blob_store.has_blob(digest):
+        print(f"Blob {digest} is referenced by map_files but missing from {path}.")
+        return None
+    return path
+
+
+def list_digests(db: Database, username: str) -> dict[int, dict[str, str | None]]:
+    """
+    {map_id: {"original_sha256": ..., "final_sha256": ...}} for the user's maps with stored images.
+    Digests of images not yet moved out of the legacy BLOB columns are None.
+    """
     select_sql = """
-    SELECT mapfile_original
+    SELECT map_files.map_id, map_files.original_sha256, map_files.final_sha256
     FROM map_files
-    WHERE map_id = ?
+    JOIN maps ON maps.map_id = map_files.map_id
+    WHERE maps.username = ?
     """
-    db.cursor.execute(select_sql, (map_id,))
-    result = db.cursor.fetchone()
-    return result[0] if result else None
+    db.cursor.execute(select_sql, (username,))
+    return {
+        int(map_id): {"original_sha256": original, "final_sha256": final}
+        for map_id, original, final in db.cursor.fetchall()
+    }
 
 
-def get_final_by_id(db: Database, map_id: int) -> bytes | None:
-    select_sql = """
-    SELECT mapfile_final
+def list_referenced_digests(db: Database) -> set[str]:
+    """
+    Digests of every image of every map, i.e. the blobs that must be kept.
+    """
+    db.cursor.execute("SELECT original_sha256, final_sha256 FROM map_files")
+    return {digest for row in db.cursor.fetchall() for digest in row if digest}
+
+
+def delete_all_originals(db: Database) -> int:
+    """
+    Drop the original image of every map (their blobs are left for delete_unreferenced_blobs).
+    Returns the number of maps changed.
+    """
+    update_sql = """
+    UPDATE map_files
+    SET original_sha256 = NULL, mapfile_original = NULL
+    WHERE original_sha256 IS NOT NULL OR mapfile_original IS NOT NULL
+    """
+    db.cursor.execute(update_sql)
+    deleted = db.cursor.rowcount
+    maps_repo.bump_maps_version(db)
+    db.commit()
+    return deleted
+
+
+def get_original_digest(db: Database, map_id: int) -> str | None:
+    """
+    Blob store digest of the original image (blob_store.open_blob_mmap etc.), None if there is none.
+    """
+    return _get_digest(db, map_id, _ORIGINAL)
+
+
+def get_final_digest(db: Database, map_id: int) -> str | None:
+    return _get_digest(db, map_id, _FINAL)
+
+
+def _get_digest(db: Database, map_id: int, columns: tuple[str, str]) -> str | None:
+    blob_column, digest_column = columns
+    # length() of a BLOB comes from the record header; the image bytes are not read.
+    select_sql = f"""
+    SELECT {digest_column}, length({blob_column})
     FROM map_files
     WHERE map_id = ?
     """
     db.cursor.execute(select_sql, (map_id,))
     result = db.cursor.fetchone()
-    return result[0] if result else None
+    if not result:
+        return None
+    digest, legacy_length = result
+    if digest is None and legacy_length:
+        digest = _move_to_blob_store(db, map_id, columns)
+    return digest
+
+
+def _move_to_blob_store(db: Database, map_id: int, columns: tuple[str, str]) -> str | None:
+    blob_column, digest_column = columns
+    db.cursor.execute(f"SELECT {blob_column} FROM map_files WHERE map_id = ?", (map_id,))
+    result = db.cursor.fetchone()
+    if not result or not result[0]:
+        return None
+    digest = blob_store.put_blob(result[0])
+    update_sql = f"""
+    UPDATE map_files
+    SET {digest_column} = ?, {blob_column} = NULL
+    WHERE map_id = ?
+    """
+    db.cursor.execute(update_sql, (digest, map_id))
+    maps_repo.bump_maps_version(db)
+    db.commit()
+    return digest
 
 
+def move_all_to_blob_store(db: Database) -> int:
+    """
+    Move every image still stored as a BLOB into the blob store. Returns the number moved.
+    """
+    moved = 0
+    for columns in (_ORIGINAL, _FINAL):
+        blob_column, digest_column = columns
+        select_sql = f"""
+        SELECT map_id
+        FROM map_files
+        WHERE {digest_column} IS NULL AND {blob_column} IS NOT NULL
+        """
+        db.cursor.execute(select_sql)
+        for (map_id,) in db.cursor.fetchall():
+            if _move_to_blob_store(db, map_id, columns):
+                moved += 1
+    return moved
@@ -1,10 +1,16 @@
 from __future__ import annotations
 
 import json
+import secrets
 from typing import Any, Dict, List
 
 from Database import Database
 
+from bergenomap.repositories import internal_kv_repo
+
+# internal_kv key of the maps collection version (see get_maps_version).
+MAPS_VERSION_KEY = "maps_version"
+
 
 def _get_map_owner_by_name(db: Database, map_name: str) -> dict | None:
     select_sql = """
@@ -33,6 +39,21 @@ def _get_map_owner_by_id(db: Database, map_id: int) -> str | None:
     return row[0] if row else None
 
 
+def check_map_writable(db: Database, username: str, map_data: Dict[str, Any]) -> None:
+    """
+    Raise PermissionError, as insert_map would, if the map's name or map_id belongs to a
+    different user. Lets a request be refused before the map is stored in the background.
+    """
+    map_id = map_data.get("map_id")
+    if map_id is None:
+        existing = _get_map_owner_by_name(db, map_data.get("map_name"))
+        if existing and existing.get("username") != username:
+            raise PermissionError("Map name already exists for a different user")
+    else:
+        if _get_map_owner_by_id(db, int(map_id)) != username:
+            raise PermissionError("Cannot update a map owned by a different user")
+
+
 def insert_map(db: Database, username: str, map_data: Dict[str, Any]) -> int:
     nw_lat = round(map_data["nw_coords"][0], 6)
     nw_lon = round(map_data["nw_coords"][1], 6)
@@ -62,6 +83,8 @@ def insert_map(db: Database, username: str, map_data: Dict[str, Any]) -> int:
         map_data.get("map_club", ""),
         map_data.get("map_course_planner", ""),
         map_data.get("map_attribution", ""),
+        # Set by the registration flow; NULL makes it be recomputed from the control points.
+        json.dumps(map_data["registration_transform"]) if map_data.get("registration_transform") else None,
     )
 
     map_id = map_data.get("map_id")
@@ -92,9 +115,10 @@ def insert_map(db: Database, username: str, map_data: Dict[str, Any]) -> int:
                 map_course,
                 map_club,
                 map_course_planner,
-                map_attribution
+                map_attribution,
+                registration_transform
             )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """
         db.cursor.execute(insert_sql, common_values)
         map_id = get_map_id_by_name(db, map_data["map_name"], username=username)
@@ -126,110 +150,181 @@ def insert_map(db: Database, username: str, map_data: Dict[str, Any]) -> int:
                 map_course = ?,
                 map_club = ?,
                 map_course_planner = ?,
-                map_attribution = ?
+                map_attribution = ?,
+                registration_transform = ?
             WHERE map_id = ?
         """
         db.cursor.execute(update_sql, common_values + (map_id,))
 
-    db.connection.commit()
     if map_id is None:
         raise RuntimeError("insert_map failed to resolve map_id")
+    _index_map_bounds(db, int(map_id), nw_lat, nw_lon, se_lat, se_lon)
+    bump_maps_version(db)
+    db.commit()
     return int(map_id)
 
 
+def get_maps_version(db: Database) -> str:
+    """
+    Opaque tag that changes whenever a map, its metadata or its stored images change.
+    Map listings are validated against it (ETag), so unchanged listings are not resent.
+    """
+    version = internal_kv_repo.kv_get(db, MAPS_VERSION_KEY)
+    if version is None:
+        version = bump_maps_version(db)
+    return version
+
+
+def bump_maps_version(db: Database) -> str:
+    # Random rather than a counter, so a restored or copied database never repeats a tag.
+    version = secrets.token_hex(8)
+    internal_kv_repo.kv_set(db, MAPS_VERSION_KEY, version)
+    return version
+
+
+def _index_map_bounds(db: Database, map_id: int, nw_lat: float, nw_lon: float, se_lat: float, se_lon: float) -> None:
+    upsert_sql = """
+    INSERT OR REPLACE INTO maps_rtree (map_id, min_lat, max_lat, min_lon, max_lon)
+    VALUES (?, ?, ?, ?, ?)
+    """
+    db.cursor.execute(
+        upsert_sql,
+        (map_id, min(nw_lat, se_lat), max(nw_lat, se_lat), min(nw_lon, se_lon), max(nw_lon, se_lon)),
+    )
+
+
+_MAP_SELECT_COLUMNS = """
+    map_id,
+    username,
+    map_name,
+    nw_coords_lat, nw_coords_lon,
+    se_coords_lat, se_coords_lon,
+    optimal_rotation_angle,
+    overlay_width, overlay_height,
+    attribution,
+    selected_pixel_coords, selected_realworld_coords,
+    map_filename,
+    map_area, map_event, map_date, map_scale, map_course,
+    map_club, map_course_planner, map_attribution
+"""
+
+
+def _map_row_to_dict(row: tuple) -> Dict[str, Any]:
+    (
+        map_id,
+        username_row,
+        map_name,
+        nw_lat,
+        nw_lon,
+        se_lat,
+        se_lon,
+        angle,
+        overlay_width,
+        overlay_height,
+        attribution,
+        selected_pixel_coords,
+        selected_realworld_coords,
+        filename,
+        map_area,
+        map_event,
+        map_date,
+        map_scale,
+        map_course,
+        map_club,
+        map_course_planner,
+        map_attribution,
+    ) = row
+    return {
+        "map_id": map_id,
+        "username": username_row,
+        "map_name": map_name,
+        "nw_coords": [nw_lat, nw_lon],
+        "se_coords": [se_lat, se_lon],
+        "optimal_rotation_angle": angle,
+        "overlay_width": overlay_width,
+        "overlay_height": overlay_height,
+        "attribution": attribution,
+        "selected_pixel_coords": json.loads(selected_pixel_coords),
+        "selected_realworld_coords": json.loads(selected_realworld_coords),
+        "map_filename": filename,
+        "map_area": map_area,
+        "map_event": map_event,
+        "map_date": map_date,
+        "map_scale": map_scale,
+        "map_course": map_course,
+        "map_club": map_club,
+        "map_course_planner": map_course_planner,
+        "map_attribution": map_attribution,
+    }
+
+
 def list_maps(db: Database, username: str | None = None) -> List[Dict[str, Any]]:
     if username is None:
-        db.cursor.execute(
-            """
-            SELECT
-                map_id,
-                username,
-                map_name,
-                nw_coords_lat, nw_coords_lon,
-                se_coords_lat, se_coords_lon,
-                optimal_rotation_angle,
-                overlay_width, overlay_height,
-                attribution,
-                selected_pixel_coords, selected_realworld_coords,
-                map_filename,
-                map_area, map_event, map_date, map_scale, map_course,
-                map_club, map_course_planner, map_attribution
-            FROM maps
-            """
-        )
+        db.cursor.execute(f"SELECT {_MAP_SELECT_COLUMNS} FROM maps")
     else:
-        db.cursor.execute(
-            """
-            SELECT
-                map_id,
-                username,
-                map_name,
-                nw_coords_lat, nw_coords_lon,
-                se_coords_lat, se_coords_lon,
-                optimal_rotation_angle,
-                overlay_width, overlay_height,
-                attribution,
-                selected_pixel_coords, selected_realworld_coords,
-                map_filename,
-                map_area, map_event, map_date, map_scale, map_course,
-                map_club, map_course_planner, map_attribution
-            FROM maps
-            WHERE username = ?
-            """,
-            (username,),
-        )
+        db.cursor.execute(f"SELECT {_MAP_SELECT_COLUMNS} FROM maps WHERE username = ?", (username,))
     rows = db.cursor.fetchall()
-    maps: list[dict] = []
-    for row in rows:
-        (
-            map_id,
-            username_row,
-            map_name,
-            nw_lat,
-            nw_lon,
-            se_lat,
-            se_lon,
-            angle,
-            overlay_width,
-            overlay_height,
-            attribution,
-            selected_pixel_coords,
-            selected_realworld_coords,
-            filename,
-            map_area,
-            map_event,
-            map_date,
-            map_scale,
-            map_course,
-            map_club,
-            map_course_planner,
-            map_attribution,
-        ) = row
-        maps.append(
-            {
-                "map_id": map_id,
-                "username": username_row,
-                "map_name": map_name,
-                "nw_coords": [nw_lat, nw_lon],
-                "se_coords": [se_lat, se_lon],
-                "optimal_rotation_angle": angle,
-                "overlay_width": overlay_width,
-                "overlay_height": overlay_height,
-                "attribution": attribution,
-                "selected_pixel_coords": json.loads(selected_pixel_coords),
-                "selected_realworld_coords": json.loads(selected_realworld_coords),
-                "map_filename": filename,
-                "map_area": map_area,
-                "map_event": map_event,
-                "map_date": map_date,
-                "map_scale": map_scale,
-                "map_course": map_course,
-                "map_club": map_club,
-                "map_course_planner": map_course_planner,
-                "map_attribution": map_attribution,
-            }
+    return [_map_row_to_dict(row) for row in rows]
+
+
+def list_maps_in_bbox(
+    db: Database,
+    username: str,
+    *,
+    min_lat: float,
+    min_lon: float,
+    max_lat: float,
+    max_lon: float,
+) -> List[Dict[str, Any]]:
+    """
+    Maps whose overlay bounds (nw_coords/se_coords) intersect the bbox, via maps_rtree.
+    """
+    select_sql = f"""
+    SELECT {_MAP_SELECT_COLUMNS}
+    FROM maps
+    WHERE username = ? AND map_id IN (
+        SELECT map_id
+        FROM maps_rtree
+        WHERE max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ?
+    )
+    """
+    db.cursor.execute(select_sql, (username, min_lat, max_lat, min_lon, max_lon))
+    rows = db.cursor.fetchall()
+    return [_map_row_to_dict(row) for row in rows]
+
+
+def get_map_by_id(db: Database, map_id: int, *, username: str | None = None) -> Dict[str, Any] | None:
+    if username is None:
+        db.cursor.execute(f"SELECT {_MAP_SELECT_COLUMNS} FROM maps WHERE map_id = ? LIMIT 1", (int(map_id),))
+    else:
+        db.cursor.execute(
+            f"SELECT {_MAP_SELECT_COLUMNS} FROM maps WHERE map_id = ? AND username = ? LIMIT 1",
+            (int(map_id), username),
         )
-    return maps
+    row = db.cursor.fetchone()
+    return _map_row_to_dict(row) if row else None
+
+
+def get_registration_transform(db: Database, map_id: int) -> Dict[str, Any] | None:
+    select_sql = """
+    SELECT registration_transform
+    FROM maps
+    WHERE map_id = ?
+    LIMIT 1
+    """
+    db.cursor.execute(select_sql, (int(map_id),))
+    row = db.cursor.fetchone()
+    return json.loads(row[0]) if row and row[0] else None
+
+
+def set_registration_transform(db: Database, map_id: int, transform: Dict[str, Any]) -> None:
+    update_sql = """
+    UPDATE maps
+    SET registration_transform = ?
+    WHERE map_id = ?
+    """
+    db.cursor.execute(update_sql, (json.dumps(transform), int(map_id)))
+    db.commit()
 
 
 def get_map_id_by_name(db: Database, map_name: str, *, username: str | None = None) -> int | None:
@@ -343,7 +438,8 @@ def update_map_metadata_if_default(
     params = list(updates.values()) + [int(map_id)]
 
     db.cursor.execute(f"UPDATE maps SET {set_parts} WHERE map_id = ?", params)
-    db.connection.commit()
+    bump_maps_version(db)
+    db.commit()
     return True
 
 
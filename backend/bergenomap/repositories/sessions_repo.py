@@ -11,7 +11,7 @@ def create_session(db: Database, username: str, session_key: str, expires_at: da
     VALUES (?, ?, ?)
     """
     db.cursor.execute(insert_sql, (session_key, username, expires_at))
-    db.connection.commit()
+    db.commit()
 
 
 def validate_session(db: Database, session_key: str) -> dict | None:
@@ -30,6 +30,10 @@ def validate_session(db: Database, session_key: str) -> dict | None:
     if not is_active:
         return None
 
+    expires_at = _parse_expires_at(expires_at)
+    if expires_at <= datetime.now():
+        return None
+
     return {"username": username, "expires_at": expires_at, "is_active": is_active}
 
 
@@ -40,5 +44,22 @@ def deactivate_session(db: Database, session_key: str) -> None:
     WHERE session_key = ?
     """
     db.cursor.execute(update_sql, (session_key,))
-    db.connection.commit()
+    db.commit()
+
+
+def delete_expired_sessions(db: Database, now: datetime) -> int:
+    # expires_at is stored by sqlite3's datetime adapter as "YYYY-MM-DD HH:MM:SS[.ffffff]",
+    # which compares correctly as text.
+    delete_sql = """
+    DELETE FROM sessions
+    WHERE expires_at <= ?
+    """
+    db.cursor.execute(delete_sql, (now.isoformat(" "),))
+    db.commit()
+    return db.cursor.rowcount
+
 
+def _parse_expires_at(value: datetime | str) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
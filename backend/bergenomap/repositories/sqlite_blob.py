@@ -0,0 +1,68 @@
+"""
+Streaming reads of single BLOB values (sqlite3 incremental blob I/O, Connection.blobopen).
+
+A response body is read after the request's connection has gone back to the pool, and an
+open blob handle would pin that connection's read snapshot across requests, so every reader
+has a connection of its own, closed with the reader.
+"""
+
+from __future__ import annotations
+
+import io
+import sqlite3
+
+from Database import Database, open_connection
+
+
+class SqliteBlobReader(io.RawIOBase):
+    """
+    Read-only, seekable file object over one BLOB value.
+    """
+
+    def __init__(self, connection: sqlite3.Connection, blob: sqlite3.Blob) -> None:
+        super().__init__()
+        self._connection = connection
+        self._blob = blob
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._blob.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self._blob.seek(offset, whence)
+        return self._blob.tell()
+
+    def tell(self) -> int:
+        return self._blob.tell()
+
+    def __len__(self) -> int:
+        return len(self._blob)
+
+    def close(self) -> None:
+        if not self.closed:
+            try:
+                self._blob.close()
+            finally:
+                self._connection.close()
+        super().close()
+
+
+def open_blob_reader(db: Database, table: str, column: str, row_id: int) -> SqliteBlobReader:
+    """
+    Reader for table.column of the row with rowid row_id, on a new connection to db's file.
+    Raises sqlite3.OperationalError if the row does not exist or the value is not a BLOB.
+    """
+    connection = open_connection(db.db_name)
+    try:
+        blob = connection.blobopen(table, column, row_id, readonly=True)
+    except Exception:
+        connection.close()
+        raise
+    return SqliteBlobReader(connection, blob)
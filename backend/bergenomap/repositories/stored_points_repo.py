@@ -60,7 +60,7 @@ def insert_point(
     VALUES (?, ?, ?, ?, ?)
     """
     db.cursor.execute(insert_sql, (lat_rounded, lon_rounded, precision, desc, username))
-    db.connection.commit()
+    db.commit()
 
     point_id = int(db.cursor.lastrowid)
     return {
@@ -81,7 +81,7 @@ def update_point_description(db: Database, username: str, point_id: int, descrip
     WHERE username = ? AND id = ?
     """
     db.cursor.execute(update_sql, (desc, username, point_id))
-    db.connection.commit()
+    db.commit()
 
     if db.cursor.rowcount == 0:
         return None
@@ -113,6 +113,6 @@ def delete_point(db: Database, username: str, point_id: int) -> bool:
     WHERE username = ? AND id = ?
     """
     db.cursor.execute(delete_sql, (username, point_id))
-    db.connection.commit()
+    db.commit()
     return db.cursor.rowcount > 0
 
@@ -4,6 +4,7 @@ from Database import Database
 
 from bergenomap.repositories import internal_kv_repo
 from bergenomap.repositories import users_repo
+from bergenomap.utils.track_codec import TrackArrays, decode_track, track_data_hash
 
 
 def kv_get(db: Database, key: str) -> str | None:
@@ -82,7 +83,7 @@ def upsert_connection(
         insert_sql,
         (username, athlete_id, access_token, refresh_token, expires_at, scope),
     )
-    db.connection.commit()
+    db.commit()
 
 
 def disconnect(db: Database, username: str) -> None:
@@ -97,7 +98,91 @@ def disconnect(db: Database, username: str) -> None:
     WHERE username = ?
     """
     db.cursor.execute(update_sql, (username,))
-    db.connection.commit()
+    db.commit()
+
+
+def get_sync_state(db: Database, username: str) -> dict:
+    select_sql = """
+    SELECT sync_watermark, last_reconciled_at
+    FROM strava_connections
+    WHERE username = ?
+    LIMIT 1
+    """
+    db.cursor.execute(select_sql, (username,))
+    row = db.cursor.fetchone()
+    if not row:
+        return {"sync_watermark": None, "last_reconciled_at": None}
+    return {"sync_watermark": row[0], "last_reconciled_at": row[1]}
+
+
+def advance_sync_watermark(db: Database, username: str, watermark: int) -> None:
+    """
+    Raise the stored watermark to `watermark`; never moves it backwards.
+    """
+    update_sql = """
+    UPDATE strava_connections
+    SET sync_watermark = MAX(COALESCE(sync_watermark, 0), ?)
+    WHERE username = ?
+    """
+    db.cursor.execute(update_sql, (int(watermark), username))
+    db.commit()
+
+
+def mark_reconciled(db: Database, username: str) -> None:
+    update_sql = """
+    UPDATE strava_connections
+    SET last_reconciled_at = CURRENT_TIMESTAMP
+    WHERE username = ?
+    """
+    db.cursor.execute(update_sql, (username,))
+    db.commit()
+
+
+def delete_unimported_activities(db: Database, username: str, activity_ids: list[int]) -> int:
+    """
+    Delete cached activity summaries, except those with an import (their track stays). Returns deleted count.
+    """
+    delete_sql = """
+    DELETE FROM strava_activities
+    WHERE username = ? AND activity_id = ?
+      AND NOT EXISTS (
+        SELECT 1 FROM strava_imports i
+        WHERE i.username = strava_activities.username AND i.activity_id = strava_activities.activity_id
+      )
+    """
+    db.cursor.executemany(delete_sql, [(username, int(activity_id)) for activity_id in activity_ids])
+    deleted = db.cursor.rowcount
+    db.commit()
+    return deleted
+
+
+_UPSERT_ACTIVITY_SQL = """
+INSERT INTO strava_activities (
+    username, activity_id, name, type, start_date, start_lat, start_lon,
+    distance, elapsed_time, updated_at, last_fetched_at, gpx_data, on_map_cached,
+    workout_type, description
+)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, ?, NULL, ?, ?)
+ON CONFLICT(username, activity_id) DO UPDATE SET
+    name = excluded.name,
+    type = excluded.type,
+    start_date = excluded.start_date,
+    start_lat = excluded.start_lat,
+    start_lon = excluded.start_lon,
+    distance = excluded.distance,
+    elapsed_time = excluded.elapsed_time,
+    updated_at = excluded.updated_at,
+    last_fetched_at = CURRENT_TIMESTAMP,
+    workout_type = excluded.workout_type,
+    description = excluded.description
+"""
+
+
+def _require_user(db: Database, username: str) -> None:
+    if not users_repo.get_user_by_username(db, username):
+        raise ValueError(
+            f"User '{username}' does not exist. Create the user before inserting Strava activities."
+        )
 
 
 def upsert_activity(
@@ -117,33 +202,9 @@ def upsert_activity(
     workout_type: str | None = None,
     description: str | None = None,
 ) -> None:
-    if not users_repo.get_user_by_username(db, username):
-        raise ValueError(
-            f"User '{username}' does not exist. Create the user before inserting Strava activities."
-        )
-
-    insert_sql = """
-    INSERT INTO strava_activities (
-        username, activity_id, name, type, start_date, start_lat, start_lon,
-        distance, elapsed_time, updated_at, last_fetched_at, gpx_data, on_map_cached,
-        workout_type, description
-    )
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, ?, NULL, ?, ?)
-    ON CONFLICT(username, activity_id) DO UPDATE SET
-        name = excluded.name,
-        type = excluded.type,
-        start_date = excluded.start_date,
-        start_lat = excluded.start_lat,
-        start_lon = excluded.start_lon,
-        distance = excluded.distance,
-        elapsed_time = excluded.elapsed_time,
-        updated_at = excluded.updated_at,
-        last_fetched_at = CURRENT_TIMESTAMP,
-        workout_type = excluded.workout_type,
-        description = excluded.description
-    """
+    _require_user(db, username)
     db.cursor.execute(
-        insert_sql,
+        _UPSERT_ACTIVITY_SQL,
         (
             username,
             activity_id,
@@ -160,66 +221,123 @@ def upsert_activity(
             description,
         ),
     )
-    db.connection.commit()
+    db.commit()
+
+
+def upsert_activities_bulk(db: Database, username: str, activities: list[dict]) -> int:
+    """
+    upsert_activity for many rows in one executemany and one commit.
+    Each dict has the keyword arguments of upsert_activity (activity_type, not type);
+    gpx_data, workout_type and description are optional. Returns the row count.
+    """
+    if not activities:
+        return 0
+    _require_user(db, username)
+    db.cursor.executemany(
+        _UPSERT_ACTIVITY_SQL,
+        [
+            (
+                username,
+                a["activity_id"],
+                a.get("name"),
+                a.get("activity_type"),
+                a.get("start_date"),
+                a.get("start_lat"),
+                a.get("start_lon"),
+                a.get("distance"),
+                a.get("elapsed_time"),
+                a.get("updated_at"),
+                a.get("gpx_data", b""),
+                a.get("workout_type"),
+                a.get("description"),
+            )
+            for a in activities
+        ],
+    )
+    db.commit()
+    return len(activities)
+
+
+_ACTIVITY_SELECT_COLUMNS = """
+    a.activity_id,
+    a.name,
+    a.type,
+    a.start_date,
+    a.start_lat,
+    a.start_lon,
+    a.distance,
+    a.elapsed_time,
+    a.updated_at,
+    a.last_fetched_at,
+    (length(a.gpx_data) > 0 OR a.track_data IS NOT NULL) as has_gpx,
+    a.workout_type,
+    a.description
+"""
 
 
 def list_activities(db: Database, username: str) -> list[dict]:
-    select_sql = """
-    SELECT
-        a.activity_id,
-        a.name,
-        a.type,
-        a.start_date,
-        a.start_lat,
-        a.start_lon,
-        a.distance,
-        a.elapsed_time,
-        a.updated_at,
-        a.last_fetched_at,
-        length(a.gpx_data) as gpx_len,
-        a.workout_type,
-        a.description
+    select_sql = f"""
+    SELECT {_ACTIVITY_SELECT_COLUMNS}
     FROM strava_activities a
     WHERE a.username = ?
     ORDER BY a.start_date DESC
     """
     db.cursor.execute(select_sql, (username,))
-    rows = db.cursor.fetchall()
-    results: list[dict] = []
-    for row in rows:
-        (
-            activity_id,
-            name,
-            activity_type,
-            start_date,
-            start_lat,
-            start_lon,
-            distance,
-            elapsed_time,
-            updated_at,
-            last_fetched_at,
-            gpx_len,
-            workout_type,
-            description,
-        ) = row
-        results.append(
-            {
-                "activity_id": activity_id,
-                "name": name,
-                "type": activity_type,
-                "start_date": start_date,
-                "start_lat": start_lat,
-                "start_lon": start_lon,
-                "distance": distance,
-                "elapsed_time": elapsed_time,
-                "updated_at": updated_at,
-                "last_fetched_at": last_fetched_at,
-                "has_gpx": bool(gpx_len and gpx_len > 0),
-                "workout_type": workout_type,
-                "description": description,
-            }
-        )
-    return results
+    return [_activity_row_to_dict(row) for row in db.cursor.fetchall()]
+
+
+def get_activity(db: Database, username: str, activity_id: int) -> dict | None:
+    """
+    One activity as returned by list_activities (primary key lookup, blobs are not read),
+    plus "content_hash" identifying its track data (None if it has none).
+    """
+    select_sql = f"""
+    SELECT {_ACTIVITY_SELECT_COLUMNS},
+        COALESCE(a.track_hash, 'len:' || length(a.track_data))
+    FROM strava_activities a
+    WHERE a.username = ? AND a.activity_id = ?
+    LIMIT 1
+    """
+    db.cursor.execute(select_sql, (username, activity_id))
+    row = db.cursor.fetchone()
+    if not row:
+        return None
+    activity = _activity_row_to_dict(row[:-1])
+    activity["content_hash"] = row[-1]
+    return activity
+
+
+def _activity_row_to_dict(row: tuple) -> dict:
+    (
+        activity_id,
+        name,
+        activity_type,
+        start_date,
+        start_lat,
+        start_lon,
+        distance,
+        elapsed_time,
+        updated_at,
+        last_fetched_at,
+        has_gpx,
+        workout_type,
+        description,
+    ) = row
+    return {
+        "activity_id": activity_id,
+        "name": name,
+        "type": activity_type,
+        "start_date": start_date,
+        "start_lat": start_lat,
+        "start_lon": start_lon,
+        "distance": distance,
+        "elapsed_time": elapsed_time,
+        "updated_at": updated_at,
+        "last_fetched_at": last_fetched_at,
+        "has_gpx": bool(has_gpx),
+        "workout_type": workout_type,
+        "description": description,
+    }
 
 
 def get_activity_gpx(db: Database, username: str, activity_id: int) -> bytes | None:
@@ -234,6 +352,68 @@ def get_activity_gpx(db: Database, username: str, activity_id: int) -> bytes | N
     return row[0] if row else None
 
 
+def get_activity_gpx_blob(db: Database, username: str, activity_id: int) -> dict | None:
+    """
+    {"row_id", "size"} of the activity's stored GPX file, for streaming it with sqlite_blob;
+    None if the activity does not exist. Reads no track data.
+    """
+    select_sql = """
+    SELECT rowid, COALESCE(length(gpx_data), 0)
+    FROM strava_activities
+    WHERE username = ? AND activity_id = ?
+    LIMIT 1
+    """
+    db.cursor.execute(select_sql, (username, activity_id))
+    row = db.cursor.fetchone()
+    if not row:
+        return None
+    row_id, size = row
+    return {"row_id": int(row_id), "size": int(size)}
+
+
+def get_activity_track(db: Database, username: str, activity_id: int) -> TrackArrays | None:
+    """
+    Decoded binary track data for an activity, or None if the activity has none
+    (not imported, or imported before track_data existed).
+    """
+    select_sql = """
+    SELECT track_data
+    FROM strava_activities
+    WHERE username = ? AND activity_id = ?
+    LIMIT 1
+    """
+    db.cursor.execute(select_sql, (username, activity_id))
+    row = db.cursor.fetchone()
+    return decode_track(row[0]) if row and row[0] else None
+
+
+def set_activity_track(db: Database, username: str, activity_id: int, track_data: bytes) -> None:
+    """
+    Store freshly imported track data, replacing the activity's track. Any legacy GPX blob is
+    dropped; GPX is exported from track_data.
+    """
+    update_sql = """
+    UPDATE strava_activities
+    SET track_data = ?, track_hash = ?, gpx_data = ?, last_fetched_at = CURRENT_TIMESTAMP
+    WHERE username = ? AND activity_id = ?
+    """
+    db.cursor.execute(update_sql, (track_data, track_data_hash(track_data), b"", username, activity_id))
+    db.commit()
+
+
+def backfill_activity_track(db: Database, username: str, activity_id: int, track_data: bytes) -> None:
+    """
+    Store track data converted from the activity's legacy GPX. The GPX itself is kept.
+    """
+    update_sql = """
+    UPDATE strava_activities
+    SET track_data = ?, track_hash = ?
+    WHERE username = ? AND activity_id = ?
+    """
+    db.cursor.execute(update_sql, (track_data, track_data_hash(track_data), username, activity_id))
+    db.commit()
+
+
 def set_activity_gpx(db: Database, username: str, activity_id: int, gpx_data: bytes) -> None:
     update_sql = """
     UPDATE strava_activities
@@ -241,17 +421,17 @@ def set_activity_gpx(db: Database, username: str, activity_id: int, gpx_data: by
     WHERE username = ? AND activity_id = ?
     """
     db.cursor.execute(update_sql, (gpx_data, username, activity_id))
-    db.connection.commit()
+    db.commit()
 
 
 def clear_activity_gpx(db: Database, username: str, activity_id: int) -> None:
     update_sql = """
     UPDATE strava_activities
-    SET gpx_data = ?
+    SET gpx_data = ?, track_data = NULL, track_hash = NULL
     WHERE username = ? AND activity_id = ?
     """
     db.cursor.execute(update_sql, (b"", username, activity_id))
-    db.connection.commit()
+    db.commit()
 
 
 def upsert_import(
@@ -277,7 +457,22 @@ def upsert_import(
         max_lon = excluded.max_lon
     """
     db.cursor.execute(insert_sql, (username, activity_id, min_lat, min_lon, max_lat, max_lon))
-    db.connection.commit()
+    _unindex_import(db, username, activity_id)
+    if None not in (min_lat, min_lon, max_lat, max_lon):
+        index_sql = """
+        INSERT INTO strava_imports_rtree (min_lat, max_lat, min_lon, max_lon, username, activity_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """
+        db.cursor.execute(index_sql, (min_lat, max_lat, min_lon, max_lon, username, activity_id))
+    db.commit()
+
+
+def _unindex_import(db: Database, username: str, activity_id: int) -> None:
+    delete_sql = """
+    DELETE FROM strava_imports_rtree
+    WHERE username = ? AND activity_id = ?
+    """
+    db.cursor.execute(delete_sql, (username, activity_id))
 
 
 def list_imports(db: Database, username: str) -> list[dict]:
@@ -288,7 +483,33 @@ def list_imports(db: Database, username: str) -> list[dict]:
     ORDER BY last_imported_at DESC
     """
     db.cursor.execute(select_sql, (username,))
-    rows = db.cursor.fetchall()
+    return _import_rows_to_dicts(db.cursor.fetchall())
+
+
+def list_imports_in_bbox(
+    db: Database,
+    username: str,
+    *,
+    min_lat: float,
+    min_lon: float,
+    max_lat: float,
+    max_lon: float,
+) -> list[dict]:
+    select_sql = """
+    SELECT activity_id, imported_at, last_imported_at, min_lat, min_lon, max_lat, max_lon
+    FROM strava_imports
+    WHERE username = ? AND activity_id IN (
+        SELECT activity_id
+        FROM strava_imports_rtree
+        WHERE max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ? AND username = ?
+    )
+    ORDER BY last_imported_at DESC
+    """
+    db.cursor.execute(select_sql, (username, min_lat, max_lat, min_lon, max_lon, username))
+    return _import_rows_to_dicts(db.cursor.fetchall())
+
+
+def _import_rows_to_dicts(rows: list[tuple]) -> list[dict]:
     return [
         {
             "activity_id": activity_id,
@@ -343,6 +564,7 @@ def delete_import(db: Database, username: str, activity_id: int) -> None:
     WHERE username = ? AND activity_id = ?
     """
     db.cursor.execute(delete_sql, (username, activity_id))
-    db.connection.commit()
+    _unindex_import(db, username, activity_id)
+    db.commit()
 
 
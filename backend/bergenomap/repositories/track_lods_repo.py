@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from typing import Dict, List, Tuple
+
+from Database import Database
+
+
+def replace_track_lods(db: Database, username: str, source: str, track_id: int, lods: List[dict]) -> None:
+    """
+    Replace all levels of a track. Each dict has level, tolerance_m, point_count and
+    track_data (encode_track of the simplified track).
+    """
+    db.cursor.execute(
+        "DELETE FROM track_lods WHERE username = ? AND source = ? AND track_id = ?",
+        (username, source, track_id),
+    )
+    insert_sql = """
+    INSERT INTO track_lods (username, source, track_id, level, tolerance_m, point_count, track_data)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    """
+    db.cursor.executemany(
+        insert_sql,
+        [
+            (username, source, track_id, lod["level"], lod["tolerance_m"], lod["point_count"], lod["track_data"])
+            for lod in lods
+        ],
+    )
+    db.commit()
+
+
+def delete_track_lods(db: Database, username: str, source: str, track_id: int) -> None:
+    db.cursor.execute(
+        "DELETE FROM track_lods WHERE username = ? AND source = ? AND track_id = ?",
+        (username, source, track_id),
+    )
+    db.commit()
+
+
+def get_track_lod_data(db: Database, username: str, source: str, track_id: int, level: int) -> bytes | None:
+    select_sql = """
+    SELECT track_data
+    FROM track_lods
+    WHERE username = ? AND source = ? AND track_id = ? AND level = ?
+    LIMIT 1
+    """
+    db.cursor.execute(select_sql, (username, source, track_id, level))
+    row = db.cursor.fetchone()
+    return row[0] if row else None
+
+
+def list_tracks_without_lods(db: Database, *, local_source: str, strava_source: str) -> List[Tuple[str, str, int]]:
+    """
+    (username, source, track_id) of every uploaded track and Strava import without stored
+    levels, for the offline backfill.
+    """
+    select_sql = """
+    SELECT t.username, ?, t.track_id
+    FROM gps_tracks t
+    WHERE NOT EXISTS (
+        SELECT 1 FROM track_lods l
+        WHERE l.username = t.username AND l.source = ? AND l.track_id = t.track_id
+    )
+    UNION ALL
+    SELECT i.username, ?, i.activity_id
+    FROM strava_imports i
+    WHERE NOT EXISTS (
+        SELECT 1 FROM track_lods l
+        WHERE l.username = i.username AND l.source = ? AND l.track_id = i.activity_id
+    )
+    """
+    db.cursor.execute(select_sql, (local_source, local_source, strava_source, strava_source))
+    return [(row[0], row[1], int(row[2])) for row in db.cursor.fetchall()]
+
+
+def list_track_lods_at_level(db: Database, username: str, level: int) -> Dict[Tuple[str, int], dict]:
+    """
+    All of the user's tracks at one level, keyed by (source, track_id).
+    """
+    select_sql = """
+    SELECT source, track_id, tolerance_m, point_count, track_data
+    FROM track_lods
+    WHERE username = ? AND level = ?
+    """
+    db.cursor.execute(select_sql, (username, level))
+    return {
+        (source, track_id): {"tolerance_m": tolerance_m, "point_count": point_count, "track_data": track_data}
+        for source, track_id, tolerance_m, point_count, track_data in db.cursor.fetchall()
+    }
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List, Tuple
+
+from Database import Database
+
+# Columns of track_stats besides the key, in the order of TrackStats.
+STAT_COLUMNS = (
+    "point_count",
+    "distance_m",
+    "start_time",
+    "elapsed_time_s",
+    "moving_time_s",
+    "moving_pace_s_per_km",
+    "elevation_gain_m",
+    "elevation_loss_m",
+    "min_elevation_m",
+    "max_elevation_m",
+    "avg_heart_rate",
+    "max_heart_rate",
+    "hr_zone_s",
+)
+
+
+def upsert_track_stats(db: Database, username: str, source: str, track_id: int, stats: Dict[str, Any]) -> None:
+    """
+    `stats` is TrackStats.to_dict().
+    """
+    values = [json.dumps(stats[c]) if c == "hr_zone_s" and stats[c] is not None else stats[c] for c in STAT_COLUMNS]
+    insert_sql = f"""
+    INSERT OR REPLACE INTO track_stats (username, source, track_id, {", ".join(STAT_COLUMNS)})
+    VALUES (?, ?, ?, {", ".join("?" for _ in STAT_COLUMNS)})
+    """
+    db.cursor.execute(insert_sql, (username, source, track_id, *values))
+    db.commit()
+
+
+def mark_track_stats_missing(db: Database, username: str, source: str, track_id: int) -> None:
+    """
+    Store a row with point_count 0 for a track without usable data, so its statistics are
+    not looked for again. Storing real statistics replaces it.
+    """
+    insert_sql = """
+    INSERT OR REPLACE INTO track_stats (username, source, track_id, point_count, distance_m)
+    VALUES (?, ?, ?, 0, 0)
+    """
+    db.cursor.execute(insert_sql, (username, source, track_id))
+    db.commit()
+
+
+def delete_track_stats(db: Database, username: str, source: str, track_id: int) -> None:
+    db.cursor.execute(
+        "DELETE FROM track_stats WHERE username = ? AND source = ? AND track_id = ?",
+        (username, source, track_id),
+    )
+    db.commit()
+
+
+def list_tracks_without_stats(db: Database, *, local_source: str, strava_source: str) -> List[Tuple[str, str, int]]:
+    """
+    (username, source, track_id) of every uploaded track and Strava import without a
+    track_stats row, for the offline backfill.
+    """
+    select_sql = """
+    SELECT t.username, ?, t.track_id
+    FROM gps_tracks t
+    WHERE NOT EXISTS (
+        SELECT 1 FROM track_stats s
+        WHERE s.username = t.username AND s.source = ? AND s.track_id = t.track_id
+    )
+    UNION ALL
+    SELECT i.username, ?, i.activity_id
+    FROM strava_imports i
+    WHERE NOT EXISTS (
+        SELECT 1 FROM track_stats s
+        WHERE s.username = i.username AND s.source = ? AND s.track_id = i.activity_id
+    )
+    """
+    db.cursor.execute(select_sql, (local_source, local_source, strava_source, strava_source))
+    return [(row[0], row[1], int(row[2])) for row in db.cursor.fetchall()]
+
+
+def list_track_stats(db: Database, username: str) -> Dict[Tuple[str, int], Dict[str, Any]]:
+    """
+    Stats of all of the user's tracks, keyed by (source, track_id).
+    """
+    select_sql = f"""
+    SELECT source, track_id, {", ".join(STAT_COLUMNS)}
+    FROM track_stats
+    WHERE username = ?
+    """
+    db.cursor.execute(select_sql, (username,))
+    result: Dict[Tuple[str, int], Dict[str, Any]] = {}
+    for row in db.cursor.fetchall():
+        stats = dict(zip(STAT_COLUMNS, row[2:]))
+        stats["hr_zone_s"] = json.loads(stats["hr_zone_s"]) if stats["hr_zone_s"] else None
+        result[(row[0], row[1])] = stats
+    return result
@@ -3,6 +3,7 @@ from __future__ import annotations
 from Database import Database
 
 from bergenomap.repositories import users_repo
+from bergenomap.utils.track_codec import decode_track, track_data_hash
 
 
 def insert_gps_track(
@@ -15,6 +16,7 @@ def insert_gps_track(
     min_lon: float,
     max_lat: float,
     max_lon: float,
+    track_data: bytes | None = None,
 ) -> int:
     if not users_repo.get_user_by_username(db, username):
         raise ValueError(f"User '{username}' does not exist. Create the user before inserting tracks.")
@@ -23,12 +25,85 @@ def insert_gps_track(
         raise ValueError("Track bounds (min_lat/min_lon/max_lat/max_lon) are required.")
 
     insert_sql = """
-    INSERT INTO gps_tracks (username, gpx_data, description, min_lat, min_lon, max_lat, max_lon)
-    VALUES (?, ?, ?, ?, ?, ?, ?)
+    INSERT INTO gps_tracks (
+        username, gpx_data, description, min_lat, min_lon, max_lat, max_lon, track_data, track_hash
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
     """
-    db.cursor.execute(insert_sql, (username, gpx_data, description, min_lat, min_lon, max_lat, max_lon))
-    db.connection.commit()
-    return db.cursor.lastrowid
+    db.cursor.execute(
+        insert_sql,
+        (
+            username,
+            gpx_data,
+            description,
+            min_lat,
+            min_lon,
+            max_lat,
+            max_lon,
+            track_data,
+            track_data_hash(track_data) if track_data else None,
+        ),
+    )
+    track_id = db.cursor.lastrowid
+    index_sql = """
+    INSERT OR REPLACE INTO gps_tracks_rtree (track_id, min_lat, max_lat, min_lon, max_lon)
+    VALUES (?, ?, ?, ?, ?)
+    """
+    db.cursor.execute(index_sql, (track_id, min_lat, max_lat, min_lon, max_lon))
+    db.commit()
+    return track_id
+
+
+def insert_gps_tracks_bulk(db: Database, username: str, tracks: list[dict]) -> list[int]:
+    """
+    insert_gps_track for many tracks with a single commit. Each dict has gpx_data, description,
+    min_lat, min_lon, max_lat, max_lon and optionally track_data. Returns the new track ids in order.
+    """
+    if not tracks:
+        return []
+    if not users_repo.get_user_by_username(db, username):
+        raise ValueError(f"User '{username}' does not exist. Create the user before inserting tracks.")
+    for track in tracks:
+        if any(track.get(key) is None for key in ("min_lat", "min_lon", "max_lat", "max_lon")):
+            raise ValueError("Track bounds (min_lat/min_lon/max_lat/max_lon) are required.")
+
+    insert_sql = """
+    INSERT INTO gps_tracks (
+        username, gpx_data, description, min_lat, min_lon, max_lat, max_lon, track_data, track_hash
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    index_sql = """
+    INSERT OR REPLACE INTO gps_tracks_rtree (track_id, min_lat, max_lat, min_lon, max_lon)
+    VALUES (?, ?, ?, ?, ?)
+    """
+    track_ids: list[int] = []
+    with db.transaction():
+        # Row by row because executemany does not report the generated ids.
+        for track in tracks:
+            db.cursor.execute(
+                insert_sql,
+                (
+                    username,
+                    track["gpx_data"],
+                    track["description"],
+                    track["min_lat"],
+                    track["min_lon"],
+                    track["max_lat"],
+                    track["max_lon"],
+                    track.get("track_data"),
+                    track_data_hash(track["track_data"]) if track.get("track_data") else None,
+                ),
+            )
+            track_ids.append(db.cursor.lastrowid)
+        db.cursor.executemany(
+            index_sql,
+            [
+                (track_id, track["min_lat"], track["max_lat"], track["min_lon"], track["max_lon"])
+                for track_id, track in zip(track_ids, tracks)
+            ],
+        )
+    return track_ids
 
 
 def list_gps_tracks(db: Database, username: str) -> list[dict]:
@@ -39,7 +114,33 @@ def list_gps_tracks(db: Database, username: str) -> list[dict]:
     ORDER BY track_id ASC
     """
     db.cursor.execute(select_sql, (username,))
-    rows = db.cursor.fetchall()
+    return _track_rows_to_dicts(db.cursor.fetchall())
+
+
+def list_gps_tracks_in_bbox(
+    db: Database,
+    username: str,
+    *,
+    min_lat: float,
+    min_lon: float,
+    max_lat: float,
+    max_lon: float,
+) -> list[dict]:
+    select_sql = """
+    SELECT track_id, username, description, min_lat, min_lon, max_lat, max_lon
+    FROM gps_tracks
+    WHERE username = ? AND track_id IN (
+        SELECT track_id
+        FROM gps_tracks_rtree
+        WHERE max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ?
+    )
+    ORDER BY track_id ASC
+    """
+    db.cursor.execute(select_sql, (username, min_lat, max_lat, min_lon, max_lon))
+    return _track_rows_to_dicts(db.cursor.fetchall())
+
+
+def _track_rows_to_dicts(rows: list[tuple]) -> list[dict]:
     return [
         {
             "track_id": track_id,
@@ -54,9 +155,34 @@ def list_gps_tracks(db: Database, username: str) -> list[dict]:
     ]
 
 
+def get_gps_track_meta(db: Database, username: str, track_id: int) -> dict | None:
+    """
+    Track metadata without reading the track blob. "content_hash" identifies the track data
+    (None if the row has no binary track data yet).
+    """
+    select_sql = """
+    SELECT track_id, username, description, min_lat, min_lon, max_lat, max_lon,
+        COALESCE(track_hash, 'len:' || length(track_data))
+    FROM gps_tracks
+    WHERE username = ? AND track_id = ?
+    LIMIT 1
+    """
+    db.cursor.execute(select_sql, (username, track_id))
+    row = db.cursor.fetchone()
+    if not row:
+        return None
+    track = _track_rows_to_dicts([row[:7]])[0]
+    track["content_hash"] = row[7]
+    return track
+
+
 def get_gps_track_by_id(db: Database, username: str, track_id: int) -> dict | None:
+    """
+    Track metadata plus "track": the decoded TrackArrays, or None if the row has not been
+    converted to binary track data yet (see track_service.load_local_track).
+    """
     select_sql = """
-    SELECT track_id, username, gpx_data, description, min_lat, min_lon, max_lat, max_lon
+    SELECT track_id, username, track_data, description, min_lat, min_lon, max_lat, max_lon
     FROM gps_tracks
     WHERE username = ? AND track_id = ?
     LIMIT 1
@@ -66,11 +192,11 @@ def get_gps_track_by_id(db: Database, username: str, track_id: int) -> dict | No
     if not result:
         return None
 
-    tid, user, gpx_blob, description, min_lat, min_lon, max_lat, max_lon = result
+    tid, user, track_blob, description, min_lat, min_lon, max_lat, max_lon = result
     return {
         "track_id": tid,
         "username": user,
-        "gpx_data": gpx_blob,
+        "track": decode_track(track_blob) if track_blob else None,
         "description": description,
         "min_lat": min_lat,
         "min_lon": min_lon,
@@ -79,3 +205,74 @@ def get_gps_track_by_id(db: Database, username: str, track_id: int) -> dict | No
     }
 
 
+def get_gps_track_gpx(db: Database, username: str, track_id: int) -> bytes | None:
+    select_sql = """
+    SELECT gpx_data
+    FROM gps_tracks
+    WHERE username = ? AND track_id = ?
+    LIMIT 1
+    """
+    db.cursor.execute(select_sql, (username, track_id))
+    row = db.cursor.fetchone()
+    return row[0] if row else None
+
+
+def get_gps_track_gpx_blob(db: Database, username: str, track_id: int) -> dict | None:
+    """
+    {"row_id", "size"} of the track's stored GPX file, for streaming it with sqlite_blob;
+    None if the track does not exist. Reads no track data.
+    """
+    select_sql = """
+    SELECT rowid, COALESCE(length(gpx_data), 0)
+    FROM gps_tracks
+    WHERE username = ? AND track_id = ?
+    LIMIT 1
+    """
+    db.cursor.execute(select_sql, (username, track_id))
+    row = db.cursor.fetchone()
+    if not row:
+        return None
+    row_id, size = row
+    return {"row_id": int(row_id), "size": int(size)}
+
+
+def set_gps_track_data(db: Database, username: str, track_id: int, track_data: bytes) -> None:
+    update_sql = """
+    UPDATE gps_tracks
+    SET track_data = ?, track_hash = ?
+    WHERE username = ? AND track_id = ?
+    """
+    db.cursor.execute(update_sql, (track_data, track_data_hash(track_data), username, track_id))
+    db.commit()
+
+
+def list_track_hashes(db: Database, username: str) -> dict[str, int]:
+    """
+    {track_hash: track_id} of the user's tracks that have a hash (the first track per hash).
+    """
+    select_sql = """
+    SELECT track_hash, MIN(track_id)
+    FROM gps_tracks
+    WHERE username = ? AND track_hash IS NOT NULL
+    GROUP BY track_hash
+    """
+    db.cursor.execute(select_sql, (username,))
+    return {track_hash: track_id for track_hash, track_id in db.cursor.fetchall()}
+
+
+def backfill_track_hashes(db: Database, username: str) -> int:
+    """
+    Set track_hash on the user's tracks that have track_data but were stored before hashes
+    existed. Returns the number of tracks updated.
+    """
+    select_sql = """
+    SELECT track_id, track_data
+    FROM gps_tracks
+    WHERE username = ? AND track_hash IS NULL AND track_data IS NOT NULL
+    """
+    db.cursor.execute(select_sql, (username,))
+    updates = [(track_data_hash(track_data), track_id) for track_id, track_data in db.cursor.fetchall()]
+    if updates:
+        db.cursor.executemany("UPDATE gps_tracks SET track_hash = ? WHERE track_id = ?", updates)
+        db.commit()
+    return len(updates)
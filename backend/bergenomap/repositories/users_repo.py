@@ -11,7 +11,7 @@ def ensure_user_exists(db: Database, username: str) -> None:
     VALUES (?)
     """
     db.cursor.execute(insert_sql, (username,))
-    db.connection.commit()
+    db.commit()
 
 
 def create_user(db: Database, username: str, pw_hash: str) -> None:
@@ -22,7 +22,7 @@ def create_user(db: Database, username: str, pw_hash: str) -> None:
     """
     try:
         db.cursor.execute(insert_sql, (username, pw_hash))
-        db.connection.commit()
+        db.commit()
     except sqlite3.IntegrityError as exc:
         raise ValueError("User already exists") from exc
 
@@ -1,7 +1,25 @@
 from __future__ import annotations
 
+import io
+import math
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
 from PIL import Image
 
+from bergenomap.config import settings
+
+# Names accepted for settings.image_transform_resample.
+RESAMPLE_FILTERS = {
+    "nearest": Image.Resampling.NEAREST,
+    "bilinear": Image.Resampling.BILINEAR,
+    "bicubic": Image.Resampling.BICUBIC,
+}
+
+AffineMatrix = Tuple[float, float, float, float, float, float]
+
 
 def add_transparent_border(image: Image.Image, border_size: int) -> Image.Image:
     # Create a new image with transparent background
@@ -14,16 +32,216 @@ def add_transparent_border(image: Image.Image, border_size: int) -> Image.Image:
 
 
 def add_transparent_border_and_rotate_image(
-    image: Image.Image, border_size: int, rotation_angle: float
+    image: Image.Image,
+    border_size: int,
+    rotation_angle: float,
+    *,
+    resample: Optional[str] = None,
+    threads: Optional[int] = None,
+    tile_size: Optional[int] = None,
 ) -> Image.Image:
-    image = image.convert("RGBA")
+    """
+    The image on a transparent border of border_size pixels, rotated rotation_angle degrees
+    counter-clockwise about its center and cropped to the bordered size; the same as
+    add_transparent_border(...).rotate(rotation_angle).
+
+    Border and rotation are one affine resampling straight from the source, rendered row by
+    row in square tiles of tile_size on `threads` threads (Pillow releases the GIL while
+    resampling). The RGBA result is the only full-size allocation; the source is neither
+    converted nor copied as a whole. Tile offsets round differently from one whole-image
+    transform, so a sample exactly between two source pixels may take the other one.
+    resample is a name in RESAMPLE_FILTERS; all three keyword arguments default to
+    settings.image_transform_*.
+    """
+    # Like Image.rotate, turns that need no resampling are done exactly.
+    if rotation_angle % 360.0 == 0:
+        return add_transparent_border(image, border_size)
+    if rotation_angle % 360.0 == 180:
+        return add_transparent_border(image.transpose(Image.Transpose.ROTATE_180), border_size)
+
+    resample_filter = RESAMPLE_FILTERS[resample or settings.image_transform_resample]
+    threads = threads if threads is not None else settings.image_transform_threads
+    tile_size = tile_size or settings.image_transform_tile_size
+
+    size = (image.width + 2 * border_size, image.height + 2 * border_size)
+    matrix = _border_and_rotate_matrix(size, border_size, rotation_angle)
+    # Tiles read the source concurrently; make sure it is decoded once, up front.
+    image.load()
+    result = Image.new("RGBA", size, (0, 0, 0, 0))
+
+    def render(box: Tuple[int, int, int, int]) -> Optional[Image.Image]:
+        return _render_tile(image, matrix, box, resample_filter)
+
+    boxes = [
+        (left, top, min(left + tile_size, size[0]), min(top + tile_size, size[1]))
+        for top in range(0, size[1], tile_size)
+        for left in range(0, size[0], tile_size)
+    ]
+    if threads <= 1:
+        for box in boxes:
+            _paste_tile(result, render(box), box)
+        return result
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        # Tiles are pasted in order; at most two per thread are held at a time.
+        pending = deque()
+        for box in boxes:
+            pending.append((box, executor.submit(render, box)))
+            if len(pending) >= 2 * threads:
+                done_box, future = pending.popleft()
+                _paste_tile(result, future.result(), done_box)
+        while pending:
+            done_box, future = pending.popleft()
+            _paste_tile(result, future.result(), done_box)
+    return result
+
+
+# Source pixels around a tile's footprint that its resampling filter may read (bicubic: 2).
+_TILE_SOURCE_MARGIN = 3
+
+
+def _render_tile(
+    image: Image.Image,
+    matrix: AffineMatrix,
+    box: Tuple[int, int, int, int],
+    resample_filter: int,
+) -> Optional[Image.Image]:
+    """
+    The output pixels in box (left, top, right, bottom) as RGBA, or None if they only show border.
+
+    Only the source region the tile maps to is copied, into an RGBA image that is transparent
+    outside the source: exactly the corresponding window of the bordered image.
+    """
+    a, b, c, d, e, f = matrix
+    left, top, right, bottom = box
+    corners = [(x, y) for x in (left, right) for y in (top, bottom)]
+    xs = [a * x + b * y + c for x, y in corners]
+    ys = [d * x + e * y + f for x, y in corners]
+    x0 = math.floor(min(xs)) - _TILE_SOURCE_MARGIN
+    y0 = math.floor(min(ys)) - _TILE_SOURCE_MARGIN
+    x1 = math.ceil(max(xs)) + _TILE_SOURCE_MARGIN
+    y1 = math.ceil(max(ys)) + _TILE_SOURCE_MARGIN
+
+    inside = (max(x0, 0), max(y0, 0), min(x1, image.width), min(y1, image.height))
+    if inside[0] >= inside[2] or inside[1] >= inside[3]:
+        return None
+    window = Image.new("RGBA", (x1 - x0, y1 - y0), (0, 0, 0, 0))
+    window.paste(image.crop(inside), (inside[0] - x0, inside[1] - y0))
+
+    # Output pixel (left, top) is pixel (0, 0) of the tile, source pixel (x0, y0) that of the window.
+    window_matrix = (a, b, a * left + b * top + c - x0, d, e, d * left + e * top + f - y0)
+    return window.transform((right - left, bottom - top), Image.Transform.AFFINE, window_matrix, resample_filter)
+
+
+def _paste_tile(result: Image.Image, tile: Optional[Image.Image], box: Tuple[int, int, int, int]) -> None:
+    if tile is not None:
+        result.paste(tile, box[:2])
+
+
+def _border_and_rotate_matrix(size: Tuple[int, int], border_size: int, rotation_angle: float) -> AffineMatrix:
+    """
+    Affine matrix from output pixels to source pixels for Image.transform: Image.rotate's
+    matrix for the bordered image (rotation about its center), shifted by the border.
+    """
+    angle = -math.radians(rotation_angle % 360.0)
+    a = round(math.cos(angle), 15)
+    b = round(math.sin(angle), 15)
+    d = round(-math.sin(angle), 15)
+    e = round(math.cos(angle), 15)
+    cx, cy = size[0] / 2, size[1] / 2
+    c = a * -cx + b * -cy + cx - border_size
+    f = d * -cx + e * -cy + cy - border_size
+    return (a, b, c, d, e, f)
+
+
+# Names accepted for settings.map_final_encoding, map_original_encoding and dropped_image_encoding.
+ENCODING_PROFILES = ("png", "webp_lossless", "webp", "avif")
+
+# Largest width or height libwebp can encode; bigger images are stored as PNG.
+_WEBP_MAX_DIMENSION = 16383
+
+# Leading bytes of the image formats a stored map can have, for serving them with their mimetype.
+_IMAGE_SIGNATURES = (
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"GIF8", "image/gif"),
+    (8, b"WEBP", "image/webp"),
+    (4, b"ftypavif", "image/avif"),
+    (4, b"ftypavis", "image/avif"),
+    (0, b"II*\x00", "image/tiff"),
+    (0, b"MM\x00*", "image/tiff"),
+    (0, b"BM", "image/bmp"),
+)
+
+IMAGE_EXTENSIONS = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+    "image/avif": ".avif",
+    "image/tiff": ".tif",
+    "image/bmp": ".bmp",
+}
+
+
+@dataclass(frozen=True)
+class EncodedImage:
+    data: bytes
+    mimetype: str
+
+
+def encode_image(image: Image.Image, profile: str) -> EncodedImage:
+    """
+    The image encoded with one of ENCODING_PROFILES: "png", "webp_lossless", "webp" (lossy, at
+    settings.image_webp_quality) or "avif" (at settings.image_avif_quality). Transparency is kept.
+
+    Encoders release the GIL, so images can be encoded on other threads while this one works.
+    WebP is limited to 16383 pixels per side and larger images are encoded as PNG; without AVIF
+    support in Pillow, "avif" encodes lossy WebP.
+    """
+    if profile not in ENCODING_PROFILES:
+        raise ValueError(f"Unknown image encoding profile: {profile}")
+    if profile == "avif" and not _avif_available():
+        print("AVIF encoding is not available in this Pillow build; encoding lossy WebP instead.")
+        profile = "webp"
+    if profile.startswith("webp") and max(image.width, image.height) > _WEBP_MAX_DIMENSION:
+        print(f"Image of dimensions ({image.width}, {image.height}) is too large for WebP; encoding PNG instead.")
+        profile = "png"
+
+    output = io.BytesIO()
+    if profile == "png":
+        image.save(output, "PNG")
+        return EncodedImage(output.getvalue(), "image/png")
+
+    image = _rgb_or_rgba(image)
+    if profile == "avif":
+        image.save(output, "AVIF", quality=settings.image_avif_quality)
+        return EncodedImage(output.getvalue(), "image/avif")
+    if profile == "webp_lossless":
+        image.save(output, "WEBP", lossless=True, method=settings.image_webp_method)
+    else:
+        image.save(output, "WEBP", quality=settings.image_webp_quality, method=settings.image_webp_method)
+    return EncodedImage(output.getvalue(), "image/webp")
+
 
-    # Add a transparent border around the image
-    bordered_image = add_transparent_border(image, border_size)
+def _rgb_or_rgba(image: Image.Image) -> Image.Image:
+    if image.mode in ("RGB", "RGBA"):
+        return image
+    if image.mode in ("LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+        return image.convert("RGBA")
+    return image.convert("RGB")
 
-    # Rotate the image
-    rotated_image = bordered_image.rotate(rotation_angle, expand=False)
 
-    return rotated_image
+def _avif_available() -> bool:
+    Image.init()
+    return "AVIF" in Image.SAVE
 
 
+def image_mimetype(head: bytes) -> Optional[str]:
+    """
+    Mimetype of an encoded image from its first 16 bytes; None if the format is not recognised.
+    """
+    for offset, signature, mimetype in _IMAGE_SIGNATURES:
+        if head[offset : offset + len(signature)] == signature:
+            return mimetype
+    return None
@@ -0,0 +1,267 @@
+"""
+Background jobs for CPU-heavy work, so that it does not occupy a web worker.
+
+The queue is the `jobs` table: a job is inserted with its input, then handed to a process
+pool owned by the web worker process that created it. Workers claim a job atomically
+(queued -> running), report progress to the row, and store the result or error there, so
+status can be read from any web worker. A job whose worker process dies is requeued (or failed,
+after `settings.job_max_attempts`) as soon as the pool reports it broken. Every web worker also
+sweeps the queue when it starts and every `settings.job_sweep_interval_s`: queued jobs (e.g. left
+by a restart) are dispatched again, and running jobs that have gone `settings.job_stale_after_s`
+without a progress update are requeued.
+
+With `settings.job_workers = 0` jobs run inline in the submitting request.
+
+This module must stay independent of Flask request globals.
+"""
+
+from __future__ import annotations
+
+import io
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from Database import Database
+from bergenomap.config import settings
+from bergenomap.repositories import jobs_repo
+from bergenomap.services import map_ingest_service, tile_service, track_ingest_service
+
+JOB_KIND_STORE_MAP = "store_map"
+JOB_KIND_INGEST_GPX_ARCHIVE = "ingest_gpx_archive"
+
+JobHandler = Callable[[Database, Dict[str, Any], Optional[bytes], map_ingest_service.ProgressCallback], Dict[str, Any]]
+
+_executor_lock = threading.Lock()
+_executor: ProcessPoolExecutor | None = None
+_executor_pid: int | None = None
+
+_sweeper_lock = threading.Lock()
+_sweeper_pid: int | None = None
+
+
+def _run_store_map(
+    db: Database,
+    job: Dict[str, Any],
+    input_data: Optional[bytes],
+    progress: map_ingest_service.ProgressCallback,
+) -> Dict[str, Any]:
+    if not input_data:
+        raise ValueError("Job has no image data")
+    return map_ingest_service.store_registered_map(
+        db,
+        job["username"],
+        input_data,
+        job["params"]["registration_data"],
+        keep_original_format=bool(job["params"].get("keep_original_format")),
+        progress=progress,
+    )
+
+
+def _run_ingest_gpx_archive(
+    db: Database,
+    job: Dict[str, Any],
+    input_data: Optional[bytes],
+    progress: map_ingest_service.ProgressCallback,
+) -> Dict[str, Any]:
+    if not input_data:
+        raise ValueError("Job has no archive data")
+    return track_ingest_service.ingest_gpx_archive(db, job["username"], io.BytesIO(input_data), progress=progress)
+
+
+_HANDLERS: Dict[str, JobHandler] = {
+    JOB_KIND_STORE_MAP: _run_store_map,
+    JOB_KIND_INGEST_GPX_ARCHIVE: _run_ingest_gpx_archive,
+}
+
+
+def submit_job(
+    db: Database,
+    username: str,
+    kind: str,
+    *,
+    params: Dict[str, Any] | None = None,
+    input_data: bytes | None = None,
+) -> str:
+    """
+    Queue a job and hand it to the process pool. Returns the job id.
+    """
+    if kind not in _HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    ensure_started()
+    job_id = str(uuid.uuid4())
+    jobs_repo.create_job(db, job_id=job_id, username=username, kind=kind, params=params, input_data=input_data)
+
+    if settings.job_workers <= 0:
+        _on_job_result(run_job(job_id))
+    else:
+        _dispatch(job_id)
+    return job_id
+
+
+def run_job(job_id: str) -> Dict[str, Any] | None:
+    """
+    Claim and run one job. Runs in a pool worker process; returns the job result, or None
+    if the job was taken by another worker or failed.
+    """
+    db = Database()
+    try:
+        if not jobs_repo.claim_job(db, job_id):
+            return None
+        job = jobs_repo.get_job(db, job_id)
+        handler = _HANDLERS.get(job["kind"])
+        if handler is None:
+            jobs_repo.mark_job_failed(db, job_id, f"Unknown job kind: {job['kind']}")
+            return None
+
+        input_data = jobs_repo.get_job_input(db, job_id)
+
+        def progress(fraction: float, message: str) -> None:
+            jobs_repo.update_job_progress(db, job_id, fraction, message)
+
+        try:
+            result = handler(db, job, input_data, progress)
+        except Exception as exc:
+            traceback.print_exc()
+            if db.connection.in_transaction:
+                db.connection.rollback()
+            jobs_repo.mark_job_failed(db, job_id, str(exc) or type(exc).__name__)
+            return None
+
+        jobs_repo.mark_job_succeeded(db, job_id, result)
+        return result
+    finally:
+        db.close()
+
+
+def ensure_started() -> None:
+    """
+    Create this web worker's process pool, resume jobs left in the queue and start the
+    periodic queue sweep. Called by submit_job and the /api/jobs routes: gunicorn forks
+    workers, so this happens lazily per process, on the first use of the job system.
+    """
+    global _sweeper_pid
+    if settings.job_workers <= 0:
+        return
+    _get_executor()
+    pid = os.getpid()
+    if _sweeper_pid == pid:
+        return
+    with _sweeper_lock:
+        if _sweeper_pid == pid:
+            return
+        _sweeper_pid = pid
+        thread = threading.Thread(target=_sweep_loop, name="job-sweeper", daemon=True)
+        thread.start()
+
+
+def _sweep_loop() -> None:
+    while True:
+        time.sleep(settings.job_sweep_interval_s)
+        try:
+            _resume_queued_jobs()
+        except Exception as exc:
+            print(f"Job sweep failed: {exc}")
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is not None and _executor_pid == pid:
+        return _executor
+    with _executor_lock:
+        if _executor is not None and _executor_pid == pid:
+            return _executor
+        # Spawn rather than fork: web workers run threads (session sweeper), which fork does not copy safely.
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.job_workers,
+            mp_context=multiprocessing.get_context(settings.job_start_method),
+        )
+        _executor_pid = pid
+    _resume_queued_jobs()
+    return _executor
+
+
+def _reset_executor(broken: ProcessPoolExecutor) -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _dispatch(job_id: str) -> None:
+    executor = _get_executor()
+    try:
+        future = executor.submit(run_job, job_id)
+    except BrokenProcessPool:
+        _reset_executor(executor)
+        executor = _get_executor()
+        future = executor.submit(run_job, job_id)
+    future.add_done_callback(lambda f: _on_job_done(executor, job_id, f))
+
+
+def _on_job_done(executor: ProcessPoolExecutor, job_id: str, future: Future) -> None:
+    try:
+        result = future.result()
+    except BrokenProcessPool:
+        # A worker process died (e.g. out of memory). Every job handed to this pool ends up here;
+        # each is retried on a new pool until it has used up its attempts.
+        print(f"Job worker process died while running job {job_id}.")
+        _reset_executor(executor)
+        _release_job(job_id, "Worker process died while running the job", max_attempts=settings.job_max_attempts)
+        return
+    except Exception as exc:
+        # run_job failed outside the job handler (which records its own errors), e.g. on the database.
+        traceback.print_exc()
+        _release_job(job_id, str(exc) or type(exc).__name__, max_attempts=0)
+        return
+    _on_job_result(result)
+
+
+def _release_job(job_id: str, error: str, *, max_attempts: int) -> None:
+    db = Database()
+    try:
+        status = jobs_repo.release_job(db, job_id, error=error, max_attempts=max_attempts)
+    except Exception as exc:
+        # Left running; the periodic sweep requeues it once it has gone stale.
+        print(f"Could not release job {job_id}: {exc}")
+        return
+    finally:
+        db.close()
+    if status == jobs_repo.STATUS_QUEUED:
+        _dispatch(job_id)
+
+
+def _on_job_result(result: Dict[str, Any] | None) -> None:
+    # Free the disk space of the tiles of a re-registered map's previous image.
+    if result and "map_id" in result:
+        tile_service.invalidate_map_tiles(result["map_id"])
+
+
+def _resume_queued_jobs() -> None:
+    db = Database()
+    try:
+        jobs_repo.requeue_stale_jobs(
+            db,
+            stale_after_s=settings.job_stale_after_s,
+            max_attempts=settings.job_max_attempts,
+        )
+        jobs_repo.delete_finished_jobs(db, older_than_s=settings.job_retention_s)
+        queued = jobs_repo.list_queued_job_ids(db)
+    except Exception as exc:
+        print(f"Could not resume queued jobs: {exc}")
+        return
+    finally:
+        db.close()
+
+    # Every web worker does this on startup; claim_job makes sure each job runs only once.
+    for job_id in queued:
+        _dispatch(job_id)
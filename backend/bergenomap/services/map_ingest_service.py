@@ -0,0 +1,108 @@
+"""
+Storing a newly registered map: pad + rotate the uploaded image, encode the original and
+final images (settings.map_original_encoding / map_final_encoding) and write them together
+with the registration data.
+
+This is the CPU-heavy part of /api/transformAndStoreMapData and runs in a job worker
+process (see job_service), so it must stay independent of Flask request globals.
+"""
+
+from __future__ import annotations
+
+import io
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from PIL import Image
+
+from Database import Database
+from bergenomap.config import settings
+from bergenomap.repositories import map_files_repo, maps_repo
+from bergenomap.services import projection_service
+from bergenomap.services.image_service import add_transparent_border_and_rotate_image, encode_image
+
+ProgressCallback = Callable[[float, str], None]
+
+
+def store_registered_map(
+    db: Database,
+    username: str,
+    image_bytes: bytes,
+    registration_data: Dict[str, Any],
+    *,
+    keep_original_format: bool = False,
+    progress: Optional[ProgressCallback] = None,
+) -> Dict[str, Any]:
+    """
+    Returns {"map_id", "map_name"}. Raises PermissionError if the map name belongs to another user.
+
+    With keep_original_format the uploaded file is stored as the original image as is, instead
+    of re-encoded.
+    """
+    report = progress or (lambda fraction, message: None)
+    rotation_angle = float(registration_data["optimal_rotation_angle"])
+
+    report(0.05, "Decoding image")
+    image = Image.open(io.BytesIO(image_bytes))
+    image.load()
+
+    border_size = int(max(image.width, image.height) * settings.default_border_percentage)
+
+    with ThreadPoolExecutor(max_workers=1) as encoder:
+        # The original is encoded on a second thread while this one rotates; both release the GIL.
+        original_future = None
+        if not keep_original_format:
+            original_future = encoder.submit(encode_image, image, settings.map_original_encoding)
+
+        report(0.2, "Rotating image")
+        processed_image = add_transparent_border_and_rotate_image(image, border_size, rotation_angle)
+
+        print(
+            f"Transformed image of dimensions ({image.width}, {image.height}) to image of dimensions "
+            f"({processed_image.width}, {processed_image.height}), border size {border_size}"
+        )
+
+        report(0.4, "Encoding final image")
+        final_map_data = encode_image(processed_image, settings.map_final_encoding).data
+
+        report(0.7, "Encoding original image")
+        original_map_data = original_future.result().data if original_future else image_bytes
+
+    # Stored so that pixel <-> lat/lon projection never has to refit the control points.
+    try:
+        transform = projection_service.compute_map_transform(registration_data)
+        registration_data["registration_transform"] = transform.to_dict()
+    except (KeyError, TypeError, ValueError):
+        traceback.print_exc()
+
+    report(0.9, "Saving map")
+    with db.transaction():
+        map_id = maps_repo.insert_map(db, username, registration_data)
+        map_files_repo.insert_original(db, map_id, original_map_data)
+        map_files_repo.insert_final(db, map_id, final_map_data)
+
+    print(f"Registered map \"{registration_data['map_name']}\" added to database with id {map_id}.")
+
+    # OCR + AI metadata extraction (DISABLED by default)
+    #
+    # This is intentionally commented out while we tune OCR parameters + prompts.
+    # The intended workflow is to run `scripts/run_map_ocr_ai_backfill.py` against
+    # selected maps, inspect the debug outputs, and only then enable this block.
+    #
+    # IMPORTANT: Do not expose OpenAI calls via public API endpoints.
+    #
+    # try:
+    #     from bergenomap.services.map_metadata_ocr_pipeline import run_map_metadata_pipeline
+    #
+    #     result = run_map_metadata_pipeline(processed_image)
+    #     maps_repo.update_map_metadata_if_default(
+    #         db,
+    #         username=username,
+    #         map_id=map_id,
+    #         metadata=result.metadata,
+    #     )
+    # except Exception:
+    #     traceback.print_exc()
+
+    return {"map_id": map_id, "map_name": registration_data["map_name"]}
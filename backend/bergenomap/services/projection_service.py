@@ -0,0 +1,78 @@
+"""
+Per-map registration transforms and batch projection between map pixels and lat/lon.
+
+The transform is computed once at registration (Procrustes fit over the control points)
+and stored on the map row; maps registered earlier get it computed on first use.
+
+This module must stay independent of Flask request globals.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict
+
+import numpy as np
+
+from Database import Database
+from bergenomap.repositories import maps_repo
+from bergenomap.utils.projection import FRAME_OVERLAY, MapTransform, transform_from_procrustes
+from bergenomap.utils.track_codec import TrackArrays
+from OptimizeRotation import compute_procrustes_registration
+
+
+DIRECTION_PIXEL_TO_LATLON = "pixel_to_latlon"
+DIRECTION_LATLON_TO_PIXEL = "latlon_to_pixel"
+
+
+def compute_map_transform(map_data: Dict[str, Any]) -> MapTransform:
+    """
+    Fit the similarity transform from a map's registration data (control points + overlay size).
+    With robust registration, only the control points marked as inliers are used.
+    """
+    pixel_coords = list(map_data["selected_pixel_coords"])
+    real_coords = list(map_data["selected_realworld_coords"])
+    inliers = map_data.get("inliers")
+    if inliers and len(inliers) == len(pixel_coords):
+        pixel_coords = [p for p, keep in zip(pixel_coords, inliers) if keep]
+        real_coords = [r for r, keep in zip(real_coords, inliers) if keep]
+
+    width = float(map_data["overlay_width"])
+    height = float(map_data["overlay_height"])
+    registration = compute_procrustes_registration(width, height, pixel_coords, real_coords)
+    return transform_from_procrustes(registration, width, height)
+
+
+def get_map_transform(db: Database, map_entry: Dict[str, Any]) -> MapTransform:
+    """
+    Stored transform for the map, computing and storing it first if the map predates it.
+    Raises ValueError if the map's control points cannot determine a transform.
+    """
+    map_id = int(map_entry["map_id"])
+    stored = maps_repo.get_registration_transform(db, map_id)
+    if stored is not None:
+        return MapTransform.from_dict(stored)
+
+    transform = compute_map_transform(map_entry)
+    maps_repo.set_registration_transform(db, map_id, transform.to_dict())
+    return transform
+
+
+def project_points(
+    transform: MapTransform,
+    points: Any,
+    *,
+    direction: str,
+    frame: str = FRAME_OVERLAY,
+) -> np.ndarray:
+    if direction == DIRECTION_PIXEL_TO_LATLON:
+        return transform.pixel_to_latlon(points, frame=frame)
+    if direction == DIRECTION_LATLON_TO_PIXEL:
+        return transform.latlon_to_pixel(points, frame=frame)
+    raise ValueError(f"Unknown projection direction: {direction}")
+
+
+def project_track(transform: MapTransform, track: TrackArrays, *, frame: str = FRAME_OVERLAY) -> np.ndarray:
+    """
+    All points of a track as (n, 2) pixel coordinates on the map.
+    """
+    return transform.latlon_to_pixel(np.column_stack([track.lat, track.lon]), frame=frame)
@@ -0,0 +1,166 @@
+"""
+Session validation with an in-process cache.
+
+`check_authentication` runs before every /api/ request; this keeps the common case
+(a known, active session) from hitting SQLite. Cached entries live for at most
+`settings.session_cache_ttl_s`, so a logout in another worker process takes effect
+within that window. Logout in this process invalidates immediately.
+
+A daemon thread per worker process periodically deletes expired rows from `sessions`.
+
+This module must stay independent of Flask request globals.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from Database import Database
+from bergenomap.config import settings
+from bergenomap.repositories import sessions_repo
+
+
+class SessionCache:
+    """
+    Size-bounded LRU of session_key -> session dict, with a per-entry TTL.
+    Thread-safe. Counts hits, misses and evictions.
+    """
+
+    def __init__(self, *, max_entries: int, ttl_s: float) -> None:
+        self._max_entries = max_entries
+        self._ttl_s = ttl_s
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, session_key: str) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(session_key)
+            if entry is None:
+                self.misses += 1
+                return None
+            cached_at, session = entry
+            if now - cached_at > self._ttl_s:
+                del self._entries[session_key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(session_key)
+            self.hits += 1
+            return session
+
+    def put(self, session_key: str, session: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[session_key] = (time.monotonic(), session)
+            self._entries.move_to_end(session_key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, session_key: str) -> None:
+        with self._lock:
+            self._entries.pop(session_key, None)
+
+    def purge_expired(self, now: datetime) -> int:
+        with self._lock:
+            expired = [key for key, (_, session) in self._entries.items() if session["expires_at"] <= now]
+            for key in expired:
+                del self._entries[key]
+            return len(expired)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self._max_entries,
+                "ttl_s": self._ttl_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": (self.hits / lookups) if lookups else None,
+            }
+
+
+session_cache = SessionCache(
+    max_entries=settings.session_cache_max_entries,
+    ttl_s=settings.session_cache_ttl_s,
+)
+
+_sweeper_lock = threading.Lock()
+_sweeper_pid: int | None = None
+
+
+def get_valid_session(db: Database, session_key: str) -> Optional[Dict[str, Any]]:
+    """
+    Return the active, unexpired session for `session_key`, or None.
+    """
+    now = datetime.now()
+    session = session_cache.get(session_key)
+    if session is None:
+        session = sessions_repo.validate_session(db, session_key)
+        if session is None:
+            return None
+        session_cache.put(session_key, session)
+
+    if session["expires_at"] <= now:
+        session_cache.invalidate(session_key)
+        return None
+    return session
+
+
+def create_session(db: Database, username: str, session_key: str, expires_at: datetime) -> None:
+    sessions_repo.create_session(db, username, session_key, expires_at)
+    session_cache.put(session_key, {"username": username, "expires_at": expires_at, "is_active": True})
+
+
+def deactivate_session(db: Database, session_key: str) -> None:
+    session_cache.invalidate(session_key)
+    sessions_repo.deactivate_session(db, session_key)
+
+
+def sweep_expired_sessions(db: Database) -> int:
+    """
+    Delete expired rows from `sessions` and drop expired cache entries. Returns deleted row count.
+    """
+    now = datetime.now()
+    session_cache.purge_expired(now)
+    return sessions_repo.delete_expired_sessions(db, now)
+
+
+def ensure_sweeper_started() -> None:
+    """
+    Start the background sweep thread once per worker process.
+    Gunicorn forks workers, so a thread started before the fork would not survive in them.
+    """
+    global _sweeper_pid
+    pid = os.getpid()
+    if _sweeper_pid == pid:
+        return
+    with _sweeper_lock:
+        if _sweeper_pid == pid:
+            return
+        _sweeper_pid = pid
+        thread = threading.Thread(target=_sweep_loop, name="session-sweeper", daemon=True)
+        thread.start()
+
+
+def _sweep_loop() -> None:
+    while True:
+        time.sleep(settings.session_sweep_interval_s)
+        db = Database()
+        try:
+            deleted = sweep_expired_sessions(db)
+            if deleted:
+                print(f"Purged {deleted} expired sessions.")
+        except Exception as exc:
+            print(f"Session sweep failed: {exc}")
+        finally:
+            db.close()
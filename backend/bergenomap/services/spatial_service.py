@@ -0,0 +1,76 @@
+"""
+Spatial lookups over registered maps.
+
+Bounding-box candidates come from the R*Tree indexes maintained by the repositories.
+The indexed box of a map is its overlay extent (nw_coords/se_coords), which includes the
+transparent border and the corners left empty by rotation, so "does this map cover a point"
+is refined here against the rotated map content.
+
+This module must stay independent of Flask request globals.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, List, Tuple
+
+from Database import Database
+from bergenomap.config import settings
+from bergenomap.repositories import maps_repo
+from bergenomap.services.tile_service import latlon_to_mercator, map_mercator_box
+
+
+def content_size(overlay_width: int, overlay_height: int) -> Tuple[int, int]:
+    """
+    Size of the original (unpadded) map inside an overlay of the given size.
+
+    Overlays are padded with border = int(max(w, h) * default_border_percentage) on each side
+    before rotation (see /api/processDroppedImage and /api/transformAndStoreMapData).
+    """
+    longest = max(overlay_width, overlay_height)
+    estimate = int(longest / (1 + 2 * settings.default_border_percentage))
+    for candidate in range(max(estimate - 2, 1), estimate + 3):
+        border = int(candidate * settings.default_border_percentage)
+        if candidate + 2 * border == longest:
+            return overlay_width - 2 * border, overlay_height - 2 * border
+    border = int(round((longest - estimate) / 2))
+    return max(overlay_width - 2 * border, 1), max(overlay_height - 2 * border, 1)
+
+
+def map_covers_point(map_entry: Dict[str, Any], lat: float, lon: float) -> bool:
+    """
+    True if (lat, lon) falls on the map content itself, not on its padding.
+    """
+    width = map_entry.get("overlay_width") or 0
+    height = map_entry.get("overlay_height") or 0
+    left, top, right, bottom = map_mercator_box(map_entry)
+    if width <= 0 or height <= 0 or right <= left or bottom <= top:
+        return False
+
+    # Point in final (rotated, padded) image pixels; the overlay is stretched linearly in Mercator.
+    x, y = latlon_to_mercator(lat, lon)
+    px = (x - left) / (right - left) * width
+    py = (y - top) / (bottom - top) * height
+
+    # The final image is the padded original rotated counter-clockwise (PIL Image.rotate)
+    # about its center; undo that rotation and test against the original rectangle.
+    dx = px - width / 2.0
+    dy = py - height / 2.0
+    theta = math.radians(float(map_entry.get("optimal_rotation_angle") or 0.0))
+    ux = dx * math.cos(theta) - dy * math.sin(theta)
+    uy = dx * math.sin(theta) + dy * math.cos(theta)
+
+    content_width, content_height = content_size(int(width), int(height))
+    return abs(ux) <= content_width / 2.0 and abs(uy) <= content_height / 2.0
+
+
+def maps_covering_point(db: Database, username: str, lat: float, lon: float) -> List[Dict[str, Any]]:
+    candidates = maps_repo.list_maps_in_bbox(
+        db,
+        username,
+        min_lat=lat,
+        min_lon=lon,
+        max_lat=lat,
+        max_lon=lon,
+    )
+    return [m for m in candidates if map_covers_point(m, lat, lon)]
@@ -6,26 +6,33 @@ Strava synchronization service.
 This module orchestrates:
 - token refresh
 - cached activity listing
-- importing selected activities as GPX bytes stored in our DB
+- importing selected activities as binary track data (see bergenomap/utils/track_codec.py),
+  fetched concurrently within Strava's rate limits
 
 This module must stay independent of Flask request globals.
 """
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
-from datetime import datetime, timedelta, timezone
-import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
 from typing import Any, Dict, Iterable
 
+import numpy as np
+
 from Database import Database
+from bergenomap.config import settings
 from bergenomap.integrations.strava_client import StravaClient, StravaApiError
 from bergenomap.repositories import strava_repo
-from bergenomap.services.track_service import compute_gpx_bounds
-from gpx_parser import parse_strava_gpx
+from bergenomap.services import track_service
+from bergenomap.utils.track_codec import TrackArrays, encode_track, track_bounds
 
 
 STRAVA_CLIENT_ID_KEY = "STRAVA_CLIENT_ID"
 STRAVA_CLIENT_SECRET_KEY = "STRAVA_CLIENT_SECRET"
 
+# Streams requested when importing an activity.
+IMPORT_STREAM_KEYS = "latlng,time,altitude,heartrate,cadence"
+
 # Mapping of Strava workout_type integer to human-readable text
 # Only these values are stored; others are left as NULL
 WORKOUT_TYPE_MAP = {
@@ -94,6 +101,24 @@ def ensure_valid_access_token(db: Database, username: str, *, client: StravaClie
     return tokens.access_token
 
 
+SYNC_MODE_INCREMENTAL = "incremental"
+SYNC_MODE_FULL = "full"
+SYNC_MODE_RECONCILE = "reconcile"
+SYNC_MODES = (SYNC_MODE_INCREMENTAL, SYNC_MODE_FULL, SYNC_MODE_RECONCILE)
+
+# Summary fields compared to decide whether a cached activity changed.
+_SUMMARY_FIELDS = ("name", "type", "start_date", "start_lat", "start_lon", "distance", "elapsed_time", "workout_type")
+
+
+def resolve_sync_after(db: Database, username: str, *, after: int | None, before: int | None) -> int | None:
+    """
+    `after=` for an incremental sync: the given value, or the stored watermark when no range was given.
+    """
+    if after is not None or before is not None:
+        return after
+    return strava_repo.get_sync_state(db, username)["sync_watermark"]
+
+
 def sync_activity_summaries(
     db: Database,
     username: str,
@@ -103,15 +128,35 @@ def sync_activity_summaries(
     before: int | None = None,
     per_page: int = 200,
     max_pages: int = 50,
+    mode: str = SYNC_MODE_INCREMENTAL,
 ) -> dict:
     """
     Fetch activity summaries from Strava and upsert into our cache table.
     Returns a small summary dict for UI use.
+
+    Modes:
+    - incremental: without an explicit range, only activities that started after the stored
+      watermark (usually a single page).
+    - full: walk everything in the given range (or the whole history) from the newest.
+    - reconcile: full walk of the whole history that also deletes cached activities no longer
+      on Strava (unless imported). Catches edits and deletions of older activities, which
+      incremental syncs do not see.
     """
+    if mode not in SYNC_MODES:
+        raise ValueError(f"Unknown sync mode: {mode}")
+    if mode == SYNC_MODE_RECONCILE:
+        after = before = None
+    elif mode == SYNC_MODE_INCREMENTAL:
+        after = resolve_sync_after(db, username, after=after, before=before)
+
     access_token = ensure_valid_access_token(db, username, client=client)
+    cached = {a["activity_id"]: a for a in strava_repo.list_activities(db, username)}
 
     total = 0
+    changed = 0
     pages = 0
+    newest_start: int | None = None
+    seen_ids: set[int] = set()
     for page in range(1, max_pages + 1):
         pages += 1
         activities = client.list_activities(
@@ -124,37 +169,34 @@ def sync_activity_summaries(
         if not activities:
             break
 
-        for activity in activities:
-            if not isinstance(activity, dict):
-                continue
-            activity_id = activity.get("id")
-            if activity_id is None:
-                continue
-            try:
-                activity_id_int = int(activity_id)
-            except (TypeError, ValueError):
-                continue
+        page_result = _upsert_activity_summaries(db, username, activities, cached)
+        total += page_result["synced_count"]
+        changed += page_result["changed_count"]
+        seen_ids.update(page_result["activity_ids"])
+        newest_start = _max_optional(newest_start, page_result["newest_start"])
+        if len(activities) < per_page:
+            break
 
-            start_lat, start_lon = _extract_start_latlon(activity)
-            workout_type = map_workout_type(_maybe_int(activity.get("workout_type")))
-            strava_repo.upsert_activity(
-                db,
-                username,
-                activity_id=activity_id_int,
-                name=activity.get("name"),
-                activity_type=activity.get("type"),
-                start_date=activity.get("start_date"),
-                start_lat=start_lat,
-                start_lon=start_lon,
-                distance=_maybe_float(activity.get("distance")),
-                elapsed_time=_maybe_int(activity.get("elapsed_time")),
-                updated_at=activity.get("updated_at"),
-                gpx_data=b"",
-                workout_type=workout_type,
-            )
-            total += 1
-
-    return {"synced_count": total, "pages": pages}
+    _advance_watermark(db, username, after=after, before=before, newest_start=newest_start)
+
+    result = {
+        "synced_count": total,
+        "changed_count": changed,
+        "pages": pages,
+        "mode": mode,
+        "after": after,
+        "watermark": strava_repo.get_sync_state(db, username)["sync_watermark"],
+    }
+    if mode == SYNC_MODE_RECONCILE:
+        if pages >= max_pages:
+            # History not fully walked; absent ids may just be on a page we did not read.
+            result["deleted_count"] = 0
+        else:
+            missing = [activity_id for activity_id in cached if activity_id not in seen_ids]
+            with db.transaction():
+                result["deleted_count"] = strava_repo.delete_unimported_activities(db, username, missing)
+                strava_repo.mark_reconciled(db, username)
+    return result
 
 
 def sync_activity_summaries_page(
@@ -170,6 +212,9 @@ def sync_activity_summaries_page(
     """
     Fetch a single page of activity summaries from Strava and upsert into our cache table.
     Returns counts so the UI can show progress.
+
+    For an incremental walk, get `after` from resolve_sync_after once and pass the same value
+    for every page; the watermark moves as pages are stored.
     """
     access_token = ensure_valid_access_token(db, username, client=client)
     activities = client.list_activities(
@@ -182,39 +227,122 @@ def sync_activity_summaries_page(
 
     received = len(activities) if isinstance(activities, list) else 0
     synced = 0
+    changed = 0
 
-    if isinstance(activities, list):
-        for activity in activities:
-            if not isinstance(activity, dict):
-                continue
-            activity_id = activity.get("id")
-            if activity_id is None:
-                continue
-            try:
-                activity_id_int = int(activity_id)
-            except (TypeError, ValueError):
-                continue
+    if isinstance(activities, list) and activities:
+        cached = {a["activity_id"]: a for a in strava_repo.list_activities(db, username)}
+        with db.transaction():
+            page_result = _upsert_activity_summaries(db, username, activities, cached)
+            _advance_watermark(db, username, after=after, before=before, newest_start=page_result["newest_start"])
+        synced = page_result["synced_count"]
+        changed = page_result["changed_count"]
 
-            start_lat, start_lon = _extract_start_latlon(activity)
-            workout_type = map_workout_type(_maybe_int(activity.get("workout_type")))
-            strava_repo.upsert_activity(
-                db,
-                username,
-                activity_id=activity_id_int,
-                name=activity.get("name"),
-                activity_type=activity.get("type"),
-                start_date=activity.get("start_date"),
-                start_lat=start_lat,
-                start_lon=start_lon,
-                distance=_maybe_float(activity.get("distance")),
-                elapsed_time=_maybe_int(activity.get("elapsed_time")),
-                updated_at=activity.get("updated_at"),
-                gpx_data=b"",
-                workout_type=workout_type,
-            )
-            synced += 1
-
-    return {"page": page, "received_count": received, "synced_count": synced}
+    return {"page": page, "received_count": received, "synced_count": synced, "changed_count": changed, "after": after}
+
+
+def _upsert_activity_summaries(db: Database, username: str, activities: list, cached: dict) -> dict:
+    """
+    Upsert summaries that are new or changed compared to `cached` (which is updated in place).
+    """
+    synced = 0
+    newest_start: int | None = None
+    activity_ids: list[int] = []
+    rows: list[dict] = []
+    for activity in activities:
+        if not isinstance(activity, dict):
+            continue
+        activity_id = activity.get("id")
+        if activity_id is None:
+            continue
+        try:
+            activity_id_int = int(activity_id)
+        except (TypeError, ValueError):
+            continue
+
+        start_lat, start_lon = _extract_start_latlon(activity)
+        summary = {
+            "name": activity.get("name"),
+            "type": activity.get("type"),
+            "start_date": activity.get("start_date"),
+            "start_lat": start_lat,
+            "start_lon": start_lon,
+            "distance": _maybe_float(activity.get("distance")),
+            "elapsed_time": _maybe_int(activity.get("elapsed_time")),
+            "workout_type": map_workout_type(_maybe_int(activity.get("workout_type"))),
+        }
+        synced += 1
+        activity_ids.append(activity_id_int)
+        start_dt = _parse_start_date(summary["start_date"])
+        if start_dt is not None:
+            newest_start = _max_optional(newest_start, int(start_dt.timestamp()))
+
+        existing = cached.get(activity_id_int)
+        if existing and all(existing.get(field) == summary[field] for field in _SUMMARY_FIELDS):
+            continue
+
+        rows.append(
+            {
+                "activity_id": activity_id_int,
+                "name": summary["name"],
+                "activity_type": summary["type"],
+                "start_date": summary["start_date"],
+                "start_lat": start_lat,
+                "start_lon": start_lon,
+                "distance": summary["distance"],
+                "elapsed_time": summary["elapsed_time"],
+                "updated_at": activity.get("updated_at"),
+                "workout_type": summary["workout_type"],
+            }
+        )
+        cached[activity_id_int] = dict(existing or {}, **summary)
+
+    # One statement and one commit for the whole page.
+    strava_repo.upsert_activities_bulk(db, username, rows)
+
+    return {
+        "synced_count": synced,
+        "changed_count": len(rows),
+        "newest_start": newest_start,
+        "activity_ids": activity_ids,
+    }
+
+
+def _advance_watermark(
+    db: Database,
+    username: str,
+    *,
+    after: int | None,
+    before: int | None,
+    newest_start: int | None,
+) -> None:
+    """
+    Only a sync that reaches the present and starts at or before the current watermark
+    covers everything after it, so only then may the watermark move forward.
+    """
+    if newest_start is None or before is not None:
+        return
+    if after is not None:
+        watermark = strava_repo.get_sync_state(db, username)["sync_watermark"]
+        if watermark is None or after > watermark:
+            return
+    strava_repo.advance_sync_watermark(db, username, newest_start)
+
+
+def _max_optional(a: int | None, b: int | None) -> int | None:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
+
+
+@dataclass(frozen=True)
+class _FetchedActivity:
+    detail: dict
+    track_data: bytes
+    bounds: tuple[float, float, float, float]
+    lods: list[dict]
+    stats: dict
 
 
 def import_activities(
@@ -224,7 +352,14 @@ def import_activities(
     client: StravaClient,
     activity_ids: Iterable[int],
     overwrite: bool = False,
+    max_workers: int | None = None,
 ) -> ImportResult:
+    """
+    Activities are fetched from Strava concurrently on a bounded thread pool; the client's
+    rate limiter keeps the workers within Strava's quotas. DB writes stay on the calling
+    thread and are committed in batches of settings.strava_import_commit_batch activities.
+    Results are reported in the order the activity ids were given.
+    """
     access_token = ensure_valid_access_token(db, username, client=client)
     cached = {a["activity_id"]: a for a in strava_repo.list_activities(db, username)}
 
@@ -232,6 +367,7 @@ def import_activities(
     failed: list[dict] = []
     skipped: list[dict] = []
 
+    to_fetch: list[int] = []
     for activity_id in activity_ids:
         try:
             activity_id_int = int(activity_id)
@@ -243,90 +379,169 @@ def import_activities(
         if meta and meta.get("has_gpx") and not overwrite:
             skipped.append({"activity_id": activity_id_int, "reason": "already_imported"})
             continue
+        if activity_id_int not in to_fetch:
+            to_fetch.append(activity_id_int)
+
+    if not to_fetch:
+        return ImportResult(imported=imported, failed=failed, skipped=skipped)
+
+    workers = min(max_workers or settings.strava_import_workers, len(to_fetch))
+    order = {activity_id: index for index, activity_id in enumerate(to_fetch)}
+    fetch_failed: list[dict] = []
+    pending: list[tuple[int, _FetchedActivity]] = []
+    batch_size = max(int(settings.strava_import_commit_batch), 1)
+
+    def flush() -> None:
+        # Only buffered results are written, so the write lock is never held across a fetch.
+        with db.transaction():
+            for activity_id_int, fetched in pending:
+                try:
+                    # Savepoint per activity: a failing one is undone without losing the batch.
+                    with db.transaction():
+                        imported.append(
+                            _store_activity(db, username, activity_id_int, cached.get(activity_id_int), fetched)
+                        )
+                except Exception as exc:
+                    fetch_failed.append({"activity_id": activity_id_int, "error": f"Unexpected error: {exc}"})
+        pending.clear()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="strava-import") as pool:
+        futures = {
+            pool.submit(
+                _fetch_activity,
+                client,
+                access_token,
+                activity_id,
+                (cached.get(activity_id) or {}).get("start_date"),
+            ): activity_id
+            for activity_id in to_fetch
+        }
+        for future in as_completed(futures):
+            activity_id_int = futures[future]
+            try:
+                pending.append((activity_id_int, future.result()))
+            except (StravaApiError, ValueError) as exc:
+                fetch_failed.append({"activity_id": activity_id_int, "error": str(exc)})
+            except Exception as exc:
+                fetch_failed.append({"activity_id": activity_id_int, "error": f"Unexpected error: {exc}"})
+            if len(pending) >= batch_size:
+                flush()
+    if pending:
+        flush()
+
+    imported.sort(key=lambda item: order[item["activity_id"]])
+    fetch_failed.sort(key=lambda item: order[item["activity_id"]])
+    return ImportResult(imported=imported, failed=failed + fetch_failed, skipped=skipped)
+
+
+def _fetch_activity(client: StravaClient, access_token: str, activity_id: int, start_date: str | None) -> _FetchedActivity:
+    """
+    Network, decoding, simplification and statistics part of an import; runs on a pool thread and does
+    not touch the DB.
+    """
+    # Fetch detailed activity info for description and workout_type
+    activity_detail = client.get_activity(access_token=access_token, activity_id=activity_id)
+    if not isinstance(activity_detail, dict):
+        activity_detail = {}
 
-        start_date = meta.get("start_date") if meta else None
+    streams = client.get_activity_streams(
+        access_token=access_token,
+        activity_id=activity_id,
+        keys=IMPORT_STREAM_KEYS,
+    )
+    track = _streams_to_track_arrays(activity_id=activity_id, start_date=start_date, streams=streams)
+    bounds = track_bounds(track)
+    if bounds is None:
+        raise ValueError("No valid coordinates found in streams.")
+    return _FetchedActivity(
+        detail=activity_detail,
+        track_data=encode_track(track),
+        bounds=bounds,
+        lods=track_service.build_track_lods(track),
+        stats=track_service.build_track_stats(track),
+    )
 
-        try:
-            # Fetch detailed activity info for description and workout_type
-            activity_detail = client.get_activity(access_token=access_token, activity_id=activity_id_int)
-            description = activity_detail.get("description") if isinstance(activity_detail, dict) else None
-            workout_type = map_workout_type(_maybe_int(activity_detail.get("workout_type"))) if isinstance(activity_detail, dict) else None
-
-            streams = client.get_activity_streams(access_token=access_token, activity_id=activity_id_int)
-            gpx_bytes = _streams_to_gpx_bytes(activity_id=activity_id_int, start_date=start_date, streams=streams)
-            parsed_preview = parse_strava_gpx(gpx_bytes)
-            bounds = compute_gpx_bounds(parsed_preview)
-            if bounds is None:
-                raise ValueError("No valid coordinates found in streams.")
-            min_lat, min_lon, max_lat, max_lon = bounds
-
-            # Ensure we have a row in strava_activities even if the user didn't sync first.
-            if not meta:
-                strava_repo.upsert_activity(
-                    db,
-                    username,
-                    activity_id=activity_id_int,
-                    name=activity_detail.get("name") if isinstance(activity_detail, dict) else None,
-                    activity_type=activity_detail.get("type") if isinstance(activity_detail, dict) else None,
-                    start_date=start_date,
-                    start_lat=None,
-                    start_lon=None,
-                    distance=None,
-                    elapsed_time=None,
-                    updated_at=None,
-                    gpx_data=b"",
-                    workout_type=workout_type,
-                    description=description,
-                )
-            else:
-                # Update existing activity with description and workout_type from detail
-                strava_repo.upsert_activity(
-                    db,
-                    username,
-                    activity_id=activity_id_int,
-                    name=meta.get("name"),
-                    activity_type=meta.get("type"),
-                    start_date=meta.get("start_date"),
-                    start_lat=meta.get("start_lat"),
-                    start_lon=meta.get("start_lon"),
-                    distance=meta.get("distance"),
-                    elapsed_time=meta.get("elapsed_time"),
-                    updated_at=meta.get("updated_at"),
-                    gpx_data=b"",
-                    workout_type=workout_type,
-                    description=description,
-                )
-            strava_repo.set_activity_gpx(db, username, activity_id_int, gpx_bytes)
-            strava_repo.upsert_import(
-                db,
-                username,
-                activity_id=activity_id_int,
-                min_lat=min_lat,
-                min_lon=min_lon,
-                max_lat=max_lat,
-                max_lon=max_lon,
-            )
-            imported.append(
-                {
-                    "activity_id": activity_id_int,
-                    "min_lat": min_lat,
-                    "min_lon": min_lon,
-                    "max_lat": max_lat,
-                    "max_lon": max_lon,
-                }
-            )
-        except (StravaApiError, ValueError) as exc:
-            failed.append({"activity_id": activity_id_int, "error": str(exc)})
-        except Exception as exc:
-            failed.append({"activity_id": activity_id_int, "error": f"Unexpected error: {exc}"})
-
-    return ImportResult(imported=imported, failed=failed, skipped=skipped)
+
+def _store_activity(
+    db: Database,
+    username: str,
+    activity_id: int,
+    meta: dict | None,
+    fetched: _FetchedActivity,
+) -> dict:
+    activity_detail = fetched.detail
+    description = activity_detail.get("description")
+    workout_type = map_workout_type(_maybe_int(activity_detail.get("workout_type")))
+    min_lat, min_lon, max_lat, max_lon = fetched.bounds
+
+    # Ensure we have a row in strava_activities even if the user didn't sync first.
+    if not meta:
+        strava_repo.upsert_activity(
+            db,
+            username,
+            activity_id=activity_id,
+            name=activity_detail.get("name"),
+            activity_type=activity_detail.get("type"),
+            start_date=None,
+            start_lat=None,
+            start_lon=None,
+            distance=None,
+            elapsed_time=None,
+            updated_at=None,
+            gpx_data=b"",
+            workout_type=workout_type,
+            description=description,
+        )
+    else:
+        # Update existing activity with description and workout_type from detail
+        strava_repo.upsert_activity(
+            db,
+            username,
+            activity_id=activity_id,
+            name=meta.get("name"),
+            activity_type=meta.get("type"),
+            start_date=meta.get("start_date"),
+            start_lat=meta.get("start_lat"),
+            start_lon=meta.get("start_lon"),
+            distance=meta.get("distance"),
+            elapsed_time=meta.get("elapsed_time"),
+            updated_at=meta.get("updated_at"),
+            gpx_data=b"",
+            workout_type=workout_type,
+            description=description,
+        )
+    strava_repo.set_activity_track(db, username, activity_id, fetched.track_data)
+    track_service.store_track_lods(db, username, -activity_id, fetched.lods)
+    track_service.store_track_stats(db, username, -activity_id, fetched.stats)
+    track_service.invalidate_cached_track(username, -activity_id)
+    track_service.delete_strava_track_gpx_exports(username, activity_id)
+    strava_repo.upsert_import(
+        db,
+        username,
+        activity_id=activity_id,
+        min_lat=min_lat,
+        min_lon=min_lon,
+        max_lat=max_lat,
+        max_lon=max_lon,
+    )
+    return {
+        "activity_id": activity_id,
+        "min_lat": min_lat,
+        "min_lon": min_lon,
+        "max_lat": max_lat,
+        "max_lon": max_lon,
+    }
 
 
 def delete_import(db: Database, username: str, *, activity_id: int) -> None:
     activity_id_int = int(activity_id)
-    strava_repo.delete_import(db, username, activity_id_int)
-    strava_repo.clear_activity_gpx(db, username, activity_id_int)
+    with db.transaction():
+        strava_repo.delete_import(db, username, activity_id_int)
+        strava_repo.clear_activity_gpx(db, username, activity_id_int)
+        track_service.delete_track_lods(db, username, -activity_id_int)
+        track_service.delete_track_stats(db, username, -activity_id_int)
+    track_service.invalidate_cached_track(username, -activity_id_int)
+    track_service.delete_strava_track_gpx_exports(username, activity_id_int)
 
 
 def _extract_start_latlon(activity: dict) -> tuple[float | None, float | None]:
@@ -380,71 +595,59 @@ def _parse_start_date(start_date: str | None) -> datetime | None:
         return None
 
 
-def _streams_to_gpx_bytes(*, activity_id: int, start_date: str | None, streams: Any) -> bytes:
-    latlng, time_s, altitude = _normalize_streams(streams)
+def _streams_to_track_arrays(*, activity_id: int, start_date: str | None, streams: Any) -> TrackArrays:
+    latlng, time_s, altitude, heartrate, cadence = _normalize_streams(streams)
 
     if not latlng:
         raise ValueError("Strava streams missing latlng data.")
 
+    n = len(latlng)
+    coords = np.asarray(latlng, dtype=float)
     start_dt = _parse_start_date(start_date)
 
-    gpx = ET.Element(
-        "gpx",
-        attrib={
-            "creator": "BergenOmap",
-            "version": "1.1",
-            "xmlns": "http://www.topografix.com/GPX/1/1",
-        },
-    )
+    time = None
+    if start_dt is not None and time_s:
+        start_ms = int(start_dt.timestamp() * 1000)
+        offsets = _stream_column(time_s, n)
+        valid = np.isfinite(offsets)
+        time = np.full(n, np.datetime64("NaT"), dtype="datetime64[ms]")
+        time[valid] = (start_ms + offsets[valid].astype(np.int64) * 1000).astype("datetime64[ms]")
 
-    metadata = ET.SubElement(gpx, "metadata")
+    metadata: Dict[str, Any] = {"creator": "BergenOmap"}
     if start_dt is not None:
-        ET.SubElement(metadata, "time").text = start_dt.isoformat().replace("+00:00", "Z")
-
-    trk = ET.SubElement(gpx, "trk")
-    ET.SubElement(trk, "name").text = f"Strava activity {activity_id}"
-    seg = ET.SubElement(trk, "trkseg")
-
-    for idx, pair in enumerate(latlng):
-        if not isinstance(pair, (list, tuple)) or len(pair) != 2:
-            continue
-        try:
-            lat = float(pair[0])
-            lon = float(pair[1])
-        except (TypeError, ValueError):
-            continue
-
-        trkpt = ET.SubElement(seg, "trkpt", attrib={"lat": str(lat), "lon": str(lon)})
-
-        if altitude and idx < len(altitude):
-            ele_val = altitude[idx]
-            if ele_val is not None:
-                ET.SubElement(trkpt, "ele").text = str(ele_val)
+        metadata["time"] = start_dt.isoformat().replace("+00:00", "Z")
+
+    return TrackArrays(
+        lat=coords[:, 0],
+        lon=coords[:, 1],
+        time=time,
+        elevation=_stream_column(altitude, n) if altitude else None,
+        heart_rate=_stream_column(heartrate, n) if heartrate else None,
+        cadence=_stream_column(cadence, n) if cadence else None,
+        tracks=[{"name": f"Strava activity {activity_id}", "type": None}],
+        metadata=metadata,
+    )
 
-        if start_dt is not None and time_s and idx < len(time_s):
-            offset = time_s[idx]
-            if offset is not None:
-                point_dt = start_dt + timedelta(seconds=int(offset))
-                ET.SubElement(trkpt, "time").text = point_dt.isoformat().replace("+00:00", "Z")
 
-    xml_bytes = ET.tostring(gpx, encoding="utf-8", xml_declaration=True)
-    return xml_bytes
+def _stream_column(values: list, n: int) -> np.ndarray:
+    """
+    Stream as a float array aligned with latlng; points past the end of the stream are NaN.
+    """
+    column = np.full(n, np.nan)
+    data = np.asarray(values[:n], dtype=float)
+    column[: len(data)] = data
+    return column
 
 
-def _normalize_streams(streams: Any) -> tuple[list[list[float]], list[int] | None, list[float] | None]:
+def _normalize_streams(
+    streams: Any,
+) -> tuple[list[list[float]], list[int] | None, list[float] | None, list[float] | None, list[float] | None]:
     """
     Supports both key_by_type=true (dict) and legacy list responses.
-    Returns: (latlng, time_seconds, altitude)
+    Returns: (latlng, time_seconds, altitude, heartrate, cadence)
     """
     if isinstance(streams, dict):
-        latlng = _extract_stream_data(streams, "latlng")
-        time_s = _extract_stream_data(streams, "time")
-        altitude = _extract_stream_data(streams, "altitude")
-        return (
-            _coerce_latlng(latlng),
-            _coerce_int_list(time_s),
-            _coerce_float_list(altitude),
-        )
+        return _coerce_streams(streams)
 
     if isinstance(streams, list):
         by_type: Dict[str, Any] = {}
@@ -454,16 +657,19 @@ def _normalize_streams(streams: Any) -> tuple[list[list[float]], list[int] | Non
             t = entry.get("type")
             if isinstance(t, str):
                 by_type[t] = entry
-        latlng = _extract_stream_data(by_type, "latlng")
-        time_s = _extract_stream_data(by_type, "time")
-        altitude = _extract_stream_data(by_type, "altitude")
-        return (
-            _coerce_latlng(latlng),
-            _coerce_int_list(time_s),
-            _coerce_float_list(altitude),
-        )
+        return _coerce_streams(by_type)
+
+    return ([], None, None, None, None)
 
-    return ([], None, None)
+
+def _coerce_streams(streams_by_type: dict) -> tuple:
+    return (
+        _coerce_latlng(_extract_stream_data(streams_by_type, "latlng")),
+        _coerce_int_list(_extract_stream_data(streams_by_type, "time")),
+        _coerce_float_list(_extract_stream_data(streams_by_type, "altitude")),
+        _coerce_float_list(_extract_stream_data(streams_by_type, "heartrate")),
+        _coerce_float_list(_extract_stream_data(streams_by_type, "cadence")),
+    )
 
 
 def _extract_stream_data(streams_by_type: dict, key: str) -> Any:
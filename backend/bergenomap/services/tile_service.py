@@ -0,0 +1,224 @@
+"""
+XYZ (slippy map) tiles for registered maps.
+
+The final map image is stored rotated and border-padded, and the frontend places it
+as a Leaflet image overlay stretched between `nw_coords` and `se_coords`. Leaflet
+projects those corners to Web Mercator and scales the image linearly between them,
+so a tile is cut by mapping its Mercator extent to the same linear pixel grid.
+Rotation is already baked into the stored image and is not applied again here.
+
+Tiles are rendered on first request and cached on disk as WebP:
+    <settings.tile_cache_dir>/<map_id>/<final_sha256>/<z>/<x>/<y>.webp
+Everything is keyed by the final image's digest, so a re-registered map gets new tiles in
+every web worker without any of them being told.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from PIL import Image
+
+from bergenomap.config import settings
+from bergenomap.repositories import blob_store
+
+
+# Decoded final images, keyed by blob digest. Decoding a 300 dpi map dominates tile cost,
+# so keep the last few around while a user pans over the same map.
+_source_cache: "OrderedDict[str, Image.Image]" = OrderedDict()
+_source_cache_lock = threading.Lock()
+
+MercatorBox = Tuple[float, float, float, float]
+
+
+def latlon_to_mercator(lat: float, lon: float) -> Tuple[float, float]:
+    """
+    Project lat/lon to normalized Web Mercator (x, y) in [0, 1], origin top-left.
+    """
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    x = (lon + 180.0) / 360.0
+    lat_rad = math.radians(lat)
+    y = (1.0 - math.log(math.tan(lat_rad) + 1.0 / math.cos(lat_rad)) / math.pi) / 2.0
+    return x, y
+
+
+def map_mercator_box(map_entry: Dict[str, Any]) -> MercatorBox:
+    nw_lat, nw_lon = map_entry["nw_coords"]
+    se_lat, se_lon = map_entry["se_coords"]
+    left, top = latlon_to_mercator(float(nw_lat), float(nw_lon))
+    right, bottom = latlon_to_mercator(float(se_lat), float(se_lon))
+    return left, top, right, bottom
+
+
+def tile_mercator_box(z: int, x: int, y: int) -> MercatorBox:
+    n = float(2 ** z)
+    return x / n, y / n, (x + 1) / n, (y + 1) / n
+
+
+def tile_intersects_map(map_entry: Dict[str, Any], z: int, x: int, y: int) -> bool:
+    m_left, m_top, m_right, m_bottom = map_mercator_box(map_entry)
+    t_left, t_top, t_right, t_bottom = tile_mercator_box(z, x, y)
+    return t_left < m_right and t_right > m_left and t_top < m_bottom and t_bottom > m_top
+
+
+def max_native_zoom(map_entry: Dict[str, Any], *, tile_size: int | None = None) -> int:
+    """
+    Smallest zoom level at which one tile pixel is no larger than one map pixel.
+    Leaflet can over-scale beyond this via `maxNativeZoom`.
+    """
+    tile_size = tile_size or settings.tile_size
+    left, _top, right, _bottom = map_mercator_box(map_entry)
+    width_px = map_entry.get("overlay_width") or 0
+    span = right - left
+    if width_px <= 0 or span <= 0:
+        return settings.tile_max_zoom
+    zoom = math.ceil(math.log2(width_px / (span * tile_size)))
+    return max(settings.tile_min_zoom, min(settings.tile_max_zoom, zoom))
+
+
+def tile_metadata(map_entry: Dict[str, Any], digest: str) -> dict:
+    """
+    `digest` is the final image's; it versions the tile URLs, which are cacheable for good.
+    """
+    map_id = int(map_entry["map_id"])
+    return {
+        "map_id": map_id,
+        "map_name": map_entry["map_name"],
+        "nw_coords": map_entry["nw_coords"],
+        "se_coords": map_entry["se_coords"],
+        "tile_size": settings.tile_size,
+        "min_zoom": settings.tile_min_zoom,
+        "max_zoom": settings.tile_max_zoom,
+        "max_native_zoom": max_native_zoom(map_entry),
+        "url_template": f"/api/tiles/{map_id}/{{z}}/{{x}}/{{y}}.webp?v={digest}",
+    }
+
+
+def render_tile(
+    image: Image.Image,
+    map_entry: Dict[str, Any],
+    z: int,
+    x: int,
+    y: int,
+    *,
+    tile_size: int | None = None,
+) -> Optional[Image.Image]:
+    """
+    Cut one tile out of the (already rotated and padded) final map image.
+    Returns None when the tile does not overlap the map.
+    """
+    tile_size = tile_size or settings.tile_size
+    m_left, m_top, m_right, m_bottom = map_mercator_box(map_entry)
+    t_left, t_top, t_right, t_bottom = tile_mercator_box(z, x, y)
+
+    # Tile extent in source pixels (may extend past the image edges).
+    px_per_x = image.width / (m_right - m_left)
+    px_per_y = image.height / (m_bottom - m_top)
+    left = (t_left - m_left) * px_per_x
+    top = (t_top - m_top) * px_per_y
+    right = (t_right - m_left) * px_per_x
+    bottom = (t_bottom - m_top) * px_per_y
+
+    src_left = max(left, 0.0)
+    src_top = max(top, 0.0)
+    src_right = min(right, float(image.width))
+    src_bottom = min(bottom, float(image.height))
+    if src_left >= src_right or src_top >= src_bottom:
+        return None
+
+    # Where the clamped source region lands inside the tile.
+    scale_x = tile_size / (right - left)
+    scale_y = tile_size / (bottom - top)
+    dst_left = int(round((src_left - left) * scale_x))
+    dst_top = int(round((src_top - top) * scale_y))
+    dst_right = int(round((src_right - left) * scale_x))
+    dst_bottom = int(round((src_bottom - top) * scale_y))
+    if dst_right <= dst_left or dst_bottom <= dst_top:
+        return None
+
+    part = image.resize(
+        (dst_right - dst_left, dst_bottom - dst_top),
+        resample=Image.Resampling.BILINEAR,
+        box=(src_left, src_top, src_right, src_bottom),
+        reducing_gap=2.0,
+    )
+
+    if part.size == (tile_size, tile_size):
+        return part
+
+    tile = Image.new("RGBA", (tile_size, tile_size), (0, 0, 0, 0))
+    tile.paste(part, (dst_left, dst_top))
+    return tile
+
+
+def tile_path(map_id: int, digest: str, z: int, x: int, y: int) -> str:
+    # Absolute, since Flask's send_file resolves relative paths against the app root, not the CWD.
+    return os.path.abspath(
+        os.path.join(settings.tile_cache_dir, str(int(map_id)), digest, str(z), str(x), f"{y}.webp")
+    )
+
+
+def get_or_create_tile(map_entry: Dict[str, Any], digest: str, z: int, x: int, y: int) -> Optional[str]:
+    """
+    Return the path of the cached tile of the final image with blob digest `digest`,
+    rendering it first if needed.
+    Returns None for tiles outside the map or out of the configured zoom range.
+    """
+    if z < settings.tile_min_zoom or z > settings.tile_max_zoom:
+        return None
+    if x < 0 or y < 0 or x >= 2 ** z or y >= 2 ** z:
+        return None
+
+    map_id = int(map_entry["map_id"])
+    path = tile_path(map_id, digest, z, x, y)
+    if os.path.exists(path):
+        return path
+
+    # Cheap rejection before touching the image blob.
+    if not tile_intersects_map(map_entry, z, x, y):
+        return None
+
+    image = _get_source_image(digest)
+
+    tile = render_tile(image, map_entry, z, x, y)
+    if tile is None:
+        return None
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write to a temp file and rename, so concurrent requests never see a half-written tile.
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    tile.save(tmp_path, "WEBP", quality=settings.tile_webp_quality)
+    os.replace(tmp_path, path)
+    return path
+
+
+def invalidate_map_tiles(map_id: int) -> None:
+    """
+    Delete a map's cached tiles, of every version. Tiles are keyed by the final image's digest,
+    so this only frees disk space after the image changes.
+    """
+    shutil.rmtree(os.path.join(settings.tile_cache_dir, str(int(map_id))), ignore_errors=True)
+
+
+def _get_source_image(digest: str) -> Image.Image:
+    with _source_cache_lock:
+        image = _source_cache.get(digest)
+        if image is not None:
+            _source_cache.move_to_end(digest)
+            return image
+
+    # Decode straight from the mapped file instead of a copy of it in Python memory.
+    with blob_store.open_blob_mmap(digest) as mapped, Image.open(mapped) as img:
+        image = img.convert("RGBA")
+
+    with _source_cache_lock:
+        _source_cache[digest] = image
+        _source_cache.move_to_end(digest)
+        while len(_source_cache) > max(settings.tile_source_cache_size, 1):
+            _source_cache.popitem(last=False)
+    return image
@@ -0,0 +1,262 @@
+"""
+Bulk upload of GPX files from a zip or tar archive (/api/gps-tracks/archive and
+scripts/import_gpx_archive.py).
+
+Archive members are parsed in a process pool; bounds, binary track data, levels of detail and
+statistics are all computed there, so the calling process only writes rows. Tracks are inserted
+through tracks_repo in one transaction per settings.track_ingest_batch_size files. Files whose
+track data is already stored for the user (same track_hash), or that repeat an earlier file of
+the same archive, are skipped, so an interrupted upload can simply be repeated.
+
+Runs in a job worker process (see job_service) or from the CLI, so it must stay independent of
+Flask request globals.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import posixpath
+import tarfile
+import traceback
+import xml.etree.ElementTree as ET
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+from Database import Database
+from bergenomap.config import settings
+from bergenomap.repositories import tracks_repo, users_repo
+from bergenomap.services import track_service
+from bergenomap.services.map_ingest_service import ProgressCallback
+from bergenomap.utils.track_codec import encode_track, track_data_hash
+from gpx_parser import parse_gpx_stream
+
+FILE_STORED = "stored"
+FILE_DUPLICATE = "duplicate"
+FILE_FAILED = "failed"
+
+
+@dataclass(frozen=True)
+class _ArchiveMember:
+    name: str
+    size: int
+    read: Callable[[], bytes]
+
+
+def ingest_gpx_archive(
+    db: Database,
+    username: str,
+    archive: BinaryIO,
+    *,
+    workers: Optional[int] = None,
+    progress: Optional[ProgressCallback] = None,
+) -> Dict[str, Any]:
+    """
+    Store every .gpx file of the archive as a track of the user.
+
+    Returns {"stored", "duplicates", "failed": counts, "files": [...]} with one entry per GPX
+    file in archive order: {"name", "status": "stored" | "duplicate" | "failed"} plus
+    "track_id" (stored, or the existing track for duplicates) or "error" (failed).
+    Raises ValueError if the user does not exist or the archive cannot be read.
+    """
+    report = progress or (lambda fraction, message: None)
+    if not users_repo.get_user_by_username(db, username):
+        raise ValueError(f"User '{username}' does not exist. Create the user before inserting tracks.")
+    if workers is None:
+        workers = settings.track_ingest_workers
+
+    tracks_repo.backfill_track_hashes(db, username)
+    known_hashes = tracks_repo.list_track_hashes(db, username)
+
+    files: List[Dict[str, Any]] = []
+    # Files to insert with their parse result, keyed by track hash, and repeats of them.
+    batch: Dict[str, Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+    batch_duplicates: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+
+    def flush() -> None:
+        if batch:
+            with db.transaction():
+                rows = [parsed["row"] for _, parsed in batch.values()]
+                track_ids = tracks_repo.insert_gps_tracks_bulk(db, username, rows)
+                for (track_hash, (entry, parsed)), track_id in zip(batch.items(), track_ids):
+                    track_service.store_track_lods(db, username, track_id, parsed["lods"])
+                    track_service.store_track_stats(db, username, track_id, parsed["stats"])
+                    entry["track_id"] = track_id
+                    known_hashes[track_hash] = track_id
+        for entry, original in batch_duplicates:
+            entry["track_id"] = original["track_id"]
+        batch.clear()
+        batch_duplicates.clear()
+
+    with _open_archive(archive) as members:
+        report(0.0, f"Parsing {len(members)} GPX files")
+        for index, (member, gpx_bytes, parsed) in enumerate(_parse_members(members, workers)):
+            entry: Dict[str, Any] = {"name": member.name, "status": parsed["status"]}
+            files.append(entry)
+            if parsed["status"] == FILE_FAILED:
+                entry["error"] = parsed["error"]
+            elif parsed["track_hash"] in known_hashes:
+                entry["status"] = FILE_DUPLICATE
+                entry["track_id"] = known_hashes[parsed["track_hash"]]
+            elif parsed["track_hash"] in batch:
+                entry["status"] = FILE_DUPLICATE
+                batch_duplicates.append((entry, batch[parsed["track_hash"]][0]))
+            else:
+                parsed["row"]["gpx_data"] = gpx_bytes
+                batch[parsed["track_hash"]] = (entry, parsed)
+
+            if len(batch) >= settings.track_ingest_batch_size:
+                flush()
+                report((index + 1) / len(members), f"Processed {index + 1} of {len(members)} GPX files")
+        flush()
+
+    counts = {
+        status: sum(1 for entry in files if entry["status"] == status)
+        for status in (FILE_STORED, FILE_DUPLICATE, FILE_FAILED)
+    }
+    return {
+        "stored": counts[FILE_STORED],
+        "duplicates": counts[FILE_DUPLICATE],
+        "failed": counts[FILE_FAILED],
+        "files": files,
+    }
+
+
+@contextmanager
+def _open_archive(archive: BinaryIO) -> Iterator[List[_ArchiveMember]]:
+    """
+    The GPX members of a zip or tar (optionally compressed) archive, in archive order.
+    """
+    if zipfile.is_zipfile(archive):
+        archive.seek(0)
+        with zipfile.ZipFile(archive) as zf:
+            yield _select_members(
+                [
+                    _ArchiveMember(info.filename, info.file_size, lambda info=info: zf.read(info))
+                    for info in zf.infolist()
+                    if not info.is_dir()
+                ]
+            )
+        return
+
+    archive.seek(0)
+    try:
+        tf = tarfile.open(fileobj=archive, mode="r:*")
+    except tarfile.TarError:
+        raise ValueError("Archive must be a zip or tar file")
+    with tf:
+        yield _select_members(
+            [
+                _ArchiveMember(info.name, info.size, lambda info=info: tf.extractfile(info).read())
+                for info in tf.getmembers()
+                if info.isfile()
+            ]
+        )
+
+
+def _select_members(members: List[_ArchiveMember]) -> List[_ArchiveMember]:
+    selected = [
+        member
+        for member in members
+        if member.name.lower().endswith(".gpx")
+        # macOS archive metadata (__MACOSX/._name.gpx) is not GPX.
+        and not posixpath.basename(member.name).startswith(".")
+        and "__MACOSX/" not in member.name
+    ]
+    if len(selected) > settings.track_ingest_max_files:
+        raise ValueError(f"Archive has {len(selected)} GPX files; at most {settings.track_ingest_max_files} are allowed")
+    return selected
+
+
+def _parse_members(
+    members: List[_ArchiveMember], workers: int
+) -> Iterator[Tuple[_ArchiveMember, Optional[bytes], Dict[str, Any]]]:
+    """
+    (member, its bytes, parse_gpx_member result) in archive order. Only a few files per worker
+    are read ahead of the consumer, which bounds memory for large archives.
+    """
+    if workers <= 0:
+        for member in members:
+            gpx_bytes = _read_member(member)
+            yield member, gpx_bytes, _parse_member(member.name, gpx_bytes)
+        return
+
+    # Spawn rather than fork, like job_service: the calling process may run threads.
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context(settings.job_start_method),
+    ) as executor:
+        pending = deque()
+        for member in members:
+            gpx_bytes = _read_member(member)
+            future = None if gpx_bytes is None else executor.submit(parse_gpx_member, member.name, gpx_bytes)
+            pending.append((member, gpx_bytes, future))
+            if len(pending) >= workers * 4:
+                yield _completed(*pending.popleft())
+        while pending:
+            yield _completed(*pending.popleft())
+
+
+def _read_member(member: _ArchiveMember) -> Optional[bytes]:
+    """
+    The member's bytes, or None if it is larger than settings.track_ingest_max_file_bytes.
+    """
+    if member.size > settings.track_ingest_max_file_bytes:
+        return None
+    return member.read()
+
+
+def _parse_member(name: str, gpx_bytes: Optional[bytes]) -> Dict[str, Any]:
+    if gpx_bytes is None:
+        return _too_large()
+    return parse_gpx_member(name, gpx_bytes)
+
+
+def _completed(
+    member: _ArchiveMember, gpx_bytes: Optional[bytes], future: Optional[Future]
+) -> Tuple[_ArchiveMember, Optional[bytes], Dict[str, Any]]:
+    return member, gpx_bytes, (_too_large() if future is None else future.result())
+
+
+def _too_large() -> Dict[str, Any]:
+    return {"status": FILE_FAILED, "error": f"File is larger than {settings.track_ingest_max_file_bytes} bytes"}
+
+
+def parse_gpx_member(name: str, gpx_bytes: bytes) -> Dict[str, Any]:
+    """
+    Parse one GPX file into everything needed to store it (runs in a pool worker process).
+    Returns {"status": "stored", "track_hash", "row": insert_gps_tracks_bulk row without
+    gpx_data, "lods", "stats"} or {"status": "failed", "error"}.
+    """
+    try:
+        parsed = parse_gpx_stream(gpx_bytes, columnar=True)
+    except ET.ParseError as exc:
+        return {"status": FILE_FAILED, "error": f"Invalid GPX file: {exc}"}
+    except Exception as exc:
+        traceback.print_exc()
+        return {"status": FILE_FAILED, "error": str(exc) or type(exc).__name__}
+
+    bounds = parsed["summary"]["bounds"]
+    if bounds is None:
+        return {"status": FILE_FAILED, "error": "No valid coordinates found in GPX file"}
+
+    track = parsed["track"]
+    track_data = encode_track(track)
+    description = posixpath.splitext(posixpath.basename(name))[0]
+    return {
+        "status": FILE_STORED,
+        "track_hash": track_data_hash(track_data),
+        "row": {
+            "description": description,
+            "min_lat": bounds["min_lat"],
+            "min_lon": bounds["min_lon"],
+            "max_lat": bounds["max_lat"],
+            "max_lon": bounds["max_lon"],
+            "track_data": track_data,
+        },
+        "lods": track_service.build_track_lods(track),
+        "stats": track_service.build_track_stats(track),
+    }
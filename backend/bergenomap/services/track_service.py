@@ -1,42 +1,469 @@
 from __future__ import annotations
 
-from typing import Any, Dict, Optional, Tuple
-
-
-def compute_gpx_bounds(parsed_gpx: Dict[str, Any]) -> Optional[Tuple[float, float, float, float]]:
-    """
-    Computes min/max lat/lon by iterating all points in the parsed GPX structure.
-    Returns (min_lat, min_lon, max_lat, max_lon) or None if no valid points.
-    """
-    min_lat = None
-    min_lon = None
-    max_lat = None
-    max_lon = None
-
-    tracks = parsed_gpx.get("tracks", []) if isinstance(parsed_gpx, dict) else []
-    for track in tracks:
-        points = track.get("points", []) if isinstance(track, dict) else []
-        for point in points:
-            if not isinstance(point, dict):
-                continue
-            lat = point.get("lat")
-            lon = point.get("lon")
-            if lat is None or lon is None:
-                continue
-            try:
-                lat = float(lat)
-                lon = float(lon)
-            except (TypeError, ValueError):
-                continue
-
-            min_lat = lat if min_lat is None else min(min_lat, lat)
-            max_lat = lat if max_lat is None else max(max_lat, lat)
-            min_lon = lon if min_lon is None else min(min_lon, lon)
-            max_lon = lon if max_lon is None else max(max_lon, lon)
-
-    if min_lat is None:
+import glob
+import hashlib
+import json
+import math
+import os
+import threading
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from Database import Database
+from bergenomap.config import settings
+from bergenomap.repositories import strava_repo, track_lods_repo, track_stats_repo, tracks_repo
+from bergenomap.utils.simplify import douglas_peucker_importance, simplify_track
+from bergenomap.utils.track_stats import compute_track_stats
+from bergenomap.utils.track_codec import (
+    POLYLINE_PRECISION,
+    WIRE_FORMAT_POINTS,
+    TrackArrays,
+    decode_track,
+    encode_polyline,
+    encode_track,
+    track_arrays_to_compact_json,
+    track_arrays_to_gpx_bytes,
+    track_arrays_to_parsed_gpx,
+    track_bounds,
+)
+from gpx_parser import parse_gpx_stream
+
+SOURCE_LOCAL = "local"
+SOURCE_STRAVA = "strava"
+
+# Meters per pixel at zoom 0 on the equator for 256 px Web Mercator tiles.
+WEB_MERCATOR_EQUATOR_M_PER_PX = 156543.03392
+
+TrackKey = Tuple[str, str, int]  # (source, username, local track id or Strava activity id)
+
+
+@dataclass(frozen=True)
+class TrackPayload:
+    """
+    The expensive part of a track response: bounds of the points and the track in one of
+    the wire formats (track_arrays_to_parsed_gpx / track_arrays_to_compact_json), already
+    serialized to JSON.
+    """
+
+    bounds: Optional[Tuple[float, float, float, float]]
+    gpx_json: bytes
+
+
+class TrackPayloadCache:
+    """
+    LRU of TrackPayload per track and variant (wire format and level of detail), bounded by
+    the total size of the serialized JSON.
+    An entry is only served for the content hash it was built from, so track data rewritten
+    by another worker process is never served stale. Thread-safe.
+    """
+
+    def __init__(self, *, max_bytes: int) -> None:
+        self._max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[TrackKey, str], Tuple[str, TrackPayload]]" = OrderedDict()  # (key, variant)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: TrackKey, variant: str, content_hash: str) -> Optional[TrackPayload]:
+        with self._lock:
+            entry = self._entries.get((key, variant))
+            if entry is None or entry[0] != content_hash:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((key, variant))
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: TrackKey, variant: str, content_hash: str, payload: TrackPayload) -> None:
+        size = len(payload.gpx_json)
+        if size > self._max_bytes:
+            return
+        with self._lock:
+            self._remove((key, variant))
+            self._entries[(key, variant)] = (content_hash, payload)
+            self._bytes += size
+            while self._bytes > self._max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.gpx_json)
+                self.evictions += 1
+
+    def invalidate(self, key: TrackKey) -> None:
+        with self._lock:
+            for entry_key in [entry_key for entry_key in self._entries if entry_key[0] == key]:
+                self._remove(entry_key)
+
+    def _remove(self, entry_key: Tuple[TrackKey, str]) -> None:
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1].gpx_json)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self._max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": (self.hits / lookups) if lookups else None,
+            }
+
+
+track_payload_cache = TrackPayloadCache(max_bytes=settings.track_cache_max_bytes)
+
+
+def track_cache_key(username: str, track_id: int) -> TrackKey:
+    """
+    Cache key for a track id as used by the API: negative ids are Strava activities.
+    """
+    if track_id < 0:
+        return (SOURCE_STRAVA, username, -track_id)
+    return (SOURCE_LOCAL, username, track_id)
+
+
+def invalidate_cached_track(username: str, track_id: int) -> None:
+    track_payload_cache.invalidate(track_cache_key(username, track_id))
+
+
+def load_track_payload(
+    db: Database,
+    username: str,
+    track_id: int,
+    content_hash: Optional[str],
+    *,
+    wire_format: str = WIRE_FORMAT_POINTS,
+    lod_level: Optional[int] = None,
+) -> Optional[TrackPayload]:
+    """
+    TrackPayload for a track id as used by the API, from the cache when `content_hash`
+    (from tracks_repo.get_gps_track_meta / strava_repo.get_activity) matches.
+    `lod_level` selects a stored level of detail instead of the full track.
+    None if the track has no track data. Raises ET.ParseError for unparsable legacy GPX.
+    """
+    key = track_cache_key(username, track_id)
+    variant = wire_format if lod_level is None else f"{wire_format}@{lod_level}"
+    if content_hash is not None:
+        cached = track_payload_cache.get(key, variant, content_hash)
+        if cached is not None:
+            return cached
+
+    if lod_level is None:
+        arrays = load_track_arrays(db, username, track_id)
+    else:
+        arrays = load_track_lod(db, username, track_id, lod_level)
+    if arrays is None:
+        return None
+    if wire_format == WIRE_FORMAT_POINTS:
+        gpx = track_arrays_to_parsed_gpx(arrays)
+    else:
+        gpx = track_arrays_to_compact_json(arrays, wire_format)
+    payload = TrackPayload(
+        bounds=track_bounds(arrays),
+        gpx_json=json.dumps(gpx, separators=(",", ":")).encode("utf-8"),
+    )
+    # Legacy rows get their hash when load_track_arrays backfills them; cached from the next view.
+    if content_hash is not None:
+        track_payload_cache.put(key, variant, content_hash, payload)
+    return payload
+
+
+def build_track_lods(track: TrackArrays) -> List[Dict[str, Any]]:
+    """
+    The track simplified at each of settings.track_lod_tolerances_m, as rows for
+    track_lods_repo.replace_track_lods. CPU only; safe to call off the request thread.
+    """
+    tolerances = settings.track_lod_tolerances_m
+    importance = douglas_peucker_importance(
+        track.lat, track.lon, track.segment_starts, min_tolerance_m=min(tolerances)
+    )
+    lods = []
+    for level, tolerance_m in enumerate(tolerances):
+        simplified = simplify_track(track, importance, tolerance_m)
+        lods.append(
+            {
+                "level": level,
+                "tolerance_m": tolerance_m,
+                "point_count": simplified.point_count,
+                "track_data": encode_track(simplified),
+            }
+        )
+    return lods
+
+
+def store_track_lods(db: Database, username: str, track_id: int, lods: List[Dict[str, Any]]) -> None:
+    source, _, source_id = track_cache_key(username, track_id)
+    track_lods_repo.replace_track_lods(db, username, source, source_id, lods)
+
+
+def delete_track_lods(db: Database, username: str, track_id: int) -> None:
+    source, _, source_id = track_cache_key(username, track_id)
+    track_lods_repo.delete_track_lods(db, username, source, source_id)
+
+
+def build_track_stats(track: TrackArrays) -> Dict[str, Any]:
+    """
+    Summary statistics (TrackStats.to_dict()) for track_stats_repo. CPU only.
+    """
+    return compute_track_stats(track).to_dict()
+
+
+def store_track_stats(db: Database, username: str, track_id: int, stats: Dict[str, Any]) -> None:
+    source, _, source_id = track_cache_key(username, track_id)
+    track_stats_repo.upsert_track_stats(db, username, source, source_id, stats)
+
+
+def delete_track_stats(db: Database, username: str, track_id: int) -> None:
+    source, _, source_id = track_cache_key(username, track_id)
+    track_stats_repo.delete_track_stats(db, username, source, source_id)
+
+
+def list_track_stats(db: Database, username: str, track_ids: List[int]) -> List[Optional[Dict[str, Any]]]:
+    """
+    Stored statistics per track id as used by the API (None if the track has no data, or
+    was stored before statistics existed and backfill_track_stats has not run yet).
+    """
+    stored = track_stats_repo.list_track_stats(db, username)
+    result: List[Optional[Dict[str, Any]]] = []
+    for track_id in track_ids:
+        source, _, source_id = track_cache_key(username, track_id)
+        stats = stored.get((source, source_id))
+        result.append(stats if stats is not None and stats["point_count"] else None)
+    return result
+
+
+def backfill_track_stats(db: Database) -> int:
+    """
+    Compute and store the statistics of every track stored before they existed
+    (scripts/backfill_track_data.py), each in its own short write. Tracks without usable data
+    are marked so they are not parsed again. Returns the number of tracks looked at.
+    """
+    missing = track_stats_repo.list_tracks_without_stats(
+        db, local_source=SOURCE_LOCAL, strava_source=SOURCE_STRAVA
+    )
+    for username, source, source_id in missing:
+        _backfill_track_stats(db, username, source_id if source == SOURCE_LOCAL else -source_id)
+    return len(missing)
+
+
+def _backfill_track_stats(db: Database, username: str, track_id: int) -> Optional[Dict[str, Any]]:
+    try:
+        arrays = load_track_arrays(db, username, track_id)
+    except ET.ParseError:
+        arrays = None
+    source, _, source_id = track_cache_key(username, track_id)
+    if arrays is None or len(arrays.lat) == 0:
+        track_stats_repo.mark_track_stats_missing(db, username, source, source_id)
+        return None
+    stats = build_track_stats(arrays)
+    track_stats_repo.upsert_track_stats(db, username, source, source_id, stats)
+    return stats
+
+
+def load_track_lod(db: Database, username: str, track_id: int, level: int) -> Optional[TrackArrays]:
+    """
+    One level of detail of a track id as used by the API.
+    Levels of tracks stored before they existed are built from the full track and stored.
+    """
+    source, _, source_id = track_cache_key(username, track_id)
+    blob = track_lods_repo.get_track_lod_data(db, username, source, source_id, level)
+    if blob is None:
+        arrays = load_track_arrays(db, username, track_id)
+        if arrays is None:
+            return None
+        lods = build_track_lods(arrays)
+        store_track_lods(db, username, track_id, lods)
+        if level >= len(lods):
+            return arrays
+        blob = lods[level]["track_data"]
+    return decode_track(blob)
+
+
+def lod_level_for_tolerance(tolerance_m: float) -> Optional[int]:
+    """
+    The coarsest level whose tolerance does not exceed tolerance_m; None when even the
+    finest level is too coarse (serve the full track).
+    """
+    level = None
+    for index, level_tolerance_m in enumerate(settings.track_lod_tolerances_m):
+        if level_tolerance_m <= tolerance_m:
+            level = index
+    return level
+
+
+def lod_level_for_zoom(zoom: float, lat: Optional[float]) -> Optional[int]:
+    """
+    Level for a Web Mercator zoom level: a tolerance of settings.track_lod_pixel_tolerance
+    pixels at latitude `lat`. Without a latitude the equator's scale is used, which may pick
+    one level coarser than needed at high latitudes.
+    """
+    cos_lat = math.cos(math.radians(lat)) if lat is not None else 1.0
+    meters_per_pixel = WEB_MERCATOR_EQUATOR_M_PER_PX * cos_lat / (2.0 ** zoom)
+    return lod_level_for_tolerance(meters_per_pixel * settings.track_lod_pixel_tolerance)
+
+
+def lod_level_for_args(lod_args: Dict[str, float], lat: Optional[float]) -> Optional[int]:
+    """
+    Level for the parsed ?zoom= / ?tolerance_m= arguments (api.common.parse_lod_args).
+    """
+    if "zoom" in lod_args:
+        return lod_level_for_zoom(lod_args["zoom"], lat)
+    return lod_level_for_tolerance(lod_args["tolerance_m"])
+
+
+def lod_overviews(
+    db: Database, username: str, track_ids: List[int], levels: List[Optional[int]]
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    lod_overview for each track id at the matching level (None for no overview), reading
+    the stored levels with one query per distinct level. Tracks stored before levels existed
+    have none until backfill_track_lods has run.
+    """
+    rows_by_level: Dict[int, Dict[Tuple[str, int], dict]] = {}
+    overviews: List[Optional[Dict[str, Any]]] = []
+    for track_id, level in zip(track_ids, levels):
+        if level is None:
+            overviews.append(None)
+            continue
+        if level not in rows_by_level:
+            rows_by_level[level] = track_lods_repo.list_track_lods_at_level(db, username, level)
+        source, _, source_id = track_cache_key(username, track_id)
+        row = rows_by_level[level].get((source, source_id))
+        if row is None:
+            overviews.append(None)
+            continue
+        overviews.append(lod_overview(decode_track(row["track_data"]), level=level, tolerance_m=row["tolerance_m"]))
+    return overviews
+
+
+def backfill_track_lods(db: Database) -> int:
+    """
+    Build and store the levels of every track stored before they existed
+    (scripts/backfill_track_data.py), each in its own short write. Returns the number of
+    tracks looked at.
+    """
+    missing = track_lods_repo.list_tracks_without_lods(db, local_source=SOURCE_LOCAL, strava_source=SOURCE_STRAVA)
+    for username, source, source_id in missing:
+        track_id = source_id if source == SOURCE_LOCAL else -source_id
+        try:
+            arrays = load_track_arrays(db, username, track_id)
+        except ET.ParseError:
+            continue
+        if arrays is not None and arrays.point_count:
+            store_track_lods(db, username, track_id, build_track_lods(arrays))
+    return len(missing)
+
+
+def lod_overview(track: TrackArrays, *, level: int, tolerance_m: float) -> Dict[str, Any]:
+    """
+    Geometry-only summary of a simplified track for list responses: one Google encoded
+    polyline per segment.
+    """
+    bounds = track.segment_starts.tolist() + [track.point_count]
+    return {
+        "level": level,
+        "tolerance_m": tolerance_m,
+        "point_count": track.point_count,
+        "polyline_precision": POLYLINE_PRECISION,
+        "polylines": [
+            encode_polyline(track.lat[start:end], track.lon[start:end])
+            for start, end in zip(bounds[:-1], bounds[1:])
+        ],
+    }
+
+
+def load_local_track(db: Database, username: str, track_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Uploaded track with "track" set to its TrackArrays.
+    Rows stored before binary track data existed are converted from their GPX and backfilled.
+    Raises ET.ParseError if such a legacy GPX cannot be parsed.
+    """
+    track = tracks_repo.get_gps_track_by_id(db, username, track_id)
+    if not track:
+        return None
+    if track["track"] is None:
+        gpx_bytes = tracks_repo.get_gps_track_gpx(db, username, track_id)
+        arrays = parse_gpx_stream(gpx_bytes, columnar=True)["track"]
+        tracks_repo.set_gps_track_data(db, username, track_id, encode_track(arrays))
+        track["track"] = arrays
+    return track
+
+
+def load_strava_track(db: Database, username: str, activity_id: int) -> Optional[TrackArrays]:
+    """
+    TrackArrays for an imported Strava activity, or None if it has not been imported.
+    Activities imported as GPX before binary track data existed are converted and backfilled.
+    """
+    arrays = strava_repo.get_activity_track(db, username, activity_id)
+    if arrays is not None:
+        return arrays
+
+    gpx_bytes = strava_repo.get_activity_gpx(db, username, activity_id)
+    if not gpx_bytes:
         return None
+    arrays = parse_gpx_stream(gpx_bytes, columnar=True)["track"]
+    # Read path: only add track_data; the original GPX stays downloadable.
+    strava_repo.backfill_activity_track(db, username, activity_id, encode_track(arrays))
+    return arrays
 
-    return (min_lat, min_lon, max_lat, max_lon)
 
+def export_strava_track_gpx_file(db: Database, username: str, activity_id: int) -> Optional[str]:
+    """
+    Path of the activity's track exported as GPX, or None if it has no track data. For
+    activities without a stored GPX file; a stored one is the better download.
+
+    Exports are cached on disk, one file per activity and version of its track data, so a
+    track is exported once and downloads are served from a file (known length, Range requests).
+    Exports of earlier versions are removed when a new one is written.
+    """
+    activity = strava_repo.get_activity(db, username, activity_id)
+    if activity is None or activity["content_hash"] is None:
+        return None
+    version = activity["content_hash"].replace(":", "-")
+    path = os.path.join(_strava_gpx_export_dir(username), f"{int(activity_id)}.{version}.gpx")
+    if os.path.exists(path):
+        return path
+    arrays = load_strava_track(db, username, activity_id)
+    if arrays is None:
+        return None
+    delete_strava_track_gpx_exports(username, activity_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(track_arrays_to_gpx_bytes(arrays))
+    os.replace(tmp_path, path)
+    return path
+
+
+def delete_strava_track_gpx_exports(username: str, activity_id: int) -> None:
+    """
+    Remove every cached GPX export of an activity.
+    """
+    pattern = os.path.join(_strava_gpx_export_dir(username), f"{int(activity_id)}.*.gpx")
+    for path in glob.glob(pattern):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _strava_gpx_export_dir(username: str) -> str:
+    # Absolute, since Flask's send_file resolves relative paths against the app root, not the CWD.
+    # Usernames are hashed to keep them out of file names.
+    user_key = hashlib.sha256(username.encode("utf-8")).hexdigest()[:16]
+    return os.path.abspath(os.path.join(settings.gpx_export_cache_dir, user_key))
 
+
+def load_track_arrays(db: Database, username: str, track_id: int) -> Optional[TrackArrays]:
+    """
+    TrackArrays for a track id as used by the API: negative ids are Strava activities.
+    """
+    if track_id < 0:
+        return load_strava_track(db, username, -track_id)
+    track = load_local_track(db, username, track_id)
+    return track["track"] if track else None
@@ -3,20 +3,57 @@ from __future__ import annotations
 import math
 from typing import Iterable, Sequence, Tuple
 
+import numpy as np
+from numpy.typing import ArrayLike
+
+from bergenomap.utils.projection import EARTH_RADIUS_M
+
 
 LatLon = Tuple[float, float]
 Pixel = Tuple[float, float]
 
 
+# The *_array functions broadcast over NumPy inputs (scalars, arrays or any mix of them, with
+# NumPy's broadcasting rules). The scalar functions are thin wrappers kept for existing callers.
+
+
+def haversine_array(lat1: ArrayLike, lon1: ArrayLike, lat2: ArrayLike, lon2: ArrayLike) -> np.ndarray:
+    """
+    Haversine distance in meters between (lat1, lon1) and (lat2, lon2), elementwise.
+    """
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    dphi = np.radians(np.subtract(lat2, lat1))
+    dlambda = np.radians(np.subtract(lon2, lon1))
+
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    # Rounding can push a a hair above 1 for antipodal points.
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_steps(lat: ArrayLike, lon: ArrayLike) -> np.ndarray:
+    """
+    Distances in meters between consecutive points of a polyline (length n - 1).
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    return haversine_array(lat[:-1], lon[:-1], lat[1:], lon[1:])
+
+
 """Haversine distance in meters"""
 def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    R = 6371000
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
+    return float(haversine_array(lat1, lon1, lat2, lon2))
+
 
-    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
-    return 2 * R * math.asin(math.sqrt(a))
+def latlon_to_local_xy_array(
+    lat: ArrayLike, lon: ArrayLike, lat0: float, lon0: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Convert lat/lon arrays to local tangent-plane x/y meters around the origin lat0/lon0.
+    """
+    x = EARTH_RADIUS_M * np.radians(np.subtract(lon, lon0)) * math.cos(math.radians(lat0))
+    y = EARTH_RADIUS_M * np.radians(np.subtract(lat, lat0))
+    return x, y
 
 
 def latlon_to_local_xy(lat: float, lon: float, lat0: float, lon0: float) -> Tuple[float, float]:
@@ -24,46 +61,34 @@ def latlon_to_local_xy(lat: float, lon: float, lat0: float, lon0: float) -> Tupl
     Convert lat/lon to local tangent-plane x/y meters.
     lat0/lon0 is the reference origin.
     """
-    R = 6371000
-    dlat = math.radians(lat - lat0)
-    dlon = math.radians(lon - lon0)
-    x = R * dlon * math.cos(math.radians(lat0))
-    y = R * dlat
-    return x, y
+    x, y = latlon_to_local_xy_array(lat, lon, lat0, lon0)
+    return float(x), float(y)
 
 
 """Helper function to estimate the number of meters per pixel from a list of pixel coordinates and
 their associated latitudes and longitudes."""
 def meters_per_pixel_xy(pixel_pts: Sequence[Pixel], geo_pts: Sequence[LatLon]) -> Tuple[float, float]:
-    # Use the first real-world point as local origin
-    lat0, lon0 = geo_pts[0]
-
-    # Convert all geo points to local meter coordinates
-    xy = [latlon_to_local_xy(lat, lon, lat0, lon0) for lat, lon in geo_pts]
-
-    ratios_x = []
-    ratios_y = []
+    pixels = np.asarray(pixel_pts, dtype=np.float64).reshape(-1, 2)
+    geo = np.asarray(geo_pts, dtype=np.float64).reshape(-1, 2)
 
-    n = len(pixel_pts)
-    for i in range(n):
-        for j in range(i + 1, n):
-            (px1, py1), (px2, py2) = pixel_pts[i], pixel_pts[j]
-            dx_px = px2 - px1
-            dy_px = py2 - py1
+    # Use the first real-world point as local origin
+    x_m, y_m = latlon_to_local_xy_array(geo[:, 0], geo[:, 1], geo[0, 0], geo[0, 1])
 
-            x1, y1 = xy[i]
-            x2, y2 = xy[j]
-            dx_m = x2 - x1
-            dy_m = y2 - y1
+    # Every pair (i, j) with i < j at once
+    i, j = np.triu_indices(len(pixels), k=1)
+    dx_px = pixels[j, 0] - pixels[i, 0]
+    dy_px = pixels[j, 1] - pixels[i, 1]
+    dx_m = x_m[j] - x_m[i]
+    dy_m = y_m[j] - y_m[i]
 
-            # Only compute ratios when movement exists in that axis
-            if dx_px != 0:
-                ratios_x.append(dx_m / dx_px)
-            if dy_px != 0:
-                ratios_y.append(dy_m / dy_px)
+    # Only compute ratios when movement exists in that axis
+    moves_x = dx_px != 0
+    moves_y = dy_px != 0
+    if not moves_x.any() or not moves_y.any():
+        raise ValueError("Need two pixel points that differ in x and two that differ in y")
 
-    m_per_px_x = sum(ratios_x) / len(ratios_x)
-    m_per_px_y = sum(ratios_y) / len(ratios_y)
+    m_per_px_x = float(np.mean(dx_m[moves_x] / dx_px[moves_x]))
+    m_per_px_y = float(np.mean(dy_m[moves_y] / dy_px[moves_y]))
 
     return abs(m_per_px_x), abs(m_per_px_y)
 
@@ -87,5 +112,3 @@ def rectangular_area_from_bounds(nw_corner: LatLon, se_corner: LatLon) -> float:
 
     # Return unit: Square kilometers (legacy comment in Backend.py)
     return (ns_dist * ew_dist) / 1000000.0
-
-
@@ -0,0 +1,145 @@
+"""
+Vectorized pixel <-> lat/lon projection for registered maps.
+
+A map's registration is a similarity transform (rotation + uniform scale + translation) from
+overlay pixels to local equirectangular meters around an origin (see
+OptimizeRotation.compute_procrustes_registration). It is stored as a 2x3 affine matrix so
+projecting any number of points is a single matrix product.
+
+Pixel frames:
+    "overlay": the padded, unrotated image the control points were selected on
+               (selected_pixel_coords). Origin top-left, y down.
+    "final":   the stored final image, i.e. the overlay rotated counter-clockwise by
+               optimal_rotation_angle about its center (PIL Image.rotate). Same size.
+"""
+
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from typing import Any, Dict
+
+import numpy as np
+
+
+EARTH_RADIUS_M = 6371000.0
+
+FRAME_OVERLAY = "overlay"
+FRAME_FINAL = "final"
+FRAMES = (FRAME_OVERLAY, FRAME_FINAL)
+
+
+@dataclass(frozen=True)
+class MapTransform:
+    origin_lat: float
+    origin_lon: float
+    # Overlay pixel (x, y, 1) -> local (east, north) meters.
+    matrix: np.ndarray
+    width: float
+    height: float
+    rotation_deg: float
+    scale_m_per_px: float
+    rms_error_m: float | None = None
+
+    def pixel_to_latlon(self, points: Any, *, frame: str = FRAME_OVERLAY) -> np.ndarray:
+        """
+        (n, 2) pixel (x, y) -> (n, 2) (lat, lon).
+        """
+        xy = _as_points(points)
+        if frame == FRAME_FINAL:
+            xy = rotate_about_center(xy, self.width, self.height, -self.rotation_deg)
+        elif frame != FRAME_OVERLAY:
+            raise ValueError(f"Unknown pixel frame: {frame}")
+
+        east_north = xy @ self.matrix[:, :2].T + self.matrix[:, 2]
+        lat = self.origin_lat + np.degrees(east_north[:, 1] / EARTH_RADIUS_M)
+        lon = self.origin_lon + np.degrees(east_north[:, 0] / (EARTH_RADIUS_M * math.cos(math.radians(self.origin_lat))))
+        return np.column_stack([lat, lon])
+
+    def latlon_to_pixel(self, points: Any, *, frame: str = FRAME_OVERLAY) -> np.ndarray:
+        """
+        (n, 2) (lat, lon) -> (n, 2) pixel (x, y). Points off the map give pixels outside the image.
+        """
+        latlon = _as_points(points)
+        east = np.radians(latlon[:, 1] - self.origin_lon) * EARTH_RADIUS_M * math.cos(math.radians(self.origin_lat))
+        north = np.radians(latlon[:, 0] - self.origin_lat) * EARTH_RADIUS_M
+
+        linear = self.matrix[:, :2]
+        offset = self.matrix[:, 2]
+        xy = (np.column_stack([east, north]) - offset) @ np.linalg.inv(linear).T
+        if frame == FRAME_FINAL:
+            xy = rotate_about_center(xy, self.width, self.height, self.rotation_deg)
+        elif frame != FRAME_OVERLAY:
+            raise ValueError(f"Unknown pixel frame: {frame}")
+        return xy
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "origin": [self.origin_lat, self.origin_lon],
+            "matrix": self.matrix.tolist(),
+            "width": self.width,
+            "height": self.height,
+            "rotation_deg": self.rotation_deg,
+            "scale_m_per_px": self.scale_m_per_px,
+            "rms_error_m": self.rms_error_m,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MapTransform":
+        return cls(
+            origin_lat=float(data["origin"][0]),
+            origin_lon=float(data["origin"][1]),
+            matrix=np.asarray(data["matrix"], dtype=float),
+            width=float(data["width"]),
+            height=float(data["height"]),
+            rotation_deg=float(data["rotation_deg"]),
+            scale_m_per_px=float(data["scale_m_per_px"]),
+            rms_error_m=data.get("rms_error_m"),
+        )
+
+
+def transform_from_procrustes(registration: Dict[str, Any], width: float, height: float) -> MapTransform:
+    """
+    Build a MapTransform from the result of OptimizeRotation.compute_procrustes_registration.
+
+    The fit is r = scale * R @ s + t with s = (x - W/2, H/2 - y); folding the pixel
+    centering and y flip into it gives one affine map from (x, y) to (east, north).
+    """
+    scale = float(registration["scale"])
+    rotation = np.asarray(registration["rotation_matrix"], dtype=float)
+    translation = np.asarray(registration["translation_m"], dtype=float)
+    centering = np.array([[1.0, 0.0, -width / 2.0], [0.0, -1.0, height / 2.0]])
+
+    linear = scale * rotation @ centering[:, :2]
+    offset = scale * rotation @ centering[:, 2] + translation
+    origin_lat, origin_lon = registration["origin"]
+    return MapTransform(
+        origin_lat=float(origin_lat),
+        origin_lon=float(origin_lon),
+        matrix=np.column_stack([linear, offset]),
+        width=float(width),
+        height=float(height),
+        rotation_deg=float(registration["optimal_rotation_angle"]),
+        scale_m_per_px=scale,
+        rms_error_m=registration.get("rms_error_m"),
+    )
+
+
+def rotate_about_center(points: np.ndarray, width: float, height: float, angle_deg: float) -> np.ndarray:
+    """
+    Where pixels end up when an image is rotated counter-clockwise (as displayed, y down)
+    by angle_deg about its center, as PIL Image.rotate does.
+    """
+    theta = math.radians(angle_deg)
+    cos_t, sin_t = math.cos(theta), math.sin(theta)
+    cx, cy = width / 2.0, height / 2.0
+    dx = points[:, 0] - cx
+    dy = points[:, 1] - cy
+    return np.column_stack([cx + dx * cos_t + dy * sin_t, cy - dx * sin_t + dy * cos_t])
+
+
+def _as_points(points: Any) -> np.ndarray:
+    array = np.asarray(points, dtype=float)
+    if array.ndim != 2 or array.shape[1] != 2:
+        raise ValueError("Points must be a list of [a, b] pairs")
+    return array
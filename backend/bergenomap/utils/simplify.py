@@ -0,0 +1,113 @@
+"""
+Douglas-Peucker track simplification with precomputed point importance.
+
+`douglas_peucker_importance` runs Douglas-Peucker once and records, per point, the largest
+tolerance at which that point survives. Simplifying to any tolerance is then a mask
+(`importance >= tolerance`), which gives exactly the Douglas-Peucker result for that
+tolerance. This is what the stored levels of detail (track_service.build_track_lods) use.
+
+Distances are in meters on a local equirectangular projection of each segment.
+Segment endpoints always survive (importance = inf).
+"""
+
+from __future__ import annotations
+
+import math
+from dataclasses import replace
+
+import numpy as np
+
+from bergenomap.utils.projection import EARTH_RADIUS_M
+from bergenomap.utils.track_codec import TrackArrays
+
+
+def douglas_peucker_importance(
+    lat: np.ndarray,
+    lon: np.ndarray,
+    segment_starts: np.ndarray,
+    *,
+    min_tolerance_m: float = 0.0,
+) -> np.ndarray:
+    """
+    Per-point importance in meters (see module docstring). Ranges whose points are all
+    within min_tolerance_m of their chord are not refined further; their inner points get
+    importance 0, which keeps the work proportional to the points kept at that tolerance.
+    """
+    n = int(lat.shape[0])
+    importance = np.zeros(n, dtype=np.float64)
+    if n == 0:
+        return importance
+
+    bounds = [int(s) for s in segment_starts.tolist()] + [n]
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if end <= start:
+            continue
+        importance[start] = math.inf
+        importance[end - 1] = math.inf
+        if end - start < 3:
+            continue
+        x, y = _local_xy(lat[start:end], lon[start:end])
+        _refine(x, y, importance[start:end], min_tolerance_m)
+    return importance
+
+
+def simplify_track(track: TrackArrays, importance: np.ndarray, tolerance_m: float) -> TrackArrays:
+    """
+    The points of `track` with importance >= tolerance_m, all columns kept.
+    """
+    keep = importance >= tolerance_m
+    # Segment k of the result starts at the number of kept points before its original start.
+    kept_before = np.concatenate([[0], np.cumsum(keep)])
+    return replace(
+        track,
+        lat=track.lat[keep],
+        lon=track.lon[keep],
+        time=track.time[keep] if track.time is not None else None,
+        elevation=track.elevation[keep] if track.elevation is not None else None,
+        heart_rate=track.heart_rate[keep] if track.heart_rate is not None else None,
+        cadence=track.cadence[keep] if track.cadence is not None else None,
+        segment_starts=kept_before[track.segment_starts].astype(np.int64),
+    )
+
+
+def _local_xy(lat: np.ndarray, lon: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    lat0 = float(lat[0])
+    x = np.radians(lon - lon[0]) * EARTH_RADIUS_M * math.cos(math.radians(lat0))
+    y = np.radians(lat - lat0) * EARTH_RADIUS_M
+    return x, y
+
+
+def _refine(x: np.ndarray, y: np.ndarray, importance: np.ndarray, min_tolerance_m: float) -> None:
+    # Iterative Douglas-Peucker. Each stack entry is (first, last, importance of the split that
+    # created the range); a point's importance is capped by that of its parent split, so that
+    # thresholding reproduces the recursive algorithm.
+    stack = [(0, len(x) - 1, math.inf)]
+    while stack:
+        first, last, parent = stack.pop()
+        if last - first < 2:
+            continue
+        distances = _distances_to_chord(x, y, first, last)
+        index = int(np.argmax(distances))
+        distance = float(distances[index])
+        if distance <= min_tolerance_m:
+            continue
+        split = first + 1 + index
+        value = min(distance, parent)
+        importance[split] = value
+        stack.append((first, split, value))
+        stack.append((split, last, value))
+
+
+def _distances_to_chord(x: np.ndarray, y: np.ndarray, first: int, last: int) -> np.ndarray:
+    """
+    Distances of the points strictly between first and last to the segment first-last.
+    """
+    px = x[first + 1:last]
+    py = y[first + 1:last]
+    ax, ay = x[first], y[first]
+    dx, dy = x[last] - ax, y[last] - ay
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0.0:
+        return np.hypot(px - ax, py - ay)
+    t = np.clip(((px - ax) * dx + (py - ay) * dy) / length_sq, 0.0, 1.0)
+    return np.hypot(px - (ax + t * dx), py - (ay + t * dy))
@@ -0,0 +1,503 @@
+"""
+Compact columnar binary format for GPS tracks.
+
+Layout (all little-endian):
+    b"BOTK" | version (u8) | zlib(body)
+
+    body:
+        point_count (u32), segment_count (u32), column flags (u16), meta_json length (u32)
+        meta_json: {"metadata": {...}, "tracks": [{"name", "type"}, ...]}
+        segment_track (i32 * segment_count), segment_start (i32 * segment_count)
+        lat, lon: delta-encoded i32, fixed point 1e-7 degrees
+        per optional column present in flags:
+            validity bitmap (np.packbits, ceil(point_count / 8) bytes)
+            values: time as delta-encoded i64 epoch milliseconds,
+                    elevation as delta-encoded i32 centimeters,
+                    heart_rate / cadence as i16
+
+Missing values repeat the previous value before delta encoding (so they compress to
+zero deltas) and are restored as NaN/NaT from the validity bitmap on decode.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import struct
+import xml.etree.ElementTree as ET
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+MAGIC = b"BOTK"
+VERSION = 1
+
+COORD_SCALE = 1e7
+ELEVATION_SCALE = 100.0
+
+FLAG_TIME = 1
+FLAG_ELEVATION = 2
+FLAG_HEART_RATE = 4
+FLAG_CADENCE = 8
+
+_HEADER = struct.Struct("<IIHI")
+
+
+@dataclass(frozen=True)
+class TrackArrays:
+    """
+    One GPS track (possibly several GPX <trk>/<trkseg>) as flat per-point arrays.
+
+    Points of all segments are concatenated; segment k covers
+    [segment_starts[k], segment_starts[k + 1]) and belongs to tracks[segment_tracks[k]].
+    """
+
+    lat: np.ndarray
+    lon: np.ndarray
+    time: Optional[np.ndarray] = None  # datetime64[ms], NaT where missing
+    elevation: Optional[np.ndarray] = None  # meters, NaN where missing
+    heart_rate: Optional[np.ndarray] = None  # bpm, NaN where missing
+    cadence: Optional[np.ndarray] = None  # NaN where missing
+    segment_starts: np.ndarray = field(default_factory=lambda: np.zeros(1, dtype=np.int64))
+    segment_tracks: np.ndarray = field(default_factory=lambda: np.zeros(1, dtype=np.int64))
+    tracks: List[Dict[str, Any]] = field(default_factory=lambda: [{"name": None, "type": None}])
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def point_count(self) -> int:
+        return int(self.lat.shape[0])
+
+
+def encode_track(track: TrackArrays) -> bytes:
+    n = track.point_count
+    flags = 0
+    columns: List[bytes] = []
+
+    if track.time is not None:
+        flags |= FLAG_TIME
+        valid = ~np.isnat(track.time)
+        values = _fill_forward(track.time.astype("datetime64[ms]").astype(np.int64), valid)
+        columns.append(_pack_validity(valid) + _delta_encode(values, np.int64))
+    if track.elevation is not None:
+        flags |= FLAG_ELEVATION
+        valid = np.isfinite(track.elevation)
+        values = _fill_forward(np.round(np.nan_to_num(track.elevation) * ELEVATION_SCALE).astype(np.int64), valid)
+        columns.append(_pack_validity(valid) + _delta_encode(values, np.int32))
+    if track.heart_rate is not None:
+        flags |= FLAG_HEART_RATE
+        valid = np.isfinite(track.heart_rate)
+        values = np.where(valid, np.round(np.nan_to_num(track.heart_rate)), 0).astype("<i2")
+        columns.append(_pack_validity(valid) + values.tobytes())
+    if track.cadence is not None:
+        flags |= FLAG_CADENCE
+        valid = np.isfinite(track.cadence)
+        values = np.where(valid, np.round(np.nan_to_num(track.cadence)), 0).astype("<i2")
+        columns.append(_pack_validity(valid) + values.tobytes())
+
+    meta_json = json.dumps(
+        {"metadata": track.metadata, "tracks": track.tracks}, separators=(",", ":"), ensure_ascii=False
+    ).encode("utf-8")
+    segment_starts = np.asarray(track.segment_starts, dtype="<i4")
+    segment_tracks = np.asarray(track.segment_tracks, dtype="<i4")
+
+    lat_fixed = np.round(track.lat * COORD_SCALE).astype(np.int64)
+    lon_fixed = np.round(track.lon * COORD_SCALE).astype(np.int64)
+
+    body = b"".join(
+        [
+            _HEADER.pack(n, len(segment_starts), flags, len(meta_json)),
+            meta_json,
+            segment_tracks.tobytes(),
+            segment_starts.tobytes(),
+            _delta_encode(lat_fixed, np.int32),
+            _delta_encode(lon_fixed, np.int32),
+            *columns,
+        ]
+    )
+    return MAGIC + bytes([VERSION]) + zlib.compress(body, 6)
+
+
+def decode_track(blob: bytes) -> TrackArrays:
+    if blob[:4] != MAGIC:
+        raise ValueError("Not a binary track blob")
+    if blob[4] != VERSION:
+        raise ValueError(f"Unsupported binary track version {blob[4]}")
+
+    body = zlib.decompress(blob[5:])
+    n, segment_count, flags, meta_len = _HEADER.unpack_from(body, 0)
+    offset = _HEADER.size
+
+    meta = json.loads(body[offset:offset + meta_len].decode("utf-8"))
+    offset += meta_len
+
+    segment_tracks = np.frombuffer(body, dtype="<i4", count=segment_count, offset=offset).astype(np.int64)
+    offset += 4 * segment_count
+    segment_starts = np.frombuffer(body, dtype="<i4", count=segment_count, offset=offset).astype(np.int64)
+    offset += 4 * segment_count
+
+    lat, offset = _delta_decode(body, offset, n, "<i4")
+    lon, offset = _delta_decode(body, offset, n, "<i4")
+
+    time = elevation = heart_rate = cadence = None
+    if flags & FLAG_TIME:
+        valid, offset = _unpack_validity(body, offset, n)
+        values, offset = _delta_decode(body, offset, n, "<i8")
+        time = values.astype("datetime64[ms]")
+        time[~valid] = np.datetime64("NaT")
+    if flags & FLAG_ELEVATION:
+        valid, offset = _unpack_validity(body, offset, n)
+        values, offset = _delta_decode(body, offset, n, "<i4")
+        elevation = np.where(valid, values / ELEVATION_SCALE, np.nan)
+    if flags & FLAG_HEART_RATE:
+        valid, offset = _unpack_validity(body, offset, n)
+        values = np.frombuffer(body, dtype="<i2", count=n, offset=offset)
+        offset += 2 * n
+        heart_rate = np.where(valid, values, np.nan)
+    if flags & FLAG_CADENCE:
+        valid, offset = _unpack_validity(body, offset, n)
+        values = np.frombuffer(body, dtype="<i2", count=n, offset=offset)
+        offset += 2 * n
+        cadence = np.where(valid, values, np.nan)
+
+    return TrackArrays(
+        lat=lat / COORD_SCALE,
+        lon=lon / COORD_SCALE,
+        time=time,
+        elevation=elevation,
+        heart_rate=heart_rate,
+        cadence=cadence,
+        segment_starts=segment_starts,
+        segment_tracks=segment_tracks,
+        tracks=meta.get("tracks") or [],
+        metadata=meta.get("metadata") or {},
+    )
+
+
+def track_data_hash(blob: bytes) -> str:
+    """
+    Content hash of an encoded track, stored next to it as track_hash.
+    """
+    return hashlib.blake2b(blob, digest_size=16).hexdigest()
+
+
+def track_bounds(track: TrackArrays) -> Optional[Tuple[float, float, float, float]]:
+    """
+    (min_lat, min_lon, max_lat, max_lon), or None for an empty track.
+    """
+    if track.point_count == 0:
+        return None
+    return (
+        float(track.lat.min()),
+        float(track.lon.min()),
+        float(track.lat.max()),
+        float(track.lon.max()),
+    )
+
+
+def track_arrays_from_parsed_gpx(parsed_gpx: Dict[str, Any]) -> TrackArrays:
+    """
+    Build TrackArrays from the dict returned by `gpx_parser.parse_strava_gpx`.
+    """
+    lats: List[float] = []
+    lons: List[float] = []
+    times: List[Optional[str]] = []
+    elevations: List[float] = []
+    heart_rates: List[float] = []
+    cadences: List[float] = []
+    segment_starts: List[int] = []
+    segment_tracks: List[int] = []
+    tracks: List[Dict[str, Any]] = []
+
+    nan = float("nan")
+    for track_index, track in enumerate(parsed_gpx.get("tracks", [])):
+        tracks.append({"name": track.get("name"), "type": track.get("type")})
+        for segment in track.get("segments", []):
+            segment_starts.append(len(lats))
+            segment_tracks.append(track_index)
+            for point in segment.get("points", []):
+                lats.append(point["lat"])
+                lons.append(point["lon"])
+                times.append(point.get("time"))
+                elevation = point.get("elevation")
+                elevations.append(nan if elevation is None else elevation)
+                extensions = point.get("extensions") or {}
+                heart_rates.append(extensions.get("hr", nan))
+                cadences.append(extensions.get("cad", nan))
+
+    heart_rate = np.asarray(heart_rates, dtype=float)
+    cadence = np.asarray(cadences, dtype=float)
+    elevation = np.asarray(elevations, dtype=float)
+    return TrackArrays(
+        lat=np.asarray(lats, dtype=float),
+        lon=np.asarray(lons, dtype=float),
+        time=parse_gpx_times(times) if any(t is not None for t in times) else None,
+        elevation=elevation if np.isfinite(elevation).any() else None,
+        heart_rate=heart_rate if np.isfinite(heart_rate).any() else None,
+        cadence=cadence if np.isfinite(cadence).any() else None,
+        segment_starts=np.asarray(segment_starts, dtype=np.int64),
+        segment_tracks=np.asarray(segment_tracks, dtype=np.int64),
+        tracks=tracks,
+        metadata=dict(parsed_gpx.get("metadata") or {}),
+    )
+
+
+def track_arrays_to_parsed_gpx(track: TrackArrays) -> Dict[str, Any]:
+    """
+    Inverse of track_arrays_from_parsed_gpx: the JSON shape served by the track endpoints.
+    Times are normalized to UTC ("...Z").
+    """
+    lats = track.lat.tolist()
+    lons = track.lon.tolist()
+    times = format_gpx_times(track.time) if track.time is not None else None
+    elevations = _nan_to_none(track.elevation)
+    heart_rates = _nan_to_none(track.heart_rate)
+    cadences = _nan_to_none(track.cadence)
+
+    points: List[Dict[str, Any]] = []
+    for i in range(track.point_count):
+        point: Dict[str, Any] = {"lat": lats[i], "lon": lons[i]}
+        if elevations is not None and elevations[i] is not None:
+            point["elevation"] = elevations[i]
+        if times is not None and times[i] is not None:
+            point["time"] = times[i]
+        extensions = {}
+        if heart_rates is not None and heart_rates[i] is not None:
+            extensions["hr"] = heart_rates[i]
+        if cadences is not None and cadences[i] is not None:
+            extensions["cad"] = cadences[i]
+        if extensions:
+            point["extensions"] = extensions
+        points.append(point)
+
+    tracks = [
+        {"name": t.get("name"), "type": t.get("type"), "segments": []} for t in track.tracks
+    ]
+    bounds = list(track.segment_starts.tolist()) + [track.point_count]
+    for k, track_index in enumerate(track.segment_tracks.tolist()):
+        tracks[track_index]["segments"].append({"points": points[bounds[k]:bounds[k + 1]]})
+    for t in tracks:
+        t["points"] = [pt for segment in t["segments"] for pt in segment["points"]]
+
+    return {"metadata": dict(track.metadata), "tracks": tracks}
+
+
+# Compact JSON track formats (see track_arrays_to_compact_json).
+WIRE_FORMAT_POINTS = "points"
+WIRE_FORMAT_COLUMNAR = "columnar"
+WIRE_FORMAT_POLYLINE = "polyline"
+WIRE_FORMATS = (WIRE_FORMAT_POINTS, WIRE_FORMAT_COLUMNAR, WIRE_FORMAT_POLYLINE)
+
+WIRE_COORD_SCALE = 1e6
+WIRE_ELEVATION_SCALE = 10.0
+POLYLINE_PRECISION = 5
+
+
+def track_arrays_to_compact_json(track: TrackArrays, wire_format: str) -> Dict[str, Any]:
+    """
+    Compact alternative to track_arrays_to_parsed_gpx: parallel per-point columns instead
+    of one object per point.
+
+        {"format", "metadata", "tracks": [{"name", "type"}], "point_count",
+         "segment_starts", "segment_tracks",
+         columnar: "coord_scale", "lat", "lon"       (delta-encoded integers)
+         polyline: "polyline_precision", "polylines" (Google encoded polyline per segment)
+         "time_origin_ms", "time" (ms), "elevation_scale", "elevation", "heart_rate", "cadence"}
+
+    Optional columns are null when absent. Otherwise they are delta-encoded integers with
+    null for missing points; a delta is relative to the previous non-null point, and the
+    first one to 0 (time: to time_origin_ms, epoch milliseconds).
+    """
+    n = track.point_count
+    payload: Dict[str, Any] = {
+        "format": wire_format,
+        "metadata": dict(track.metadata),
+        "tracks": [{"name": t.get("name"), "type": t.get("type")} for t in track.tracks],
+        "point_count": n,
+        "segment_starts": track.segment_starts.tolist(),
+        "segment_tracks": track.segment_tracks.tolist(),
+    }
+
+    if wire_format == WIRE_FORMAT_COLUMNAR:
+        payload["coord_scale"] = WIRE_COORD_SCALE
+        payload["lat"] = _gap_delta_list(np.rint(track.lat * WIRE_COORD_SCALE), None)
+        payload["lon"] = _gap_delta_list(np.rint(track.lon * WIRE_COORD_SCALE), None)
+    elif wire_format == WIRE_FORMAT_POLYLINE:
+        bounds = track.segment_starts.tolist() + [n]
+        payload["polyline_precision"] = POLYLINE_PRECISION
+        payload["polylines"] = [
+            encode_polyline(track.lat[start:end], track.lon[start:end], precision=POLYLINE_PRECISION)
+            for start, end in zip(bounds[:-1], bounds[1:])
+        ]
+    else:
+        raise ValueError(f"Unknown compact track format: {wire_format}")
+
+    payload["time_origin_ms"] = None
+    payload["time"] = None
+    if track.time is not None:
+        valid = ~np.isnat(track.time)
+        if valid.any():
+            millis = track.time.astype(np.int64)
+            origin = int(millis[valid][0])
+            payload["time_origin_ms"] = origin
+            payload["time"] = _gap_delta_list(millis - origin, valid)
+
+    payload["elevation_scale"] = WIRE_ELEVATION_SCALE
+    payload["elevation"] = _optional_gap_delta_list(track.elevation, WIRE_ELEVATION_SCALE)
+    payload["heart_rate"] = _optional_gap_delta_list(track.heart_rate, 1.0)
+    payload["cadence"] = _optional_gap_delta_list(track.cadence, 1.0)
+    return payload
+
+
+def encode_polyline(lat: np.ndarray, lon: np.ndarray, *, precision: int = POLYLINE_PRECISION) -> str:
+    """
+    Google encoded polyline algorithm format, vectorized over all points.
+    """
+    if len(lat) == 0:
+        return ""
+    factor = 10**precision
+    coords = np.column_stack([np.rint(lat * factor), np.rint(lon * factor)]).astype(np.int64)
+    deltas = np.diff(coords, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+
+    # Zigzag (sign in the lowest bit), then 5-bit chunks, least significant first.
+    values = (deltas << 1) ^ (deltas >> 63)
+    chunks = (values[:, None] >> (5 * np.arange(7, dtype=np.int64))) & 0x1F
+    chunk_count = np.maximum(1, (np.floor(np.log2(np.maximum(values, 1))).astype(np.int64) // 5) + 1)
+    used = np.arange(7) < chunk_count[:, None]
+    more = np.arange(7) < (chunk_count - 1)[:, None]
+    chars = chunks + 63 + np.where(more, 0x20, 0)
+    return chars[used].astype(np.uint8).tobytes().decode("ascii")
+
+
+def _optional_gap_delta_list(values: Optional[np.ndarray], scale: float) -> Optional[List[Optional[int]]]:
+    if values is None:
+        return None
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return None
+    return _gap_delta_list(np.rint(np.where(valid, values, 0) * scale), valid)
+
+
+def _gap_delta_list(values: np.ndarray, valid: Optional[np.ndarray]) -> List[Optional[int]]:
+    ints = values.astype(np.int64)
+    if valid is None:
+        return np.diff(ints, prepend=np.int64(0)).tolist() if len(ints) else []
+    out = np.full(len(ints), None, dtype=object)
+    out[valid] = np.diff(ints[valid], prepend=np.int64(0)).tolist()
+    return out.tolist()
+
+
+def track_arrays_to_gpx_bytes(track: TrackArrays) -> bytes:
+    """
+    Export as GPX 1.1 XML (with Garmin TrackPointExtension for hr/cad).
+    """
+    gpx = ET.Element(
+        "gpx",
+        attrib={
+            "creator": str(track.metadata.get("creator") or "BergenOmap"),
+            "version": "1.1",
+            "xmlns": "http://www.topografix.com/GPX/1/1",
+            "xmlns:gpxtpx": "http://www.garmin.com/xmlschemas/TrackPointExtension/v1",
+        },
+    )
+
+    metadata = ET.SubElement(gpx, "metadata")
+    if track.metadata.get("time"):
+        ET.SubElement(metadata, "time").text = str(track.metadata["time"])
+
+    parsed = track_arrays_to_parsed_gpx(track)
+    for t in parsed["tracks"]:
+        trk = ET.SubElement(gpx, "trk")
+        if t.get("name"):
+            ET.SubElement(trk, "name").text = str(t["name"])
+        if t.get("type"):
+            ET.SubElement(trk, "type").text = str(t["type"])
+        for segment in t["segments"]:
+            seg = ET.SubElement(trk, "trkseg")
+            for point in segment["points"]:
+                trkpt = ET.SubElement(seg, "trkpt", attrib={"lat": str(point["lat"]), "lon": str(point["lon"])})
+                if "elevation" in point:
+                    ET.SubElement(trkpt, "ele").text = str(point["elevation"])
+                if "time" in point:
+                    ET.SubElement(trkpt, "time").text = point["time"]
+                extensions = point.get("extensions")
+                if extensions:
+                    tpx = ET.SubElement(ET.SubElement(trkpt, "extensions"), "gpxtpx:TrackPointExtension")
+                    for key, value in extensions.items():
+                        ET.SubElement(tpx, f"gpxtpx:{key}").text = str(int(value))
+
+    return ET.tostring(gpx, encoding="utf-8", xml_declaration=True)
+
+
+def parse_gpx_times(times: List[Optional[str]]) -> np.ndarray:
+    """
+    GPX time strings -> datetime64[ms] (UTC), NaT for missing/unparseable values.
+    """
+    stripped = [t[:-1] if t and t.endswith("Z") else t for t in times]
+    try:
+        return np.array([t if t else "NaT" for t in stripped], dtype="datetime64[ms]")
+    except ValueError:
+        # Offsets like +02:00 are not understood by numpy; fall back to per-point parsing.
+        return np.array([_parse_time_fallback(t) for t in times], dtype="datetime64[ms]")
+
+
+def format_gpx_times(times: np.ndarray) -> List[Optional[str]]:
+    valid = ~np.isnat(times)
+    has_millis = bool((times[valid].astype(np.int64) % 1000 != 0).any())
+    unit = "ms" if has_millis else "s"
+    formatted = np.datetime_as_string(times, unit=unit)
+    return [f"{s}Z" if ok else None for s, ok in zip(formatted.tolist(), valid.tolist())]
+
+
+def _parse_time_fallback(value: Optional[str]) -> str:
+    if not value:
+        return "NaT"
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return "NaT"
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt.isoformat()
+
+
+def _nan_to_none(values: Optional[np.ndarray]) -> Optional[List[Optional[float]]]:
+    if values is None:
+        return None
+    return [None if v != v else v for v in values.tolist()]
+
+
+def _fill_forward(values: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    if valid.all():
+        return values
+    if not valid.any():
+        return np.zeros_like(values)
+    idx = np.where(valid, np.arange(len(values)), 0)
+    np.maximum.accumulate(idx, out=idx)
+    filled = values[idx]
+    # Leading missing values have no previous value; use the first valid one.
+    filled[: int(np.argmax(valid))] = values[int(np.argmax(valid))]
+    return filled
+
+
+def _delta_encode(values: np.ndarray, dtype: Any) -> bytes:
+    deltas = np.diff(values, prepend=np.int64(0)) if len(values) else values
+    return np.asarray(deltas).astype(np.dtype(dtype).newbyteorder("<")).tobytes()
+
+
+def _delta_decode(body: bytes, offset: int, n: int, dtype: str) -> Tuple[np.ndarray, int]:
+    deltas = np.frombuffer(body, dtype=dtype, count=n, offset=offset)
+    return np.cumsum(deltas, dtype=np.int64), offset + deltas.itemsize * n
+
+
+def _pack_validity(valid: np.ndarray) -> bytes:
+    return np.packbits(valid).tobytes()
+
+
+def _unpack_validity(body: bytes, offset: int, n: int) -> Tuple[np.ndarray, int]:
+    size = (n + 7) // 8
+    bits = np.frombuffer(body, dtype=np.uint8, count=size, offset=offset)
+    return np.unpackbits(bits, count=n).astype(bool), offset + size
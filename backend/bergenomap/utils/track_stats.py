@@ -0,0 +1,166 @@
+"""
+Summary statistics of a GPS track, computed over TrackArrays with NumPy.
+
+All per-step quantities (step i goes from point i to point i + 1) are computed as arrays
+in one pass; steps that cross a segment boundary are masked out, like the distance in
+gpx_parser's summary. Times, elevations and heart rates may be missing per point
+(NaT / NaN in TrackArrays); a statistic is None when its input is missing altogether.
+"""
+
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from bergenomap.utils.geo import haversine_steps
+from bergenomap.utils.track_codec import TrackArrays
+
+# Steps slower than this count as standing still for moving time and pace.
+DEFAULT_MOVING_SPEED_MPS = 0.5
+# Steps with a longer time gap (recording paused) count towards neither moving time nor zones.
+DEFAULT_MAX_STEP_GAP_S = 60.0
+# Centered moving average over this many points before elevation gain/loss, so that GPS
+# and barometer noise does not add up.
+DEFAULT_ELEVATION_SMOOTHING_POINTS = 5
+# Upper bounds (bpm) of heart rate zones 1..n-1; the last zone is open-ended.
+DEFAULT_HR_ZONE_UPPER_BPM = (120.0, 140.0, 155.0, 170.0)
+
+
+@dataclass(frozen=True)
+class TrackStats:
+    point_count: int
+    distance_m: float
+    start_time: Optional[str]
+    elapsed_time_s: Optional[float]
+    moving_time_s: Optional[float]
+    # Seconds per kilometer over moving time.
+    moving_pace_s_per_km: Optional[float]
+    elevation_gain_m: Optional[float]
+    elevation_loss_m: Optional[float]
+    min_elevation_m: Optional[float]
+    max_elevation_m: Optional[float]
+    avg_heart_rate: Optional[float]
+    max_heart_rate: Optional[float]
+    # Seconds spent in each heart rate zone (see DEFAULT_HR_ZONE_UPPER_BPM).
+    hr_zone_s: Optional[List[float]]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TrackStats":
+        return cls(**{name: data.get(name) for name in cls.__dataclass_fields__})
+
+
+def compute_track_stats(
+    track: TrackArrays,
+    *,
+    moving_speed_mps: float = DEFAULT_MOVING_SPEED_MPS,
+    max_step_gap_s: float = DEFAULT_MAX_STEP_GAP_S,
+    elevation_smoothing_points: int = DEFAULT_ELEVATION_SMOOTHING_POINTS,
+    hr_zone_upper_bpm: Sequence[float] = DEFAULT_HR_ZONE_UPPER_BPM,
+) -> TrackStats:
+    n = track.point_count
+    in_segment = _in_segment_steps(track)
+    step_m = np.where(in_segment, haversine_steps(track.lat, track.lon), 0.0)
+    distance_m = float(step_m.sum())
+
+    start_time = None
+    elapsed_time_s = moving_time_s = pace = None
+    step_s = None
+    if track.time is not None and n and not np.isnat(track.time).all():
+        valid = ~np.isnat(track.time)
+        millis = track.time.astype(np.int64)
+        start_time = f"{np.datetime_as_string(track.time[valid][0], unit='s')}Z"
+        elapsed_time_s = float(millis[valid][-1] - millis[valid][0]) / 1000.0
+        step_s = np.diff(millis) / 1000.0
+        step_ok = in_segment & valid[:-1] & valid[1:] & (step_s > 0) & (step_s <= max_step_gap_s)
+        step_s = np.where(step_ok, step_s, 0.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            moving = step_ok & (step_m / np.where(step_ok, step_s, 1.0) >= moving_speed_mps)
+        moving_time_s = float(step_s[moving].sum())
+        moving_m = float(step_m[moving].sum())
+        pace = moving_time_s / (moving_m / 1000.0) if moving_m > 0 else None
+
+    gain = loss = min_ele = max_ele = None
+    if track.elevation is not None and not np.isnan(track.elevation).all():
+        smoothed = _smooth(track.elevation, track.segment_starts, elevation_smoothing_points)
+        step_ele = np.where(in_segment, np.diff(smoothed), 0.0)
+        step_ele = np.nan_to_num(step_ele)
+        gain = float(step_ele[step_ele > 0].sum())
+        loss = float(-step_ele[step_ele < 0].sum())
+        min_ele = float(np.nanmin(track.elevation))
+        max_ele = float(np.nanmax(track.elevation))
+
+    avg_hr = max_hr = zones = None
+    if track.heart_rate is not None and not np.isnan(track.heart_rate).all():
+        hr = track.heart_rate
+        if step_s is not None:
+            # Time-weighted: each step's duration is attributed to its starting point.
+            hr_start = hr[:-1]
+            weighted = ~np.isnan(hr_start) & (step_s > 0)
+            total_s = float(step_s[weighted].sum())
+            if total_s > 0:
+                avg_hr = float((hr_start[weighted] * step_s[weighted]).sum() / total_s)
+            upper = np.asarray(hr_zone_upper_bpm, dtype=np.float64)
+            zone_index = np.searchsorted(upper, hr_start[weighted], side="right")
+            zones = np.bincount(zone_index, weights=step_s[weighted], minlength=len(upper) + 1).tolist()
+        if avg_hr is None:
+            avg_hr = float(np.nanmean(hr))
+        max_hr = float(np.nanmax(hr))
+
+    return TrackStats(
+        point_count=n,
+        distance_m=distance_m,
+        start_time=start_time,
+        elapsed_time_s=elapsed_time_s,
+        moving_time_s=moving_time_s,
+        moving_pace_s_per_km=pace,
+        elevation_gain_m=gain,
+        elevation_loss_m=loss,
+        min_elevation_m=min_ele,
+        max_elevation_m=max_ele,
+        avg_heart_rate=avg_hr,
+        max_heart_rate=max_hr,
+        hr_zone_s=zones,
+    )
+
+
+def _in_segment_steps(track: TrackArrays) -> np.ndarray:
+    """
+    Boolean per step: True when both points belong to the same segment.
+    """
+    n = track.point_count
+    in_segment = np.ones(max(n - 1, 0), dtype=bool)
+    starts = track.segment_starts[(track.segment_starts > 0) & (track.segment_starts < n)]
+    in_segment[starts - 1] = False
+    return in_segment
+
+
+def _smooth(values: np.ndarray, segment_starts: np.ndarray, window: int) -> np.ndarray:
+    """
+    Centered moving average within each segment, ignoring NaNs (a window of only NaNs stays NaN).
+    """
+    if window <= 1:
+        return values
+    n = len(values)
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    half = window // 2
+    out = np.full(n, np.nan)
+    bounds = [int(s) for s in segment_starts.tolist() if 0 <= s < n] + [n]
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if end <= start:
+            continue
+        # Windows are clipped at the segment ends; prefix sums give every window sum at once.
+        sums = np.concatenate([[0.0], np.cumsum(filled[start:end])])
+        counts = np.concatenate([[0], np.cumsum(valid[start:end])])
+        index = np.arange(end - start)
+        lo = np.maximum(index - half, 0)
+        hi = np.minimum(index + half + 1, end - start)
+        count = counts[hi] - counts[lo]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[start:end] = np.where(count > 0, (sums[hi] - sums[lo]) / count, np.nan)
+    return out
@@ -0,0 +1,11 @@
+-- Migration: add compact binary track data
+--
+-- track_data holds the columnar binary encoding from bergenomap/utils/track_codec.py
+-- (delta-encoded fixed-point lat/lon, time, elevation, heart rate, cadence; zlib-compressed).
+--
+-- gps_tracks keeps the uploaded GPX in gpx_data as the original. Strava imports store only
+-- track_data and leave gpx_data empty; GPX is generated from track_data on export.
+-- Existing rows have NULL track_data and are backfilled lazily on first read.
+
+ALTER TABLE gps_tracks ADD COLUMN track_data BLOB NULL;
+ALTER TABLE strava_activities ADD COLUMN track_data BLOB NULL;
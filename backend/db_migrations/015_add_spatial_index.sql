@@ -0,0 +1,45 @@
+-- Migration: add R*Tree spatial indexes over maps, gps_tracks and strava_imports
+--
+-- Each index holds the lat/lon bounding box of a row and is maintained by the
+-- repositories (maps_repo, tracks_repo, strava_repo) on insert/update/delete.
+-- strava_imports has a composite key, so its index carries username/activity_id
+-- as auxiliary columns and uses its own id.
+
+CREATE VIRTUAL TABLE maps_rtree USING rtree(
+    map_id,
+    min_lat, max_lat,
+    min_lon, max_lon
+);
+
+CREATE VIRTUAL TABLE gps_tracks_rtree USING rtree(
+    track_id,
+    min_lat, max_lat,
+    min_lon, max_lon
+);
+
+CREATE VIRTUAL TABLE strava_imports_rtree USING rtree(
+    id,
+    min_lat, max_lat,
+    min_lon, max_lon,
+    +username TEXT,
+    +activity_id INTEGER
+);
+
+INSERT INTO maps_rtree (map_id, min_lat, max_lat, min_lon, max_lon)
+SELECT
+    map_id,
+    min(nw_coords_lat, se_coords_lat), max(nw_coords_lat, se_coords_lat),
+    min(nw_coords_lon, se_coords_lon), max(nw_coords_lon, se_coords_lon)
+FROM maps
+WHERE nw_coords_lat IS NOT NULL AND nw_coords_lon IS NOT NULL
+  AND se_coords_lat IS NOT NULL AND se_coords_lon IS NOT NULL;
+
+INSERT INTO gps_tracks_rtree (track_id, min_lat, max_lat, min_lon, max_lon)
+SELECT track_id, min_lat, max_lat, min_lon, max_lon
+FROM gps_tracks
+WHERE min_lat IS NOT NULL AND min_lon IS NOT NULL AND max_lat IS NOT NULL AND max_lon IS NOT NULL;
+
+INSERT INTO strava_imports_rtree (min_lat, max_lat, min_lon, max_lon, username, activity_id)
+SELECT min_lat, max_lat, min_lon, max_lon, username, activity_id
+FROM strava_imports
+WHERE min_lat IS NOT NULL AND min_lon IS NOT NULL AND max_lat IS NOT NULL AND max_lon IS NOT NULL;
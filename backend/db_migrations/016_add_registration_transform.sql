@@ -0,0 +1,8 @@
+-- Migration: store the registration similarity transform per map
+--
+-- JSON from bergenomap/utils/projection.py MapTransform.to_dict(): origin, 2x3 affine matrix
+-- (overlay pixel -> local meters), rotation, scale and fit error. NULL for maps registered
+-- before this migration; it is computed from selected_pixel_coords/selected_realworld_coords
+-- on first use and stored.
+
+ALTER TABLE maps ADD COLUMN registration_transform TEXT NULL;
@@ -0,0 +1,27 @@
+-- Migration: add jobs (background job queue)
+--
+-- Durable queue for CPU-heavy work (map ingest) run by the process pool in
+-- bergenomap/services/job_service.py. input_data holds the job's uploaded payload
+-- and is cleared once the job finishes.
+
+CREATE TABLE jobs (
+    job_id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT NULL,
+    params TEXT NULL,
+    input_data BLOB NULL,
+    result TEXT NULL,
+    error TEXT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    started_at DATETIME NULL,
+    finished_at DATETIME NULL,
+    FOREIGN KEY (username) REFERENCES users(username) ON DELETE CASCADE
+);
+
+CREATE INDEX idx_jobs_status ON jobs(status, created_at);
+CREATE INDEX idx_jobs_username_created ON jobs(username, created_at);
@@ -0,0 +1,8 @@
+-- Migration: add incremental Strava sync state to strava_connections
+--
+-- sync_watermark: unix time of the newest activity start_date seen by a summary sync;
+-- incremental syncs pass it to Strava as `after=`.
+-- last_reconciled_at: last full walk that also picked up edits and deletions.
+
+ALTER TABLE strava_connections ADD COLUMN sync_watermark INTEGER NULL;
+ALTER TABLE strava_connections ADD COLUMN last_reconciled_at DATETIME NULL;
@@ -0,0 +1,8 @@
+-- Migration: content hash of the binary track data
+--
+-- Hex BLAKE2b-128 of track_data, written together with it (bergenomap/utils/track_codec.py
+-- track_data_hash). The parsed-track cache keys entries on it, so a cache hit never reads
+-- the blob. NULL for rows written before this migration; those fall back to the blob length.
+
+ALTER TABLE gps_tracks ADD COLUMN track_hash TEXT NULL;
+ALTER TABLE strava_activities ADD COLUMN track_hash TEXT NULL;
@@ -0,0 +1,18 @@
+-- Migration: precomputed levels of detail for GPS tracks
+--
+-- One row per track and level: the track simplified with Douglas-Peucker at tolerance_m
+-- (settings.track_lod_tolerances_m), stored in the track_codec binary format.
+-- source is 'local' (track_id = gps_tracks.track_id) or 'strava' (track_id = activity_id).
+-- Tracks stored before this migration get their rows on first use.
+
+CREATE TABLE track_lods (
+    username TEXT NOT NULL,
+    source TEXT NOT NULL,
+    track_id INTEGER NOT NULL,
+    level INTEGER NOT NULL,
+    tolerance_m REAL NOT NULL,
+    point_count INTEGER NOT NULL,
+    track_data BLOB NOT NULL,
+    PRIMARY KEY (username, source, track_id, level),
+    FOREIGN KEY (username) REFERENCES users(username) ON DELETE CASCADE
+);
@@ -0,0 +1,27 @@
+-- Migration: per-track summary statistics
+--
+-- Computed once from the track data (bergenomap/utils/track_stats.py) when a track is
+-- uploaded or imported, so track lists can be sorted and filtered without reading tracks.
+-- source/track_id as in track_lods. hr_zone_s is a JSON array of seconds per zone.
+-- Tracks stored before this migration get their row on first use.
+
+CREATE TABLE track_stats (
+    username TEXT NOT NULL,
+    source TEXT NOT NULL,
+    track_id INTEGER NOT NULL,
+    point_count INTEGER NOT NULL,
+    distance_m REAL NOT NULL,
+    start_time TEXT NULL,
+    elapsed_time_s REAL NULL,
+    moving_time_s REAL NULL,
+    moving_pace_s_per_km REAL NULL,
+    elevation_gain_m REAL NULL,
+    elevation_loss_m REAL NULL,
+    min_elevation_m REAL NULL,
+    max_elevation_m REAL NULL,
+    avg_heart_rate REAL NULL,
+    max_heart_rate REAL NULL,
+    hr_zone_s TEXT NULL,
+    PRIMARY KEY (username, source, track_id),
+    FOREIGN KEY (username) REFERENCES users(username) ON DELETE CASCADE
+);
@@ -0,0 +1,7 @@
+-- Migration: look up a user's tracks by content hash
+--
+-- Bulk archive upload (bergenomap/services/track_ingest_service.py) skips files whose
+-- track_hash is already stored for the user. Rows stored before migration 019 get their
+-- hash on the first archive upload.
+
+CREATE INDEX IF NOT EXISTS idx_gps_tracks_username_hash ON gps_tracks(username, track_hash);
@@ -0,0 +1,10 @@
+-- Migration: map images in the content-addressed blob store
+--
+-- Map images are stored as files named by their SHA-256 (bergenomap/repositories/blob_store.py)
+-- and map_files keeps only the digests, so the database no longer holds image bytes and images
+-- can be served straight from disk. Rows written before this migration still have their BLOBs;
+-- they are moved to the blob store on first read, or all at once with
+-- scripts/move_map_files_to_blob_store.py (run VACUUM afterwards to shrink the database file).
+
+ALTER TABLE map_files ADD COLUMN original_sha256 TEXT NULL;
+ALTER TABLE map_files ADD COLUMN final_sha256 TEXT NULL;
@@ -1,5 +1,14 @@
+import io
+import math
 import xml.etree.ElementTree as ET
-from typing import Any, Dict, List, Optional
+from array import array
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Dict, List, Optional, Union
+
+import numpy as np
+
+from bergenomap.utils.geo import haversine_steps
+from bergenomap.utils.track_codec import TrackArrays
 
 
 GPX_NS = {
@@ -8,47 +17,262 @@ GPX_NS = {
     'gpxx': 'http://www.garmin.com/xmlschemas/GpxExtensions/v3'
 }
 
+_GPX = '{' + GPX_NS['gpx'] + '}'
+_GPXTPX = '{' + GPX_NS['gpxtpx'] + '}'
+_TRK = _GPX + 'trk'
+_TRKSEG = _GPX + 'trkseg'
+_TRKPT = _GPX + 'trkpt'
+_METADATA = _GPX + 'metadata'
+_TRACK_FIELD_TAGS = frozenset({_GPX + 'name', _GPX + 'type'})
+_STRUCTURE_TAGS = frozenset({_TRK, _TRKSEG, _METADATA, _GPX + 'time'}) | _TRACK_FIELD_TAGS
+
+# datetime64 NaT as int64, used for points without a (parseable) time in columnar mode.
+_NAT_MS = np.iinfo(np.int64).min
+
 
 def parse_strava_gpx(gpx_bytes: bytes) -> Dict[str, Any]:
     """
     Parse a Strava-exported GPX file and return a JSON-serializable dict.
     Focuses on track metadata plus an easy-to-iterate list of trackpoints.
     """
-    root = ET.fromstring(gpx_bytes)
-
-    metadata = {
-        "creator": root.attrib.get("creator"),
-        "version": root.attrib.get("version")
+    parsed = parse_gpx_stream(gpx_bytes)
+    return {
+        "metadata": parsed["metadata"],
+        "tracks": parsed["tracks"]
     }
 
-    metadata_time = root.find('gpx:metadata/gpx:time', GPX_NS)
-    if metadata_time is not None and metadata_time.text:
-        metadata["time"] = metadata_time.text.strip()
 
-    tracks: List[Dict[str, Any]] = []
-    for trk in root.findall('gpx:trk', GPX_NS):
-        track_info = {
-            "name": _get_text(trk, 'gpx:name'),
-            "type": _get_text(trk, 'gpx:type'),
-            "segments": []
-        }
+def parse_gpx_stream(source: Union[bytes, BinaryIO], *, columnar: bool = False) -> Dict[str, Any]:
+    """
+    Single-pass streaming GPX parser built on ET.iterparse.
 
-        segments = []
-        for seg in trk.findall('gpx:trkseg', GPX_NS):
-            segment_points = [
-                _parse_track_point(tp)
-                for tp in seg.findall('gpx:trkpt', GPX_NS)
-            ]
-            segments.append({"points": segment_points})
+    Track points are discarded from the XML tree as soon as they are read, so memory use
+    is bounded by the output rather than by the size of the XML document. Bounds, counts,
+    start/end time and distance are accumulated in the same pass.
 
-        track_info["segments"] = segments
-        track_info["points"] = [pt for segment in segments for pt in segment["points"]]
-        tracks.append(track_info)
+    Returns {"metadata": ..., "summary": ..., "tracks": [...]} where "tracks" has the same
+    shape as parse_strava_gpx. With columnar=True, "tracks" is replaced by "track": a
+    TrackArrays with one flat array per field and no per-point dicts.
 
-    return {
-        "metadata": metadata,
-        "tracks": tracks
-    }
+    Raises ET.ParseError on malformed XML.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    builder = _ColumnarBuilder() if columnar else _DictBuilder()
+    summary = _GpxSummary()
+    metadata: Dict[str, Any] = {}
+
+    # Structural state instead of an element stack: the per-event loop is the hot path
+    # (roughly six events per track point), so keep it to a couple of tag comparisons.
+    root: Optional[ET.Element] = None
+    segment: Optional[ET.Element] = None
+    in_track = False
+    in_metadata = False
+
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        tag = elem.tag
+        if event == "end":
+            if tag == _TRKPT:
+                if segment is not None:
+                    point = _parse_track_point(elem)
+                    builder.add_point(point)
+                    summary.add_point(point)
+                    # The segment only holds finished points at this moment; drop them.
+                    segment.clear()
+            elif tag not in _STRUCTURE_TAGS:
+                continue
+            elif tag == _TRKSEG:
+                segment = None
+            elif tag == _TRK:
+                in_track = False
+                root.remove(elem)
+            elif tag == _METADATA:
+                in_metadata = False
+            elif tag in _TRACK_FIELD_TAGS and in_track and segment is None:
+                # <name>/<type> of the track itself (not of a point)
+                builder.set_track_field(_strip_namespace(tag), elem.text.strip() if elem.text else None)
+            elif tag == _GPX + "time" and in_metadata and "time" not in metadata and elem.text:
+                metadata["time"] = elem.text.strip()
+        elif root is None:
+            root = elem
+            metadata["creator"] = elem.attrib.get("creator")
+            metadata["version"] = elem.attrib.get("version")
+        elif tag == _TRK:
+            in_track = True
+            builder.start_track()
+            summary.track_count += 1
+        elif tag == _TRKSEG and in_track:
+            segment = elem
+            builder.start_segment()
+            summary.start_segment()
+        elif tag == _METADATA:
+            in_metadata = True
+
+    result: Dict[str, Any] = {"metadata": metadata, "summary": summary.as_dict()}
+    if columnar:
+        result["track"] = builder.build(metadata)
+    else:
+        result["tracks"] = builder.build(metadata)
+    return result
+
+
+class _DictBuilder:
+    """Builds the parse_strava_gpx "tracks" list."""
+
+    def __init__(self) -> None:
+        self.tracks: List[Dict[str, Any]] = []
+
+    def start_track(self) -> None:
+        self.tracks.append({"name": None, "type": None, "segments": []})
+
+    def set_track_field(self, key: str, value: Optional[str]) -> None:
+        self.tracks[-1][key] = value
+
+    def start_segment(self) -> None:
+        self.tracks[-1]["segments"].append({"points": []})
+
+    def add_point(self, point: Dict[str, Any]) -> None:
+        self.tracks[-1]["segments"][-1]["points"].append(point)
+
+    def build(self, metadata: Dict[str, Any]) -> List[Dict[str, Any]]:
+        for track_info in self.tracks:
+            track_info["points"] = [pt for segment in track_info["segments"] for pt in segment["points"]]
+        return self.tracks
+
+
+class _ColumnarBuilder:
+    """Builds a TrackArrays, keeping points in typed arrays (8 bytes per value) while parsing."""
+
+    def __init__(self) -> None:
+        self.lat = array('d')
+        self.lon = array('d')
+        self.time_ms = array('q')
+        self.elevation = array('d')
+        self.heart_rate = array('d')
+        self.cadence = array('d')
+        self.segment_starts: List[int] = []
+        self.segment_tracks: List[int] = []
+        self.tracks: List[Dict[str, Any]] = []
+
+    def start_track(self) -> None:
+        self.tracks.append({"name": None, "type": None})
+
+    def set_track_field(self, key: str, value: Optional[str]) -> None:
+        self.tracks[-1][key] = value
+
+    def start_segment(self) -> None:
+        self.segment_starts.append(len(self.lat))
+        self.segment_tracks.append(len(self.tracks) - 1)
+
+    def add_point(self, point: Dict[str, Any]) -> None:
+        self.lat.append(point["lat"])
+        self.lon.append(point["lon"])
+        self.time_ms.append(_time_to_epoch_ms(point.get("time")))
+        elevation = point.get("elevation")
+        self.elevation.append(math.nan if elevation is None else elevation)
+        extensions = point.get("extensions") or {}
+        self.heart_rate.append(extensions.get("hr", math.nan))
+        self.cadence.append(extensions.get("cad", math.nan))
+
+    def build(self, metadata: Dict[str, Any]) -> TrackArrays:
+        time = np.frombuffer(self.time_ms, dtype=np.int64).view("datetime64[ms]")
+        elevation = np.frombuffer(self.elevation, dtype=np.float64)
+        heart_rate = np.frombuffer(self.heart_rate, dtype=np.float64)
+        cadence = np.frombuffer(self.cadence, dtype=np.float64)
+        return TrackArrays(
+            lat=np.frombuffer(self.lat, dtype=np.float64),
+            lon=np.frombuffer(self.lon, dtype=np.float64),
+            time=time if (~np.isnat(time)).any() else None,
+            elevation=elevation if np.isfinite(elevation).any() else None,
+            heart_rate=heart_rate if np.isfinite(heart_rate).any() else None,
+            cadence=cadence if np.isfinite(cadence).any() else None,
+            segment_starts=np.asarray(self.segment_starts, dtype=np.int64),
+            segment_tracks=np.asarray(self.segment_tracks, dtype=np.int64),
+            tracks=self.tracks,
+            metadata=dict(metadata),
+        )
+
+
+class _GpxSummary:
+    """Running statistics over all track points."""
+
+    def __init__(self) -> None:
+        self.track_count = 0
+        self.segment_count = 0
+        self.point_count = 0
+        self.min_lat = self.min_lon = self.max_lat = self.max_lon = None
+        self.start_time: Optional[str] = None
+        self.end_time: Optional[str] = None
+        self.distance_m = 0.0
+        # Points of the current segment; its distance is summed in one array pass when it ends.
+        self._segment_lat = array("d")
+        self._segment_lon = array("d")
+
+    def start_segment(self) -> None:
+        self.segment_count += 1
+        # Distance is not counted across segment gaps.
+        self._end_segment()
+
+    def _end_segment(self) -> None:
+        if len(self._segment_lat) > 1:
+            self.distance_m += float(haversine_steps(self._segment_lat, self._segment_lon).sum())
+        self._segment_lat = array("d")
+        self._segment_lon = array("d")
+
+    def add_point(self, point: Dict[str, Any]) -> None:
+        lat = point["lat"]
+        lon = point["lon"]
+        if self.point_count == 0:
+            self.min_lat = self.max_lat = lat
+            self.min_lon = self.max_lon = lon
+        else:
+            self.min_lat = min(self.min_lat, lat)
+            self.max_lat = max(self.max_lat, lat)
+            self.min_lon = min(self.min_lon, lon)
+            self.max_lon = max(self.max_lon, lon)
+        self.point_count += 1
+
+        self._segment_lat.append(lat)
+        self._segment_lon.append(lon)
+
+        time_text = point.get("time")
+        if time_text is not None:
+            if self.start_time is None:
+                self.start_time = time_text
+            self.end_time = time_text
+
+    def as_dict(self) -> Dict[str, Any]:
+        self._end_segment()
+        bounds = None
+        if self.point_count:
+            bounds = {
+                "min_lat": self.min_lat,
+                "min_lon": self.min_lon,
+                "max_lat": self.max_lat,
+                "max_lon": self.max_lon,
+            }
+        return {
+            "track_count": self.track_count,
+            "segment_count": self.segment_count,
+            "point_count": self.point_count,
+            "bounds": bounds,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "distance_m": self.distance_m,
+        }
+
+
+def _time_to_epoch_ms(value: Optional[str]) -> int:
+    if not value:
+        return _NAT_MS
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        return _NAT_MS
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(round(dt.timestamp() * 1000))
 
 
 def _parse_track_point(trkpt: ET.Element) -> Dict[str, Any]:
@@ -60,27 +284,32 @@ def _parse_track_point(trkpt: ET.Element) -> Dict[str, Any]:
         "lon": lon,
     }
 
-    ele = _get_text(trkpt, 'gpx:ele')
+    # Direct child scan; Element.find with namespaces goes through ElementPath and
+    # dominates parse time on large tracks.
+    ele_node = _first_child(trkpt, _GPX + 'ele')
+    time_node = _first_child(trkpt, _GPX + 'time')
+    extensions_node = _first_child(trkpt, _GPX + 'extensions')
+
+    ele = _node_text(ele_node)
     if ele is not None:
         point["elevation"] = _maybe_float(ele)
 
-    time_text = _get_text(trkpt, 'gpx:time')
+    time_text = _node_text(time_node)
     if time_text is not None:
         point["time"] = time_text
 
-    extensions = _parse_track_point_extensions(trkpt)
+    extensions = _parse_track_point_extensions(extensions_node)
     if extensions:
         point["extensions"] = extensions
 
     return point
 
 
-def _parse_track_point_extensions(trkpt: ET.Element) -> Dict[str, Any]:
-    extensions_node = trkpt.find('gpx:extensions', GPX_NS)
+def _parse_track_point_extensions(extensions_node: Optional[ET.Element]) -> Dict[str, Any]:
     if extensions_node is None:
         return {}
 
-    tpx_node = extensions_node.find('gpxtpx:TrackPointExtension', GPX_NS)
+    tpx_node = _first_child(extensions_node, _GPXTPX + 'TrackPointExtension')
     if tpx_node is None:
         return {}
 
@@ -93,17 +322,23 @@ def _parse_track_point_extensions(trkpt: ET.Element) -> Dict[str, Any]:
     return {k: v for k, v in extension_values.items() if v is not None}
 
 
-def _strip_namespace(tag: str) -> str:
-    return tag.split('}', 1)[-1] if '}' in tag else tag
+def _first_child(node: ET.Element, tag: str) -> Optional[ET.Element]:
+    for child in node:
+        if child.tag == tag:
+            return child
+    return None
 
 
-def _get_text(node: ET.Element, path: str) -> Optional[str]:
-    found = node.find(path, GPX_NS)
-    if found is not None and found.text:
-        return found.text.strip()
+def _node_text(node: Optional[ET.Element]) -> Optional[str]:
+    if node is not None and node.text:
+        return node.text.strip()
     return None
 
 
+def _strip_namespace(tag: str) -> str:
+    return tag.split('}', 1)[-1] if '}' in tag else tag
+
+
 def _maybe_float(value: str) -> Optional[float]:
     try:
         return float(value)
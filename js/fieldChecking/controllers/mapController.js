@@ -5,6 +5,7 @@ import {
   ERROR_OVERLAY_URL,
   TILE_LAYER_CONFIG
 } from '../config.js';
+import { fetchTileMetadata } from '../services/mapDataService.js';
 
 export function createMapController({
   elementId = 'mapBrowser',
@@ -39,15 +40,20 @@ export function createMapController({
   }
 
   let currentOverlay = null;
+  // Bumped on every change of overlay, so a tile metadata response for an earlier selection is ignored.
+  let overlayRequestId = 0;
 
   function removeCurrentOverlay() {
+    overlayRequestId += 1;
     if (currentOverlay) {
       currentOverlay.remove();
       currentOverlay = null;
     }
   }
 
-  function addOverlay(definition) {
+  // Shows the map as tiles, so only the visible part is downloaded; falls back to the whole
+  // final image when the tile metadata cannot be loaded. Resolves with the added layer.
+  async function addOverlay(definition) {
     if (
       !definition?.map_name ||
       !Array.isArray(definition.nw_coords) ||
@@ -58,18 +64,50 @@ export function createMapController({
     }
 
     removeCurrentOverlay();
+    const requestId = overlayRequestId;
+
+    let layer = null;
+    if (definition.map_id != null) {
+      try {
+        const metadata = await fetchTileMetadata(definition.map_id);
+        if (requestId !== overlayRequestId) {
+          return null;
+        }
+        layer = createTileOverlay(metadata);
+      } catch (error) {
+        console.warn('Tiles unavailable, loading the whole map image instead:', error);
+      }
+    }
+    if (requestId !== overlayRequestId) {
+      return null;
+    }
+
+    currentOverlay = (layer || createImageOverlay(definition)).addTo(map);
+    return currentOverlay;
+  }
 
+  function createTileOverlay(metadata) {
+    return L.tileLayer(`${API_BASE}${metadata.url_template}`, {
+      bounds: [metadata.nw_coords, metadata.se_coords],
+      tileSize: metadata.tile_size,
+      minNativeZoom: metadata.min_zoom,
+      maxNativeZoom: metadata.max_native_zoom,
+      opacity: 1
+    });
+  }
+
+  function createImageOverlay(definition) {
     const overlayCoords = [definition.nw_coords, definition.se_coords];
-    const overlayFile = `${API_BASE}/api/dal/mapfile/final/${encodeURIComponent(definition.map_name)}`;
+    // With the image digest from list_maps the URL is content-addressed and cached for good.
+    const version = definition.final_sha256 ? `?v=${definition.final_sha256}` : '';
+    const overlayFile = `${API_BASE}/api/dal/mapfile/final/${encodeURIComponent(definition.map_name)}${version}`;
 
-    currentOverlay = L.imageOverlay(overlayFile, overlayCoords, {
+    return L.imageOverlay(overlayFile, overlayCoords, {
       opacity: 1,
       errorOverlayUrl: ERROR_OVERLAY_URL,
       alt: '',
       interactive: false
-    }).addTo(map);
-
-    return currentOverlay;
+    });
   }
 
   function setFixedZoom(isEnabled, zoomLevel) {
@@ -19,3 +19,20 @@ export async function fetchMapDefinitions(baseUrl = API_BASE) {
 
   return response.json();
 }
+
+// Bounds, zoom range and URL template of a map's tile pyramid (/api/tiles/<map_id>).
+export async function fetchTileMetadata(mapId, baseUrl = API_BASE) {
+  const requestUrl = `${baseUrl}/api/tiles/${encodeURIComponent(mapId)}`;
+
+  const response = await fetch(requestUrl, {
+    method: 'GET',
+    credentials: 'include'
+  });
+
+  if (!response.ok) {
+    redirectToLoginOnExpiredSession(response);
+    throw new Error(`Failed to fetch tile metadata: ${response.status} ${response.statusText}`);
+  }
+
+  return response.json();
+}
@@ -40,7 +40,8 @@ export async function fetchTrackDetail(baseUrl = API_BASE, username, trackId) {
     return trackDetailCache.get(cacheKey);
   }
 
-  const requestUrl = `${baseUrl}/api/gps-tracks/${encodeURIComponent(username)}/${trackId}`;
+  // Encoded polylines are several times smaller than one JSON object per point.
+  const requestUrl = `${baseUrl}/api/gps-tracks/${encodeURIComponent(username)}/${trackId}?format=polyline`;
 
   const requestPromise = (async () => {
     const response = await fetch(requestUrl, {
@@ -1,4 +1,9 @@
 export function getSegmentLatLngs(trackPayload) {
+  const format = trackPayload?.gpx?.format;
+  if (format === 'columnar' || format === 'polyline') {
+    return getCompactSegmentLatLngs(trackPayload.gpx);
+  }
+
   const tracks = trackPayload?.gpx?.tracks;
   if (!Array.isArray(tracks) || tracks.length === 0) {
     return { segments: [], metadata: [] };
@@ -54,3 +59,106 @@ function normalizeLatLng(point) {
   return [lat, lon];
 }
 
+
+// Compact formats from the backend (track_codec.track_arrays_to_compact_json):
+// per-point columns, delta-encoded, null where a point has no value.
+function getCompactSegmentLatLngs(gpx) {
+  const pointCount = Number(gpx.point_count) || 0;
+  const starts = Array.isArray(gpx.segment_starts) ? gpx.segment_starts : [0];
+  const times = decodeTimes(gpx, pointCount);
+
+  let lats;
+  let lons;
+  if (gpx.format === 'polyline') {
+    lats = new Array(pointCount);
+    lons = new Array(pointCount);
+    const polylines = Array.isArray(gpx.polylines) ? gpx.polylines : [];
+    polylines.forEach((encoded, segmentIndex) => {
+      decodePolyline(encoded, gpx.polyline_precision ?? 5).forEach(([lat, lon], i) => {
+        lats[starts[segmentIndex] + i] = lat;
+        lons[starts[segmentIndex] + i] = lon;
+      });
+    });
+  } else {
+    const scale = Number(gpx.coord_scale) || 1;
+    lats = undelta(gpx.lat, pointCount).map((value) => value / scale);
+    lons = undelta(gpx.lon, pointCount).map((value) => value / scale);
+  }
+
+  const segments = [];
+  const metadata = [];
+  starts.forEach((start, segmentIndex) => {
+    const end = segmentIndex + 1 < starts.length ? starts[segmentIndex + 1] : pointCount;
+    const latLngs = [];
+    const metaEntries = [];
+    for (let i = start; i < end; i += 1) {
+      const latLng = normalizeLatLng({ lat: lats[i], lon: lons[i] });
+      if (!latLng) {
+        continue;
+      }
+      latLngs.push(latLng);
+      metaEntries.push({ time: times[i] });
+    }
+    if (latLngs.length > 0) {
+      segments.push(latLngs);
+      metadata.push(metaEntries);
+    }
+  });
+
+  return { segments, metadata };
+}
+
+function decodeTimes(gpx, pointCount) {
+  if (!Array.isArray(gpx.time) || gpx.time_origin_ms == null) {
+    return new Array(pointCount).fill(null);
+  }
+  return undelta(gpx.time, pointCount).map((offset) =>
+    offset === null ? null : new Date(gpx.time_origin_ms + offset).toISOString()
+  );
+}
+
+function undelta(deltas, pointCount) {
+  const values = new Array(pointCount).fill(null);
+  if (!Array.isArray(deltas)) {
+    return values;
+  }
+  let current = 0;
+  deltas.forEach((delta, i) => {
+    if (delta === null) {
+      return;
+    }
+    current += delta;
+    values[i] = current;
+  });
+  return values;
+}
+
+function decodePolyline(encoded, precision) {
+  const factor = 10 ** precision;
+  const points = [];
+  let index = 0;
+  let lat = 0;
+  let lon = 0;
+
+  while (index < encoded.length) {
+    const latDelta = readPolylineValue();
+    const lonDelta = readPolylineValue();
+    lat += latDelta;
+    lon += lonDelta;
+    points.push([lat / factor, lon / factor]);
+  }
+  return points;
+
+  function readPolylineValue() {
+    let result = 0;
+    let shift = 0;
+    let byte;
+    do {
+      byte = encoded.charCodeAt(index) - 63;
+      index += 1;
+      result += (byte & 0x1f) * 2 ** shift;
+      shift += 5;
+    } while (byte >= 0x20);
+    return result % 2 === 1 ? -(result + 1) / 2 : result / 2;
+  }
+}
@@ -1,8 +1,10 @@
 import {
   exportDatabase,
+  fetchFinalMapFile,
   getOverlayCoordinates,
   transformAndStoreMapData, // TODO: Rename to saveRegistration, can optionally drop re-submitting map to server
-  transformMap // TODO: Rename to computeRegistration
+  transformMap, // TODO: Rename to computeRegistration
+  waitForJob
 } from '../services/apiClient.js';
 
 const roundLatLon = (value) => parseFloat(value.toFixed(6));
@@ -174,7 +176,11 @@ export function initRegisterActions({
       registrationStore.setRegistrationData(enrichedData);
 
       const formData = buildFormData(registrationStore.getDroppedImage(), enrichedData);
-      const blob = await transformAndStoreMapData(formData); // TODO: Rename to "registerAndStoreMap" or something
+      const { job_id: jobId } = await transformAndStoreMapData(formData); // TODO: Rename to "registerAndStoreMap" or something
+      const result = await waitForJob(jobId, (job) => {
+        setStatusBarMessage(`${STATUS_MESSAGES.saving} (${Math.round((job.progress || 0) * 100)}%)`);
+      });
+      const blob = await fetchFinalMapFile(result.map_name);
       handleTransformResult(blob);
       showLatestPreview();
     } catch (error) {
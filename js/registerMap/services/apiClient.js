@@ -58,12 +58,64 @@ async function postForm(path, formData) {
   return response.blob();
 }
 
+async function postFormJson(path, formData) {
+  const response = await fetch(`${API_BASE}${path}`, {
+    method: 'POST',
+    credentials: 'include',
+    body: formData
+  });
+
+  if (!response.ok) {
+    redirectToLoginOnExpiredSession(response);
+    throw new Error(`Request to ${path} failed with status ${response.status}`);
+  }
+
+  return response.json();
+}
+
+const JOB_POLL_INTERVAL_MS = 500;
+// Give up when a job has not changed for this long. The server requeues a running job after
+// 15 minutes without progress, so a job that is still stuck after this is not coming back.
+const JOB_STALL_TIMEOUT_MS = 20 * 60 * 1000;
+
+export function getJob(jobId) {
+  return getJson(`/api/jobs/${encodeURIComponent(jobId)}`);
+}
+
+// Polls a background job until it finishes. Resolves with the job result, rejects if the job failed
+// or made no progress for JOB_STALL_TIMEOUT_MS.
+export async function waitForJob(jobId, onProgress) {
+  let lastState = null;
+  let lastChangeAt = Date.now();
+  for (;;) {
+    const job = await getJob(jobId);
+    if (job.status === 'succeeded') {
+      return job.result;
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || `Job ${jobId} failed`);
+    }
+    const state = `${job.status}|${job.progress}|${job.updated_at}`;
+    if (state !== lastState) {
+      lastState = state;
+      lastChangeAt = Date.now();
+    } else if (Date.now() - lastChangeAt > JOB_STALL_TIMEOUT_MS) {
+      throw new Error(`Job ${jobId} made no progress for ${JOB_STALL_TIMEOUT_MS / 60000} minutes`);
+    }
+    if (typeof onProgress === 'function') {
+      onProgress(job);
+    }
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+  }
+}
+
 export function getOverlayCoordinates(payload) {
   return postJson('/api/getOverlayCoordinates', payload);
 }
 
+// Queues the map for storage; resolves with { job_id, status_url }.
 export function transformAndStoreMapData(formData) {
-  return postForm('/api/transformAndStoreMapData', formData);
+  return postFormJson('/api/transformAndStoreMapData', formData);
 }
 
 export function transformMap(formData) {
@@ -434,8 +434,10 @@ document.addEventListener('DOMContentLoaded', async () => {
       els.syncBtn.disabled = true;
 
       const { fromUtcMs, toExclusiveUtcMs } = getSelectedDateRange();
-      const after = fromUtcMs != null ? Math.floor(fromUtcMs / 1000) : null;
+      let after = fromUtcMs != null ? Math.floor(fromUtcMs / 1000) : null;
       const before = toExclusiveUtcMs != null ? Math.floor(toExclusiveUtcMs / 1000) : null;
+      // Without a date range, only fetch activities newer than the last sync.
+      const incremental = after == null && before == null;
 
       // Page-by-page sync so we can display progress.
       let page = 1;
@@ -449,7 +451,9 @@ document.addEventListener('DOMContentLoaded', async () => {
           setProgress(`Lastet ned ${totalSynced} aktiviteter fra Strava...`);
         }
         
-        const res = await syncActivitiesPage({ after, before, page, perPage });
+        const res = await syncActivitiesPage({ after, before, page, perPage, incremental: incremental && page === 1 });
+        // Keep walking from the same starting point; the watermark moves as pages are stored.
+        if (page === 1 && incremental) after = res?.after ?? null;
         const received = Number(res?.received_count ?? -1);
         const synced = Number(res?.synced_count ?? -1);
         if (Number.isFinite(synced)) totalSynced += synced;
@@ -61,8 +61,11 @@ export async function syncActivities({ after = null, before = null } = {}) {
   return requestJson('/api/strava/sync_activities', { method: 'POST', body });
 }
 
-export async function syncActivitiesPage({ after = null, before = null, page = 1, perPage = 200 } = {}) {
+export async function syncActivitiesPage({ after = null, before = null, page = 1, perPage = 200, incremental = false } = {}) {
   const body = { page, per_page: perPage };
+  if (incremental) {
+    body.incremental = true;
+  }
   if (typeof after === 'number' && Number.isFinite(after)) {
     body.after = after;
   }
@@ -0,0 +1,56 @@
+"""
+Compute the statistics and levels of detail of tracks stored before they were computed at
+ingest (CLI tool).
+
+Track listings only read stored statistics and levels, and show null for tracks without them,
+so run this once after upgrading. Each track is parsed outside any write lock and stored in its
+own short transaction, so it can run while the server is up, and an interrupted run can be re-run.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+
+def _add_backend_to_syspath(repo_root: Path) -> None:
+    # `backend/` is not a package; add it to sys.path.
+    backend_dir = repo_root / "backend"
+    sys.path.insert(0, str(backend_dir))
+
+
+def main() -> int:
+    repo_root = Path(__file__).resolve().parents[1]
+    parser = argparse.ArgumentParser(
+        description="Compute statistics and levels of detail of tracks stored before they existed."
+    )
+    parser.add_argument(
+        "--db",
+        default=str(repo_root / "data" / "database.db"),
+        help="Path to SQLite database file (default: data/database.db)",
+    )
+    args = parser.parse_args()
+
+    db_path = Path(args.db).expanduser()
+    if not db_path.exists():
+        print(f"ERROR: DB file not found: {db_path}", file=sys.stderr)
+        return 2
+
+    _add_backend_to_syspath(repo_root)
+    from Database import Database
+    from bergenomap.services import track_service
+
+    db = Database(db_name=str(db_path))
+    try:
+        count = track_service.backfill_track_stats(db)
+        print(f"Computed statistics of {count} track(s).")
+        count = track_service.backfill_track_lods(db)
+        print(f"Built levels of detail of {count} track(s).")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,121 @@
+"""
+Micro-benchmark of the array-native geo helpers (bergenomap.utils.geo, OptimizeRotation)
+against the per-point Python loops they replaced.
+
+Run from the repo root:  python scripts/bench_geo.py [--points 100000] [--control-points 50]
+"""
+
+from __future__ import annotations
+
+import argparse
+import math
+import sys
+import timeit
+from pathlib import Path
+
+
+def _add_backend_to_syspath(repo_root: Path) -> None:
+    # `backend/` is not a package; add it to sys.path.
+    sys.path.insert(0, str(repo_root / "backend"))
+
+
+# Per-point reference implementations, as they were before vectorizing.
+
+def _haversine_loop(lats, lons):
+    total = 0.0
+    for lat1, lon1, lat2, lon2 in zip(lats[:-1], lons[:-1], lats[1:], lons[1:]):
+        phi1, phi2 = math.radians(lat1), math.radians(lat2)
+        dphi = math.radians(lat2 - lat1)
+        dlambda = math.radians(lon2 - lon1)
+        a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+        total += 2 * 6371000 * math.asin(math.sqrt(a))
+    return total
+
+
+def _meters_per_pixel_loop(pixel_pts, geo_pts):
+    lat0, lon0 = geo_pts[0]
+    xy = [
+        (6371000 * math.radians(lon - lon0) * math.cos(math.radians(lat0)), 6371000 * math.radians(lat - lat0))
+        for lat, lon in geo_pts
+    ]
+    ratios_x, ratios_y = [], []
+    for i in range(len(pixel_pts)):
+        for j in range(i + 1, len(pixel_pts)):
+            dx_px = pixel_pts[j][0] - pixel_pts[i][0]
+            dy_px = pixel_pts[j][1] - pixel_pts[i][1]
+            if dx_px != 0:
+                ratios_x.append((xy[j][0] - xy[i][0]) / dx_px)
+            if dy_px != 0:
+                ratios_y.append((xy[j][1] - xy[i][1]) / dy_px)
+    return abs(sum(ratios_x) / len(ratios_x)), abs(sum(ratios_y) / len(ratios_y))
+
+
+def _rotate_points_loop(np, points, width, height, angle_degrees):
+    angle_radians = np.radians(-angle_degrees)
+    cx, cy = width / 2, height / 2
+    rotation_matrix = np.array([
+        [np.cos(angle_radians), -np.sin(angle_radians)],
+        [np.sin(angle_radians), np.cos(angle_radians)],
+    ])
+    rotated = []
+    for x, y in points:
+        rx, ry = rotation_matrix.dot([x - cx, y - cy])
+        rotated.append((rx + cx, ry + cy))
+    return rotated
+
+
+def _report(name: str, loop_s: float, array_s: float) -> None:
+    print(f"{name:<28} loop {loop_s * 1000:10.3f} ms   array {array_s * 1000:10.3f} ms   x{loop_s / array_s:8.1f}")
+
+
+def _best_of(fn, repeat: int) -> float:
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark vectorized geo helpers against per-point loops.")
+    parser.add_argument("--points", type=int, default=100_000, help="Track points for the distance benchmark.")
+    parser.add_argument("--control-points", type=int, default=50, help="Control points for the pairwise benchmarks.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement; the best is reported.")
+    args = parser.parse_args()
+
+    repo_root = Path(__file__).resolve().parents[1]
+    _add_backend_to_syspath(repo_root)
+    import numpy as np
+
+    from OptimizeRotation import rotate_points_array
+    from bergenomap.utils.geo import haversine_steps, meters_per_pixel_xy
+
+    rng = np.random.default_rng(0)
+    lats = 60.39 + np.cumsum(rng.normal(0, 1e-4, args.points))
+    lons = 5.32 + np.cumsum(rng.normal(0, 1e-4, args.points))
+    lat_list, lon_list = lats.tolist(), lons.tolist()
+
+    n = args.control_points
+    pixel_pts = [(float(x), float(y)) for x, y in rng.uniform(0, 4000, (n, 2))]
+    geo_pts = [(float(lat), float(lon)) for lat, lon in zip(60.39 + rng.uniform(0, 0.05, n), 5.32 + rng.uniform(0, 0.1, n))]
+
+    assert math.isclose(_haversine_loop(lat_list, lon_list), float(haversine_steps(lats, lons).sum()), rel_tol=1e-9)
+    assert np.allclose(_meters_per_pixel_loop(pixel_pts, geo_pts), meters_per_pixel_xy(pixel_pts, geo_pts))
+    assert np.allclose(_rotate_points_loop(np, pixel_pts, 4000, 3000, 7.5), rotate_points_array(pixel_pts, 4000, 3000, 7.5))
+
+    _report(
+        f"track distance ({args.points} pts)",
+        _best_of(lambda: _haversine_loop(lat_list, lon_list), args.repeat),
+        _best_of(lambda: haversine_steps(lats, lons).sum(), args.repeat),
+    )
+    _report(
+        f"meters_per_pixel_xy ({n} pts)",
+        _best_of(lambda: _meters_per_pixel_loop(pixel_pts, geo_pts), args.repeat),
+        _best_of(lambda: meters_per_pixel_xy(pixel_pts, geo_pts), args.repeat),
+    )
+    _report(
+        f"rotate_points ({n} pts)",
+        _best_of(lambda: _rotate_points_loop(np, pixel_pts, 4000, 3000, 7.5), args.repeat),
+        _best_of(lambda: rotate_points_array(pixel_pts, 4000, 3000, 7.5), args.repeat),
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,89 @@
+"""
+Bulk import GPX files from a zip or tar archive into a user's tracks (CLI tool).
+
+Same import as POST /api/gps-tracks/archive (bergenomap/services/track_ingest_service.py),
+without going through the web server. Files already stored for the user are skipped, so an
+interrupted import can be re-run.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def _add_backend_to_syspath(repo_root: Path) -> None:
+    # `backend/` is not a package; add it to sys.path.
+    backend_dir = repo_root / "backend"
+    sys.path.insert(0, str(backend_dir))
+
+
+def _parse_args(repo_root: Path) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Import a zip or tar archive of GPX files as tracks of a user.")
+    parser.add_argument("archive", help="Path to a .zip, .tar, .tar.gz, ... archive of GPX files.")
+    parser.add_argument("--username", required=True, help="Owner of the imported tracks (must exist).")
+    parser.add_argument(
+        "--db",
+        default=str(repo_root / "data" / "database.db"),
+        help="Path to SQLite database file (default: data/database.db)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Parser processes (default: settings.track_ingest_workers; 0 parses in this process).",
+    )
+    parser.add_argument("--json", action="store_true", help="Print the full per-file report as JSON.")
+    return parser.parse_args()
+
+
+def main() -> int:
+    repo_root = Path(__file__).resolve().parents[1]
+    args = _parse_args(repo_root)
+
+    db_path = Path(args.db).expanduser()
+    if not db_path.exists():
+        print(f"ERROR: DB file not found: {db_path}", file=sys.stderr)
+        return 2
+    archive_path = Path(args.archive).expanduser()
+    if not archive_path.is_file():
+        print(f"ERROR: archive not found: {archive_path}", file=sys.stderr)
+        return 2
+
+    _add_backend_to_syspath(repo_root)
+
+    from Database import Database
+    from bergenomap.services import track_ingest_service
+
+    def progress(fraction: float, message: str) -> None:
+        if not args.json:
+            print(f"[{fraction:6.1%}] {message}")
+
+    db = Database(db_name=str(db_path))
+    try:
+        with archive_path.open("rb") as archive:
+            result = track_ingest_service.ingest_gpx_archive(
+                db, args.username, archive, workers=args.workers, progress=progress
+            )
+    except ValueError as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        for entry in result["files"]:
+            if entry["status"] == track_ingest_service.FILE_FAILED:
+                print(f"- {entry['name']}: failed: {entry['error']}")
+            elif entry["status"] == track_ingest_service.FILE_DUPLICATE:
+                print(f"- {entry['name']}: already stored as track {entry['track_id']}")
+        print(f"Stored {result['stored']}, skipped {result['duplicates']} duplicate(s), {result['failed']} failed.")
+    return 1 if result["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,69 @@
+"""
+Move map images still stored as BLOBs in map_files into the blob store (CLI tool).
+
+Images are otherwise moved one by one when first read (see migration 023). Run with --vacuum
+to give the freed space back to the filesystem afterwards, and with --gc to delete blobs no map
+refers to any more (replaced or deleted images).
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+
+def _add_backend_to_syspath(repo_root: Path) -> None:
+    # `backend/` is not a package; add it to sys.path.
+    backend_dir = repo_root / "backend"
+    sys.path.insert(0, str(backend_dir))
+
+
+def main() -> int:
+    repo_root = Path(__file__).resolve().parents[1]
+    parser = argparse.ArgumentParser(description="Move map image BLOBs from the database into the blob store.")
+    parser.add_argument(
+        "--db",
+        default=str(repo_root / "data" / "database.db"),
+        help="Path to SQLite database file (default: data/database.db)",
+    )
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM the database afterwards.")
+    parser.add_argument("--gc", action="store_true", help="Delete blobs that no map refers to.")
+    parser.add_argument(
+        "--gc-min-age-s",
+        type=float,
+        default=None,
+        help="Keep unreferenced blobs modified more recently than this, as they may belong to a map "
+        "being stored right now (default: settings.blob_gc_min_age_s)",
+    )
+    args = parser.parse_args()
+
+    db_path = Path(args.db).expanduser()
+    if not db_path.exists():
+        print(f"ERROR: DB file not found: {db_path}", file=sys.stderr)
+        return 2
+
+    _add_backend_to_syspath(repo_root)
+    from Database import Database
+    from bergenomap.config import settings
+    from bergenomap.repositories import blob_store, map_files_repo
+
+    db = Database(db_name=str(db_path))
+    try:
+        moved = map_files_repo.move_all_to_blob_store(db)
+        print(f"Moved {moved} image(s) to the blob store.")
+        if args.gc:
+            referenced = map_files_repo.list_referenced_digests(db)
+            min_age_s = args.gc_min_age_s if args.gc_min_age_s is not None else settings.blob_gc_min_age_s
+            deleted = blob_store.delete_unreferenced_blobs(referenced, min_age_s=min_age_s)
+            print(f"Deleted {deleted} unreferenced blob file(s).")
+        if args.vacuum:
+            db.cursor.execute("VACUUM")
+            print("Vacuumed database.")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
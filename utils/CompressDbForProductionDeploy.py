@@ -1,34 +1,36 @@
 """
 Compress the map database for production deployment.
 
-Deletes all original map images from the database, saving ~50% disk space.
+Deletes all original map images, saving ~50% disk space.
 
 Lossless compression further reduces file size by approximately 30%.
 Lossy compression further reduces file size by approximately 90%
 
 The difference in file size between fast and slow compression is approximately 2x.
+
+Map images live in the blob store (data/blobs, see backend/bergenomap/repositories/blob_store.py);
+images still held in the legacy map_files BLOB columns are moved there first. Compressed images
+are stored as new blobs, and the blobs they replace are deleted afterwards (once older than
+--gc-min-age-s, like scripts/move_map_files_to_blob_store.py --gc). Maps stored since
+encoding moved into ingest (settings.map_final_encoding, WebP by default) are already compressed;
+images that are already WebP or AVIF are left as they are, so they are not encoded lossily twice.
 """
 
 import argparse
 import os
-import sqlite3
+import sys
 from concurrent.futures import ProcessPoolExecutor, as_completed
 from io import BytesIO
 from pathlib import Path
 
 from PIL import Image
 
-DB_PATH = Path(__file__).parent.parent / "data" / "database.db"
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DB_PATH = REPO_ROOT / "data" / "database.db"
 DEFAULT_QUALITY = 90
 DEFAULT_METHOD = 0
-
-SQL_DELETE_ORIGINALS = """
-BEGIN TRANSACTION;
-UPDATE map_files
-SET mapfile_original = NULL
-WHERE mapfile_original IS NOT NULL;
-COMMIT;
-"""
+# Formats ingest already encodes to (settings.map_final_encoding); not re-encoded.
+ALREADY_COMPRESSED_MIMETYPES = {"image/webp", "image/avif"}
 
 
 def convert_blob_to_webp(
@@ -59,26 +61,26 @@ def convert_blob_to_webp(
 
 def _compress_task(args: tuple) -> tuple:
     """
-    Worker function for parallel compression.
+    Worker function for parallel compression. Reads the images from their blob files.
     Returns (map_id, map_name, compressed_final, compressed_original, error_msg).
     """
-    map_id, map_name, final_blob, original_blob, quality, method, lossless, keep_originals = args
+    map_id, map_name, final_path, original_path, quality, method, lossless, keep_originals = args
     compressed_final = None
     compressed_original = None
     errors = []
 
-    if final_blob:
+    if final_path:
         try:
             compressed_final = convert_blob_to_webp(
-                final_blob, quality=quality, method=method, lossless=lossless
+                Path(final_path).read_bytes(), quality=quality, method=method, lossless=lossless
             )
         except Exception as exc:
             errors.append(f"map_id {map_id} final: {exc}")
 
-    if keep_originals and original_blob:
+    if keep_originals and original_path:
         try:
             compressed_original = convert_blob_to_webp(
-                original_blob, quality=quality, method=method, lossless=lossless
+                Path(original_path).read_bytes(), quality=quality, method=method, lossless=lossless
             )
         except Exception as exc:
             errors.append(f"map_id {map_id} original: {exc}")
@@ -86,61 +88,85 @@ def _compress_task(args: tuple) -> tuple:
     return (map_id, map_name, compressed_final, compressed_original, errors)
 
 
-def compress_database(*, quality: int, method: int, lossless: bool, keep_originals: bool, workers: int):
-    with sqlite3.connect(DB_PATH) as conn:
+def compress_database(
+    *,
+    quality: int,
+    method: int,
+    lossless: bool,
+    keep_originals: bool,
+    workers: int,
+    gc_min_age_s: float | None = None,
+):
+    # `backend/` is not a package; add it to sys.path.
+    sys.path.insert(0, str(REPO_ROOT / "backend"))
+    from Database import Database
+    from bergenomap.config import settings
+    from bergenomap.repositories import blob_store, map_files_repo
+    from bergenomap.services.image_service import image_mimetype
+
+    def path_to_compress(digest):
+        if not digest:
+            return None
+        path = blob_store.blob_path(digest)
+        with open(path, "rb") as f:
+            if image_mimetype(f.read(16)) in ALREADY_COMPRESSED_MIMETYPES:
+                return None
+        return path
+
+    db = Database(db_name=str(DB_PATH))
+    try:
+        moved = map_files_repo.move_all_to_blob_store(db)
+        if moved:
+            print(f"Moved {moved} legacy image(s) to the blob store.")
         if not keep_originals:
-            conn.executescript(SQL_DELETE_ORIGINALS)
+            map_files_repo.delete_all_originals(db)
 
-        rows = conn.execute(
-            "SELECT m.map_id, m.map_name, mf.mapfile_final, mf.mapfile_original "
+        db.cursor.execute(
+            "SELECT m.map_id, m.map_name, mf.final_sha256, mf.original_sha256 "
             "FROM map_files mf "
             "JOIN maps m ON m.map_id = mf.map_id "
-            "WHERE mf.mapfile_final IS NOT NULL OR mf.mapfile_original IS NOT NULL"
-        ).fetchall()
+            "WHERE mf.final_sha256 IS NOT NULL OR mf.original_sha256 IS NOT NULL"
+        )
+        rows = db.cursor.fetchall()
 
-    # Prepare tasks with all needed parameters
-    tasks = [
-        (map_id, map_name, final_blob, original_blob, quality, method, lossless, keep_originals)
-        for map_id, map_name, final_blob, original_blob in rows
-    ]
+        # Prepare tasks with all needed parameters
+        tasks = []
+        for map_id, map_name, final_digest, original_digest in rows:
+            final_path = path_to_compress(final_digest)
+            original_path = path_to_compress(original_digest) if keep_originals else None
+            if final_path or original_path:
+                tasks.append(
+                    (map_id, map_name, final_path, original_path, quality, method, lossless, keep_originals)
+                )
 
-    print(f"Compressing {len(tasks)} maps using {workers} workers...")
+        print(f"Compressing {len(tasks)} maps using {workers} workers...")
 
-    converted_count = 0
-    with ProcessPoolExecutor(max_workers=workers) as executor:
-        futures = {executor.submit(_compress_task, task): task for task in tasks}
+        converted_count = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_compress_task, task): task for task in tasks}
 
-        with sqlite3.connect(DB_PATH) as conn:
             for future in as_completed(futures):
                 map_id, map_name, compressed_final, compressed_original, errors = future.result()
 
                 for err in errors:
                     print(f"Skipping {err}")
 
+                if compressed_final:
+                    map_files_repo.insert_final(db, map_id, compressed_final)
+                if compressed_original:
+                    map_files_repo.insert_original(db, map_id, compressed_original)
                 if compressed_final or compressed_original:
-                    if compressed_final and compressed_original:
-                        conn.execute(
-                            "UPDATE map_files SET mapfile_final = ?, mapfile_original = ? WHERE map_id = ?",
-                            (compressed_final, compressed_original, map_id),
-                        )
-                    elif compressed_final:
-                        conn.execute(
-                            "UPDATE map_files SET mapfile_final = ? WHERE map_id = ?",
-                            (compressed_final, map_id),
-                        )
-                    elif compressed_original:
-                        conn.execute(
-                            "UPDATE map_files SET mapfile_original = ? WHERE map_id = ?",
-                            (compressed_original, map_id),
-                        )
                     converted_count += 1
                     print(f"Converted #{converted_count}: {map_name}")
 
-            conn.commit()
+        # A running server may have stored blobs whose rows are not committed yet; keep recent ones.
+        min_age_s = gc_min_age_s if gc_min_age_s is not None else settings.blob_gc_min_age_s
+        deleted = blob_store.delete_unreferenced_blobs(map_files_repo.list_referenced_digests(db), min_age_s=min_age_s)
+        print(f"Deleted {deleted} unreferenced blob file(s).")
 
-    # VACUUM must be executed outside the transaction above
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("VACUUM;")
+        db.cursor.execute("VACUUM")
+    finally:
+        db.close()
 
 
 def prompt_confirmation(keep_originals: bool) -> bool:
@@ -148,11 +174,11 @@ def prompt_confirmation(keep_originals: bool) -> bool:
     if keep_originals:
          warning = (
             "WARNING: this will convert every map image (original and final) in database.db "
-            "to WEBP. Type 'y' to continue: "
+            "and data/blobs to WEBP. Type 'y' to continue: "
         )
     else:
         warning = (
-            "WARNING: this will delete all original map blobs from database.db "
+            "WARNING: this will delete all original map images from database.db and data/blobs "
             "and convert every final map image to WEBP. Type 'y' to continue: "
         )
     response = input(warning)
@@ -202,6 +228,12 @@ def parse_cli_args():
         action="store_true",
         help="Compress original maps instead of deleting them.",
     )
+    parser.add_argument(
+        "--gc-min-age-s",
+        type=float,
+        default=None,
+        help="Keep unreferenced blobs modified more recently than this (default: settings.blob_gc_min_age_s).",
+    )
     parser.add_argument(
         "--workers",
         type=int,
@@ -228,4 +260,5 @@ if __name__ == "__main__":
             lossless=args.lossless,
             keep_originals=args.keep_originals,
             workers=workers,
+            gc_min_age_s=args.gc_min_age_s,
         )